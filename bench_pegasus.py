@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Benchmark
+----------
+Load test of the board API, for capacity planning and for catching performance regressions between commits.
+
+It seeds a database with users, boards, invites and board content, then has a number of clients (threads) log in and run a mix of
+what people do on a board: poll it (``get_components``), chat (``post_components``), drag text around (``edit_component``) and log in again.
+Every request is timed, and the results (latency percentiles, throughput and, in process, SQLite queries per request) are printed
+and can be saved as JSON to compare with a later run.
+
+Two modes:
+    - In process (default): a fresh temporary database and Flask's test client, no server needed. Queries are counted with a trace callback on every connection.
+    - ``--url http://host:port``: against a running server, seeded through the API (so keep ``--rows`` small). Queries can't be counted from here.
+
+Examples::
+
+    $ ./bench_pegasus.py --users 50 --boards 20 --rows 2000 --requests 5000 --concurrency 8 --output before.json
+    $ ./bench_pegasus.py --users 50 --boards 20 --rows 2000 --requests 5000 --concurrency 8 --compare before.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, Request
+
+OPERATIONS = ('poll', 'chat', 'drag', 'login')
+DEFAULT_MIX = 'poll=70,chat=15,drag=10,login=5'
+PASSWORD = 'benchmark'
+_token = re.compile(r'''name=["']_csrf_token["'][^>]*?value=["']([^"']+)''')
+
+
+class QueryCounter(object):
+    """Counts the SQLite statements run by each thread, as a trace callback of the connections (``sqlite3.Connection.set_trace_callback()``)."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def traced(self, statement):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def take(self):
+        """The number of statements this thread ran since the last call."""
+        count = getattr(self._local, 'count', 0)
+        self._local.count = 0
+        return count
+
+
+class Client(object):
+    """One user of the board API, with their own session. Subclasses do the actual requests (``_request()``).
+    Keeps the CSRF token of the session: every POST uses up the token, and responses to AJAX POSTs carry the next one.
+    """
+
+    def __init__(self):
+        self.token = None
+        self.logged_in = False
+
+    def get(self, path, params=None):
+        """GET `path` with query `params`. Returns the status code and the body."""
+        return self._request('GET', path + ('?' + urlencode(params) if params else ''))
+
+    def post(self, path, data):
+        """POST the form `data` to `path` with the session's CSRF token. Returns the status code and the body."""
+        if self.token is None:
+            self.fetch_token()
+        data = dict(data, _csrf_token=self.token)
+        self.token = None
+        status, body = self._request('POST', path, data)
+        if status == 200 and body[:1] == b'{':
+            self.token = json.loads(body.decode('utf-8')).get('token')
+        return status, body
+
+    def fetch_token(self):
+        """Get a CSRF token from a page with a form."""
+        status, body = self.get('/new-board' if self.logged_in else '/login')
+        match = _token.search(body.decode('utf-8'))
+        self.token = match.group(1) if match else ''
+
+    def login(self, username):
+        """Log in (after logging out, if needed). Returns the status code and the body."""
+        if self.logged_in:
+            self.get('/logout')
+            self.logged_in = False
+            self.token = None
+        status, body = self.post('/login', dict(username=username, password=PASSWORD))
+        self.logged_in = b'Invalid' not in body
+        return status, body
+
+
+class AppClient(Client):
+    """A client calling the app in this process, through Flask's test client."""
+
+    def __init__(self, app):
+        Client.__init__(self)
+        self._client = app.test_client()
+
+    def _request(self, method, path, data=None):
+        if method == 'GET':
+            rv = self._client.get(path, follow_redirects=True)
+        else:
+            rv = self._client.post(path, data=data, follow_redirects=True)
+        return rv.status_code, rv.data
+
+
+class HTTPClient(Client):
+    """A client calling a running server at `url`."""
+
+    def __init__(self, url):
+        Client.__init__(self)
+        self.url = url.rstrip('/')
+        self.last_url = None
+        self._opener = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    def _request(self, method, path, data=None):
+        body = urlencode(data).encode('utf-8') if data is not None else None
+        try:
+            with self._opener.open(Request(self.url + path, data=body, method=method), timeout=60) as response:
+                self.last_url = response.geturl()
+                return response.status, response.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+
+def seed_database(db, users, boards, invites, rows, rng):
+    """Fill an empty (just initialized) database directly: `users` users, `boards` boards (each created by one of them, with `invites`
+    other users invited to edit) and `rows` components per board (mostly chat, some text on the canvas).
+    Returns what the clients need: the usernames, and for every username the boards they can edit, and for every board its text components.
+    """
+    from werkzeug.security import generate_password_hash
+    import pegasus
+    pwhash = generate_password_hash(PASSWORD, pegasus.app.config['PASSWORD_HASH_METHOD']) # the same for everyone, hashing is slow
+    usernames = ['user%d' % i for i in range(1, users + 1)]
+    db.executemany('insert into users (username, password, email, name) values (?, ?, ?, ?)', [(u, pwhash, u + '@bench.test', u) for u in usernames])
+    doneAt = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    access = dict((u, []) for u in usernames)
+    texts = {}
+    for bid in range(1, boards + 1):
+        creator = rng.randrange(users) + 1
+        db.execute('insert into boards (id, title, creatorID, done_at, revision) values (?, ?, ?, ?, ?)', [bid, 'Board %d' % bid, creator, doneAt, rows])
+        access[usernames[creator - 1]].append(bid)
+        for uid in rng.sample([u for u in range(1, users + 1) if u != creator], min(invites, users - 1)):
+            db.execute('insert into invites (id, boardID, userEmail, type) values (?, ?, ?, ?)', [uuid.uuid4().hex, bid, usernames[uid - 1] + '@bench.test', 'edit'])
+            access[usernames[uid - 1]].append(bid)
+        content = []
+        for revision in range(1, rows + 1):
+            uid = rng.randrange(users) + 1
+            if rng.random() < 0.2:
+                content.append((bid, 'Note %d' % revision, 'text', uid, json.dumps({'top': rng.randrange(500), 'left': rng.randrange(800)}), revision))
+            else:
+                content.append((bid, 'Message %d' % revision, 'chat', uid, 'None', revision))
+        db.executemany("insert into board_content (boardID, content, type, userID, position, revision, last_modified_at) values (?, ?, ?, ?, ?, ?, datetime('now'))", content)
+        texts[bid] = [row[0] for row in db.execute('select id from board_content where boardID=? and type=?', [bid, 'text'])]
+    db.commit()
+    db.execute('analyze')
+    return dict(usernames=usernames, access=access, texts=texts)
+
+def seed_server(url, users, boards, invites, rows, rng):
+    """Like ``seed_database()``, through the API of a running server (registering users, creating boards and posting to them).
+    Usernames get a random prefix so this can be run again on the same server.
+    """
+    prefix = 'b%s' % uuid.uuid4().hex[:6]
+    usernames = ['%s%d' % (prefix, i) for i in range(1, users + 1)]
+    access = dict((u, []) for u in usernames)
+    texts = {}
+    clients = {}
+    for u in usernames:
+        client = clients[u] = HTTPClient(url)
+        client.post('/register', dict(name=u, username=u, email=u + '@bench.test', password=PASSWORD))
+        client.logged_in = True
+    for n in range(boards):
+        creator = rng.choice(usernames)
+        client = clients[creator]
+        client.post('/new-board', dict(title='Board %d' % (n + 1)))
+        bid = int(client.last_url.rstrip('/').rsplit('/', 1)[1])
+        access[creator].append(bid)
+        for u in rng.sample([u for u in usernames if u != creator], min(invites, users - 1)):
+            client.post('/api/invite/user/%s@bench.test/board/%d' % (u, bid), dict(type='edit'))
+            access[u].append(bid)
+        texts[bid] = []
+        for i in range(rows):
+            if rng.random() < 0.2:
+                status, body = client.post('/api/board/%d/components/post' % bid, {'message': 'Note %d' % i, 'content-type': 'text', 'invite': '-1',
+                                                                                  'position': json.dumps({'top': rng.randrange(500), 'left': rng.randrange(800)})})
+                componentID = json.loads(body.decode('utf-8')).get('componentID') if status == 200 else None
+                if componentID:
+                    texts[bid].append(componentID)
+            else:
+                client.post('/api/board/%d/components/post' % bid, {'message': 'Message %d' % i, 'content-type': 'chat', 'invite': '-1', 'position': 'None'})
+    return dict(usernames=usernames, access=access, texts=texts)
+
+def parse_mix(mix):
+    """Turn 'poll=70,chat=15,...' into a list of (operation, weight)."""
+    weights = []
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        if name.strip() not in OPERATIONS:
+            raise ValueError('Unknown operation %r, expected one of %s' % (name, ', '.join(OPERATIONS)))
+        weights.append((name.strip(), float(weight)))
+    return weights
+
+def run_operation(client, operation, username, seed, state, rng):
+    """Do one `operation` as `username`. `state` keeps what the client got so far (revision per board). Returns the status code and the body."""
+    boards = seed['access'][username]
+    if operation == 'login' or not boards:
+        return client.login(username)
+    bid = rng.choice(boards)
+    if operation == 'poll':
+        status, body = client.get('/api/board/%d/components/get' % bid, {'invite': '-1', 'since_rev': state.get(bid, 0)})
+        if status == 200:
+            state[bid] = json.loads(body.decode('utf-8')).get('revision', state.get(bid, 0))
+        return status, body
+    if operation == 'chat':
+        return client.post('/api/board/%d/components/post' % bid, {'message': 'Hello from %s' % username, 'content-type': 'chat', 'invite': '-1', 'position': 'None'})
+    texts = seed['texts'].get(bid)
+    if not texts:
+        return client.get('/api/board/%d/components/get' % bid, {'invite': '-1', 'since_rev': state.get(bid, 0)})
+    position = json.dumps({'top': rng.randrange(500), 'left': rng.randrange(800)})
+    return client.post('/api/edit/board/%d/component/%d' % (bid, rng.choice(texts)), {'content-type': 'text', 'hasMessages': 'false', 'position': position, 'invite': '-1'})
+
+def drive(make_client, seed, mix, requests, concurrency, rng_seed, counter=None):
+    """Run `requests` operations picked by weight from `mix`, split between `concurrency` clients (threads) logged in as random users.
+    Returns the samples, (operation, seconds, status, queries or None, app-level error or None) tuples, and the wall time.
+    """
+    samples = []
+    lock = threading.Lock()
+    names = [name for name, weight in mix]
+    weights = [weight for name, weight in mix]
+    def worker(n, count):
+        rng = random.Random(rng_seed * 1000 + n)
+        username = rng.choice(seed['usernames'])
+        client = make_client()
+        client.login(username)
+        state = {}
+        mine = []
+        for i in range(count):
+            operation = rng.choices(names, weights)[0]
+            if counter is not None:
+                counter.take()
+            start = time.perf_counter()
+            status, body = run_operation(client, operation, username, seed, state, rng)
+            elapsed = time.perf_counter() - start
+            error = None
+            if body[:1] == b'{':
+                error = json.loads(body.decode('utf-8')).get('error')
+                error = None if error in ('None', 'Nothing new.') else error
+            mine.append((operation, elapsed, status, counter.take() if counter is not None else None, error))
+        with lock:
+            samples.extend(mine)
+    threads = [threading.Thread(target=worker, args=(n, requests // concurrency + (1 if n < requests % concurrency else 0))) for n in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - start
+
+def percentile(values, p):
+    """The `p` percentile (0-100) of a sorted list, by nearest rank."""
+    if not values:
+        return None
+    return values[max(int(round(p / 100.0 * len(values))) - 1, 0)]
+
+def summarize(samples, seconds):
+    """Latency percentiles (milliseconds), throughput (requests per second of wall time), queries per request and errors of a list of samples."""
+    latencies = sorted(s[1] * 1000 for s in samples)
+    queries = [s[3] for s in samples if s[3] is not None]
+    return dict(
+        requests=len(samples),
+        throughput=round(len(samples) / seconds, 2) if seconds else None,
+        p50=round(percentile(latencies, 50), 3) if latencies else None,
+        p95=round(percentile(latencies, 95), 3) if latencies else None,
+        p99=round(percentile(latencies, 99), 3) if latencies else None,
+        mean=round(sum(latencies) / len(latencies), 3) if latencies else None,
+        queries_per_request=round(float(sum(queries)) / len(queries), 2) if queries else None,
+        http_errors=sum(1 for s in samples if s[2] >= 400),
+        app_errors=sum(1 for s in samples if s[4] is not None),
+    )
+
+def report(samples, seconds):
+    """The results of a run: the summary of all samples and of every operation."""
+    operations = {}
+    for name in OPERATIONS:
+        mine = [s for s in samples if s[0] == name]
+        if mine:
+            operations[name] = summarize(mine, seconds)
+    return dict(total=summarize(samples, seconds), operations=operations)
+
+@contextmanager
+def in_process_app(database):
+    """Point the app at `database`, with every new connection counting its queries. Puts everything back afterwards.
+    Yields the ``QueryCounter``.
+    """
+    import pegasus
+    counter = QueryCounter()
+    connect = pegasus.connect_db
+    def connect_db():
+        db = connect()
+        db.set_trace_callback(counter.traced)
+        return db
+    previous = pegasus.app.config['DATABASE']
+    pegasus.connect_db = connect_db # get_pool() makes its connections with this
+    pegasus.app.config['DATABASE'] = database
+    try:
+        pegasus.init_db()
+        yield counter
+    finally:
+        pegasus.views.position_buffer.flush()
+        pegasus.connect_db = connect
+        pegasus.app.config['DATABASE'] = previous
+
+def git_commit():
+    """The commit being benchmarked, if this is a git checkout."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    """Seed, drive the load and return the results (a dict ready for JSON)."""
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    started = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    if args.url:
+        start = time.perf_counter()
+        seed = seed_server(args.url, args.users, args.boards, args.invites, args.rows, rng)
+        seedTime = time.perf_counter() - start
+        samples, seconds = drive(lambda: HTTPClient(args.url), seed, mix, args.requests, args.concurrency, args.seed)
+    else:
+        import pegasus
+        fd, database = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            with in_process_app(database) as counter:
+                start = time.perf_counter()
+                db = pegasus.connect_db()
+                try:
+                    seed = seed_database(db, args.users, args.boards, args.invites, args.rows, rng)
+                finally:
+                    db.close()
+                seedTime = time.perf_counter() - start
+                samples, seconds = drive(lambda: AppClient(pegasus.app), seed, mix, args.requests, args.concurrency, args.seed, counter)
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(database + suffix):
+                    os.unlink(database + suffix)
+    results = dict(mode='http' if args.url else 'in-process', url=args.url, commit=git_commit(), started=started, seconds=round(seconds, 3), seed_seconds=round(seedTime, 3),
+                   config=dict(users=args.users, boards=args.boards, invites=args.invites, rows=args.rows, requests=args.requests, concurrency=args.concurrency, mix=args.mix, seed=args.seed))
+    results.update(report(samples, seconds))
+    return results
+
+def print_results(results, out=sys.stdout):
+    """Print a results table."""
+    print('%s, commit %s: %d requests in %.2fs (seeding took %.2fs)' % (results['mode'], (results['commit'] or '?')[:10], results['total']['requests'], results['seconds'], results['seed_seconds']), file=out)
+    print('%-8s %8s %10s %10s %10s %10s %8s %8s' % ('', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors'), file=out)
+    rows = [(name, results['operations'][name]) for name in OPERATIONS if name in results['operations']] + [('total', results['total'])]
+    for name, r in rows:
+        print('%-8s %8d %10s %10s %10s %10s %8s %8d' % (name, r['requests'], r['throughput'], r['p50'], r['p95'], r['p99'],
+                                                     r['queries_per_request'] if r['queries_per_request'] is not None else '-', r['http_errors'] + r['app_errors']), file=out)
+
+def compare(old, new, out=sys.stdout):
+    """Print how the latencies and throughput of `new` results changed from `old` ones, in percent."""
+    def change(a, b):
+        return '%+.1f%%' % ((b - a) * 100.0 / a) if a and b is not None else '-'
+    print('Compared to commit %s:' % (old.get('commit') or '?')[:10], file=out)
+    print('%-8s %10s %10s %10s %10s' % ('', 'req/s', 'p50', 'p95', 'p99'), file=out)
+    for name in OPERATIONS + ('total',):
+        a = old['total'] if name == 'total' else old['operations'].get(name)
+        b = new['total'] if name == 'total' else new['operations'].get(name)
+        if a and b:
+            print('%-8s %10s %10s %10s %10s' % (name, change(a['throughput'], b['throughput']), change(a['p50'], b['p50']), change(a['p95'], b['p95']), change(a['p99'], b['p99'])), file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test of the pegasus board API.')
+    parser.add_argument('--url', help='benchmark a running server (e.g. http://127.0.0.1:5000) instead of the app in this process')
+    parser.add_argument('--users', type=int, default=20, help='users to create (default: 20)')
+    parser.add_argument('--boards', type=int, default=10, help='boards to create (default: 10)')
+    parser.add_argument('--invites', type=int, default=3, help='users invited to edit each board (default: 3)')
+    parser.add_argument('--rows', type=int, default=500, help='components (chat and text) per board (default: 500)')
+    parser.add_argument('--requests', type=int, default=2000, help='requests to make in total (default: 2000)')
+    parser.add_argument('--concurrency', type=int, default=4, help='clients making requests at the same time (default: 4)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='weights of the operations (default: %s)' % DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=1, help='random seed, for runs that can be compared (default: 1)')
+    parser.add_argument('--output', metavar='FILE', help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare with the results of an earlier run (saved with --output)')
+    args = parser.parse_args(argv)
+    results = run(args)
+    print_results(results)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from contextlib import closing
+from pegasus import connect_db, dump
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write boards as NDJSON (see pegasus/dump.py), reading them as they are written.')
+    parser.add_argument('--board', dest='boards', type=int, action='append', default=[], help='ID of a board to dump (can be repeated)')
+    parser.add_argument('--user', dest='user', help='dump all the boards of this user (username), created or invited to')
+    parser.add_argument('--no-deleted', dest='deleted', action='store_false', help='leave out deleted components')
+    parser.add_argument('-o', '--output', dest='output', help='file to write to (default: standard output)')
+    args = parser.parse_args(argv)
+
+    if not args.boards and not args.user:
+        parser.error('nothing to dump, give --board and/or --user')
+    with closing(connect_db()) as db:
+        records = []
+        if args.user:
+            user = db.execute('select id from users where username=?', [args.user]).fetchone()
+            if user is None:
+                parser.error('no such user: %s' % args.user)
+            records.append(dump.user_records(db, user[0], args.deleted))
+        records += [dump.board_records(db, boardID, args.deleted) for boardID in args.boards]
+        out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for generator in records:
+                out.writelines(dump.ndjson(generator))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,30 @@
 #!/usr/bin/env python3
-from pegasus import init_db
-init_db()
+import argparse
+from contextlib import closing
+from pegasus import init_db, upgrade_db, connect_db, maintenance_pass, migrations
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--upgrade', dest='upgrade', action='store_true', help='apply pending migrations to an existing database (keeps the data)')
+parser.add_argument('--status', dest='status', action='store_true', help='show the schema version and pending migrations')
+parser.add_argument('--maintenance', dest='maintenance', action='store_true', help='run a maintenance pass now: archive finished boards, purge deleted components, optimize (see pegasus/maintenance.py)')
+parser.add_argument('--vacuum', dest='vacuum', action='store_true', help='rebuild the database with incremental auto_vacuum, so maintenance can shrink it (blocks writes while it runs)')
+args = parser.parse_args()
+
+if args.status:
+    with closing(connect_db()) as db:
+        print('Schema version: %d (latest: %d)' % (migrations.current_version(db), migrations.latest_version()))
+        for version, description in migrations.pending(db):
+            print('  pending %d: %s' % (version, description))
+elif args.maintenance:
+    result = maintenance_pass(force=True)
+    print('Archived %d boards, purged %d deleted components, freed %s pages' % (len(result['archived']), sum(result['purged'].values()), result['pages_freed'] if result['pages_freed'] is not None else 'no'))
+elif args.vacuum:
+    with closing(connect_db()) as db:
+        db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        db.execute('VACUUM')
+        print('auto_vacuum: %d (2 is incremental)' % db.execute('PRAGMA auto_vacuum').fetchone()[0])
+elif args.upgrade:
+    applied = upgrade_db()
+    print('Applied migrations: %s' % (', '.join(str(v) for v in applied) or 'none'))
+else:
+    init_db()
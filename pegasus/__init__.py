@@ -2,20 +2,146 @@
 App
 ----
 """
+import hmac
+import os
+import random
 import sqlite3
+import threading
+import time
 from flask import Flask, g, request, session, abort
 from contextlib import closing
 from flask_jsglue import JSGlue
+from pegasus.events import board_events
+from pegasus.pool import ConnectionPool, PoolTimeout
+from pegasus.locks import LocalLockManager, SQLiteLockManager
+from pegasus.bus import LocalBus, SocketBus, DataVersionBus
+from pegasus.instrumentation import SQLRecorder, QueryStats, unwrap
+from pegasus.metrics import Registry
+from pegasus.profiling import RequestProfiler, ProfileStore
+from pegasus.maintenance import MaintenanceWorker
+from pegasus import maintenance
+from pegasus import migrations
 
 # config (which should be in another file for larger apps)
 DATABASE = '/tmp/pegasus.db'
 """SQLite database file. Schema can be found in schema.sql"""
-DEBUG = True
-"""For dev purposes."""
+DEBUG = False
+"""For dev purposes (``./run_pegasus.py`` turns it on unless given ``--no-debug``). Never on in production, the debugger runs code."""
 SECRET_KEY = 'you shall not pass'
 """Also for dev purposes."""
 CSRF_ENABLED = True
 """To be able to disable it when testing"""
+STREAM_KEEPALIVE = 15
+"""Seconds between keep-alive comments on an idle board update stream."""
+STREAM_MAX_DURATION = 300
+"""Seconds before an update stream is closed so the client reconnects (and the worker gets recycled)."""
+LONG_POLL_MAX_WAIT = 30
+"""Upper limit for the ``wait`` parameter of long-polling ``get_components`` requests, in seconds."""
+DB_POOL_SIZE = 10
+"""Maximum number of open database connections per process."""
+DB_POOL_TIMEOUT = 10
+"""Seconds a request waits for a free database connection before giving up with a 503."""
+DB_POOL_PING_AFTER = 60
+"""Seconds a pooled connection can stay idle before it's checked again before use."""
+SQLITE_PRAGMAS = [
+    ('auto_vacuum', 'INCREMENTAL'),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),
+    ('mmap_size', 134217728),
+    ('busy_timeout', 5000),
+    ('temp_store', 'MEMORY'),
+]
+"""PRAGMAs applied (in order) to every new connection, including the one that creates the schema.
+WAL lets readers (board polling) carry on while someone writes, and NORMAL synchronous is safe with WAL.
+auto_vacuum only takes effect on a new database (before its tables are created), it lets maintenance give free pages back (see maintenance.py).
+cache_size is negative to mean KiB, mmap_size is in bytes and busy_timeout in milliseconds.
+"""
+SQLITE_CHECKPOINT_INTERVAL = 300
+"""Seconds between WAL checkpoints run at the end of a request (0 to leave it to SQLite's automatic checkpoints)."""
+SQLITE_CHECKPOINT_MODE = 'PASSIVE'
+"""WAL checkpoint mode. PASSIVE never blocks readers or writers."""
+COMPONENT_CACHE_ENABLED = True
+"""Keep snapshots of busy boards' components in memory (turn off to always read from the database)."""
+COMPONENT_CACHE_SIZE = 256
+"""Maximum number of boards kept in the component cache."""
+AUTH_CACHE_TTL = 30
+"""Seconds an access decision (who can view/edit which board) is cached in the process. Changes made by this process take effect
+right away, in the others too unless ``CHANGE_BUS`` is 'local' (then this is how long they can be behind). 0 to only cache for the length of a request."""
+AUTH_CACHE_SIZE = 4096
+"""Maximum number of access decisions cached in the process."""
+CHAT_PAGE_SIZE = 50
+"""Number of chat messages a board's first load (and every page when scrolling back) has, only the latest ones. 0 for all of them."""
+BATCH_MAX_OPERATIONS = 200
+"""Maximum number of operations in one ``components/batch`` request."""
+POSITION_COALESCE_WINDOW = 0.25
+"""Seconds component position updates (dragging) are buffered in memory before the latest ones are written, all in one transaction.
+0 to write every one of them right away."""
+LOCK_LEASE_SECONDS = 5
+"""How long a board stays locked for whoever edited it last (every edit renews it), unless they release it earlier."""
+LOCK_BACKEND = 'local'
+"""Where board locks are kept: 'local' (in memory, for a single process) or 'sqlite' (in ``LOCK_DATABASE``, shared by all processes using it)."""
+LOCK_DATABASE = '/tmp/pegasus-locks.db'
+"""SQLite file for the 'sqlite' lock backend. Separate from ``DATABASE`` so locking doesn't wait on content writes."""
+CHANGE_BUS = 'local'
+"""How board change events reach the other worker processes (see bus.py): 'local' (single process), 'socket' (Unix sockets in ``CHANGE_BUS_DIR``)
+or 'data_version' (every process polls the database every ``CHANGE_BUS_POLL_INTERVAL`` seconds)."""
+CHANGE_BUS_DIR = '/tmp/pegasus-bus'
+"""Directory where the processes using the 'socket' change bus put their sockets. Nothing else should use it."""
+CHANGE_BUS_POLL_INTERVAL = 0.5
+"""Seconds between checks for changes made by other processes, with the 'data_version' change bus."""
+ASGI_THREADS = 10
+"""Threads that run requests (and their database access) when serving with asgi.py. Waiting long-polls and update streams don't take one."""
+PASSWORD_HASH_METHOD = 'pbkdf2:sha512:10000'
+"""How passwords are hashed (as in werkzeug's ``generate_password_hash()``, include the iterations). Raise the cost here:
+older hashes keep working and are upgraded when their owner logs in."""
+HASH_WORKERS = 2
+"""Processes that hash passwords, so logins don't hold up the request threads (0 to hash in the request thread)."""
+HASH_MAX_PENDING = 32
+"""Maximum number of password hashes running or waiting per process. Logins and sign ups past that get a 503."""
+SQL_INSTRUMENTATION = True
+"""Count the queries, SQL time, rows and commits of every request, by endpoint and statement (see instrumentation.py and ``/_sqlStats``)."""
+SLOW_QUERY_MS = 100
+"""Queries taking longer than this (milliseconds) are logged to the ``pegasus.sql`` logger, with their parameters redacted. None to log none."""
+SQL_DEBUG_HEADERS = False
+"""Add the counts of a request as X-SQL-* headers to its response. Always on in ``DEBUG``."""
+INTERNAL_ADDRESSES = ['127.0.0.1', '::1']
+"""Client addresses allowed to see internal endpoints (``/_sqlStats``). Behind a proxy on the same host, block those paths there."""
+METRICS_ENABLED = True
+"""Keep request latency, lock, poll and database connection metrics, served at ``/metrics`` (see metrics.py) to ``INTERNAL_ADDRESSES``."""
+METRICS_DIR = None
+"""With several worker processes, a directory (only used for this) where each of them writes its metrics, so ``/metrics`` adds them all up.
+None for a single process."""
+METRICS_FLUSH_INTERVAL = 5
+"""Seconds between writes of a process's metrics to ``METRICS_DIR``."""
+PROFILE_TOKEN = None
+"""Secret that, sent as the ``X-Profile`` header, gets a request profiled (see profiling.py). None to turn the header off."""
+PROFILE_RATE = 0
+"""Fraction of all requests that are profiled without asking (0 for none, 1 for all)."""
+PROFILER = 'sampling'
+"""'sampling' (collapsed stacks, little overhead) or 'cprofile' (pstats, exact but slower)."""
+PROFILE_INTERVAL = 0.005
+"""Seconds between stack samples of the sampling profiler."""
+PROFILE_DIR = '/tmp/pegasus-profiles'
+"""Where profiles are saved, a directory per endpoint. ``./profile_pegasus.py`` reads them from there."""
+PROFILE_KEEP = 20
+"""Number of profiles kept per endpoint, the oldest ones are deleted."""
+MAINTENANCE_INTERVAL = 600
+"""Seconds between maintenance passes (see maintenance.py), run by a background thread. With several processes, only one runs each pass. 0 for none."""
+ARCHIVE_AFTER = 3600
+"""Seconds after ``done_at`` that a board is archived (its deleted components dropped), so clients still watching it get the last changes first."""
+TOMBSTONE_GRACE = 3600
+"""Seconds deleted components are kept on open boards, so polling clients hear about the deletion. Clients further behind get the whole board again."""
+MAINTENANCE_BATCH = 500
+"""Components deleted per transaction by maintenance, so writes never wait long for it."""
+MAINTENANCE_VACUUM_PAGES = 2000
+"""Free pages of the database file given back to the file system per maintenance pass (``PRAGMA incremental_vacuum``). 0 for none."""
+EXPORT_WORKERS = 1
+"""Processes that render board exports (see export.py), 0 to render in the request thread."""
+EXPORT_MAX_PENDING = 8
+"""Maximum number of board exports rendering or waiting per process. Exports past that get a 503."""
+EXPORT_CACHE_SIZE = 64
+"""Number of rendered exports kept per process. They're cached by board revision, so a board that doesn't change is only rendered once per format."""
 
 
 # initialize app
@@ -23,32 +149,307 @@ app = Flask(__name__)
 """Initialize the application."""
 jsglue = JSGlue(app)
 """JSGlue is what provides client-side js with Flask's url_for functionality without having to render the links via Jinja2"""
-app.config.from_object(__name__) # or the other file if we had the config in another file (ref: app.config.from_envvar('FLASKR_SETTINGS', silent=True))
-"""Assign configuration to app. In this case, configuration is in the same file."""
+app.config.from_object(__name__)
+app.config.from_envvar('PEGASUS_SETTINGS', silent=True)
+"""Assign configuration to app: the defaults above, overridden by the settings file (Python, same names) that the ``PEGASUS_SETTINGS`` environment variable points to, if any.
+``./run_pegasus.py --config FILE`` sets it."""
 
-# import other necessary modules
-import pegasus.views
-import pegasus.errorhandlers
+def apply_pragmas(db, pragmas):
+    """Run a list of (name, value) PRAGMAs on a connection."""
+    for name, value in pragmas:
+        if not name.replace('_', '').isalnum(): # PRAGMAs can't be parameterized
+            raise ValueError('Invalid PRAGMA name: %r' % name)
+        db.execute('PRAGMA %s = %s' % (name, value if isinstance(value, int) else "'%s'" % value)).fetchall()
 
 def connect_db():
-    """Connect to the SQLite database."""
-    return sqlite3.connect(app.config['DATABASE'])
+    """Connect to the SQLite database and set up the connection (foreign keys on, then ``SQLITE_PRAGMAS``).
+    Connections can be used by other threads (but not at the same time) so they can be pooled.
+    """
+    db = sqlite3.connect(app.config['DATABASE'], check_same_thread=False)
+    db.execute('PRAGMA foreign_keys = ON')
+    apply_pragmas(db, app.config['SQLITE_PRAGMAS'])
+    return db
+
+_last_checkpoint = time.time()
+_checkpoint_lock = threading.Lock()
+
+def checkpoint_if_due(db):
+    """Run a WAL checkpoint on `db` if the last one was more than ``SQLITE_CHECKPOINT_INTERVAL`` seconds ago.
+    Only one thread checkpoints at a time, the others just skip it.
+    """
+    global _last_checkpoint
+    interval = app.config['SQLITE_CHECKPOINT_INTERVAL']
+    if not interval or time.time() - _last_checkpoint < interval:
+        return
+    if not _checkpoint_lock.acquire(False):
+        return
+    try:
+        _last_checkpoint = time.time()
+        db.execute('PRAGMA wal_checkpoint(%s)' % app.config['SQLITE_CHECKPOINT_MODE']).fetchall()
+    except sqlite3.Error:
+        pass # not in WAL mode, or busy. Either way, next time.
+    finally:
+        _checkpoint_lock.release()
+
+_pool = None
+_pool_database = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Get the connection pool for the configured database, creating it on first use.
+    If the ``DATABASE`` setting changed (tests use a new file every time), the old pool is closed and replaced.
+    """
+    global _pool, _pool_database
+    with _pool_lock:
+        if _pool is None or _pool_database != app.config['DATABASE']:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(connect_db, size=app.config['DB_POOL_SIZE'], timeout=app.config['DB_POOL_TIMEOUT'], ping_after=app.config['DB_POOL_PING_AFTER'])
+            _pool_database = app.config['DATABASE']
+        return _pool
+
+_locks = None
+_locks_config = None
+
+def get_locks():
+    """Get the board lock manager for the configured ``LOCK_BACKEND`` (see locks.py), creating it on first use or when the settings change."""
+    global _locks, _locks_config
+    config = (app.config['LOCK_BACKEND'], app.config['LOCK_DATABASE'], app.config['LOCK_LEASE_SECONDS'])
+    with _pool_lock:
+        if _locks is None or _locks_config != config:
+            if app.config['LOCK_BACKEND'] == 'sqlite':
+                _locks = SQLiteLockManager(app.config['LOCK_DATABASE'], lease=app.config['LOCK_LEASE_SECONDS'])
+            elif app.config['LOCK_BACKEND'] == 'local':
+                _locks = LocalLockManager(lease=app.config['LOCK_LEASE_SECONDS'])
+            else:
+                raise ValueError('Unknown LOCK_BACKEND: %r' % app.config['LOCK_BACKEND'])
+            _locks_config = config
+        return _locks
+
+_bus = None
+_bus_config = None
+
+def get_bus():
+    """Get the change bus for the configured ``CHANGE_BUS`` (see bus.py), creating it on first use or when the settings change.
+    Created lazily so every worker process (forked after the app is loaded) gets its own.
+    """
+    global _bus, _bus_config
+    config = (app.config['CHANGE_BUS'], app.config['CHANGE_BUS_DIR'], app.config['CHANGE_BUS_POLL_INTERVAL'], app.config['DATABASE'], app.config['AUTH_CACHE_TTL'])
+    with _pool_lock:
+        if _bus is None or _bus_config != config:
+            if _bus is not None:
+                _bus.close()
+            if app.config['CHANGE_BUS'] == 'socket':
+                _bus = SocketBus(app.config['CHANGE_BUS_DIR'])
+            elif app.config['CHANGE_BUS'] == 'data_version':
+                _bus = DataVersionBus(app.config['DATABASE'], interval=app.config['CHANGE_BUS_POLL_INTERVAL'], keep=app.config['AUTH_CACHE_TTL'])
+            elif app.config['CHANGE_BUS'] == 'local':
+                _bus = LocalBus()
+            else:
+                raise ValueError('Unknown CHANGE_BUS: %r' % app.config['CHANGE_BUS'])
+            _bus.subscribe(pegasus.views.on_change)
+            _bus_config = config
+        return _bus
+
+sql_recorder = SQLRecorder()
+"""Query counts of all requests, by endpoint and statement (see instrumentation.py)."""
+
+metrics_registry = Registry()
+"""The metrics of this process (see metrics.py). Views add their own."""
+request_duration = metrics_registry.histogram('pegasus_request_duration_seconds', 'Time to handle a request, until its response is ready (streamed bodies not included).', ['endpoint', 'method'])
+requests_total = metrics_registry.counter('pegasus_requests_total', 'Requests handled, by endpoint and status code.', ['endpoint', 'status'])
+requests_in_flight = metrics_registry.gauge('pegasus_requests_in_flight', 'Requests being handled right now.')
+db_checkout_duration = metrics_registry.histogram('pegasus_db_checkout_seconds', 'Time waiting for a pooled database connection.',
+                                         buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10))
+db_checkout_timeouts = metrics_registry.counter('pegasus_db_checkout_timeouts_total', 'Requests turned away (503) because no database connection was free in time.')
+db_held_duration = metrics_registry.histogram('pegasus_db_connection_held_seconds', 'Time a database connection is kept out of the pool, from checkout to release.')
+
+def checkout_db():
+    """Get a pooled connection for the current request and put it in ``g.db``. Aborts with 503 if none is free in time.
+    With ``SQL_INSTRUMENTATION``, the connection is wrapped to count what's done with it in ``g.sql_stats``.
+    """
+    g.db_pool = get_pool()
+    start = time.perf_counter()
+    try:
+        g.db = g.db_pool.checkout()
+    except PoolTimeout:
+        g.db = None
+        if app.config['METRICS_ENABLED']:
+            db_checkout_timeouts.inc()
+        abort(503)
+    g.db_checked_out = time.perf_counter()
+    if app.config['METRICS_ENABLED']:
+        db_checkout_duration.observe(g.db_checked_out - start)
+    if app.config['SQL_INSTRUMENTATION']:
+        if 'sql_stats' not in g: # a request that gave its connection back and got another one keeps counting in the same place
+            g.sql_stats = QueryStats()
+        slow = app.config['SLOW_QUERY_MS']
+        g.db = sql_recorder.wrap(g.db, g.sql_stats, slow / 1000.0 if slow is not None else None)
+    return g.db
+
+def release_db():
+    """Return the current request's connection to the pool early (before waiting on something, for example)."""
+    db = getattr(g, 'db', None)
+    if db is not None:
+        g.db = None
+        if app.config['METRICS_ENABLED']:
+            db_held_duration.observe(time.perf_counter() - g.db_checked_out)
+        db = unwrap(db)
+        checkpoint_if_due(db)
+        g.db_pool.checkin(db)
 
 def init_db():
-    """Initialize the SQLite database. Used in init_db.py."""
+    """Initialize the SQLite database. Used in init_db.py.
+    The connection comes from ``connect_db()``, so ``SQLITE_PRAGMAS`` (WAL mode, which sticks to the file) are applied before the schema is created.
+    schema.sql creates version 0 of the schema, and the migrations bring it up to date.
+    """
     with closing(connect_db()) as db:
         with app.open_resource('schema.sql', mode='r') as f:
             db.cursor().executescript(f.read())
         db.commit()
+    upgrade_db()
+    board_events.reset()
+    pegasus.views.component_cache.clear()
+    pegasus.views.auth_cache.clear()
+    pegasus.views.position_buffer.reset()
+    pegasus.views.export_pool.cache.clear()
+    get_locks().reset()
+
+def upgrade_db(target=None):
+    """Apply the pending migrations in migrations.py to the database. Unlike ``init_db()``, this keeps all the data. Used in init_db.py.
+    Returns the list of versions applied.
+    """
+    with closing(connect_db()) as db:
+        return migrations.upgrade(db, target)
+
+
+
+# profiling
+_profile_store = None
+
+def get_profile_store():
+    """Get where profiles are saved (``PROFILE_DIR``), created on first use or when the settings change."""
+    global _profile_store
+    with _pool_lock:
+        if _profile_store is None or (_profile_store.directory, _profile_store.keep) != (app.config['PROFILE_DIR'], app.config['PROFILE_KEEP']):
+            _profile_store = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_KEEP'])
+        return _profile_store
+
+@app.before_request
+def start_profile():
+    """Profile the request if it has the ``PROFILE_TOKEN`` header or is picked by ``PROFILE_RATE``. Runs before everything else so the whole request is in the profile."""
+    token = app.config['PROFILE_TOKEN']
+    asked = token and hmac.compare_digest(request.headers.get('X-Profile', ''), token)
+    if asked or (app.config['PROFILE_RATE'] and random.random() < app.config['PROFILE_RATE']):
+        profiler = RequestProfiler(app.config['PROFILER'], app.config['PROFILE_INTERVAL'])
+        if profiler.start():
+            g.profiler = profiler
+
+def finish_profile():
+    """Stop the request's profiler, if there's one, and save the profile. Returns where it was saved."""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return None
+    return get_profile_store().save(request.endpoint or 'unknown', profiler.kind, profiler.stop())
+
+@app.after_request
+def save_profile(response):
+    """Save the profile of a profiled request (registered first, so it runs after all the others) and tell the client where it is."""
+    path = finish_profile()
+    if path is not None:
+        response.headers['X-Profile'] = os.path.relpath(path, app.config['PROFILE_DIR'])
+    return response
+
+# metrics
+@app.before_request
+def start_metrics():
+    """Count the request as in flight and note when it started. Runs first, so waiting for a database connection is part of its duration."""
+    if app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+        requests_in_flight.inc()
+        if app.config['METRICS_DIR']:
+            metrics_registry.start_flushing(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+
+def record_request(status):
+    """Add a finished request to the metrics (once)."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unknown'
+        request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        requests_total.inc(endpoint=endpoint, status=status)
+        requests_in_flight.dec()
+
+@app.after_request
+def end_metrics(response):
+    """Record how long the request took and how it ended."""
+    record_request(response.status_code)
+    return response
 
+# maintenance
+maintenance_passes = metrics_registry.counter('pegasus_maintenance_passes_total', 'Maintenance passes, by result: ok, skipped (another process ran it) or failed.', ['result'])
+maintenance_duration = metrics_registry.histogram('pegasus_maintenance_pass_seconds', 'Time a maintenance pass took, by step: archive, purge or optimize.', ['step'],
+                                                  buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+boards_archived = metrics_registry.counter('pegasus_boards_archived_total', 'Boards archived by maintenance.')
+components_purged = metrics_registry.counter('pegasus_components_purged_total', 'Deleted components dropped from the database by maintenance.')
+pages_freed = metrics_registry.counter('pegasus_db_pages_freed_total', 'Pages of the database file given back to the file system by maintenance.')
 
+def maintenance_pass(force=False):
+    """Run a maintenance pass (see maintenance.py) with the settings in the config, on a connection of its own (not one of the pool's).
+    Returns what was done, or None if another process ran a pass less than ``MAINTENANCE_INTERVAL`` seconds ago (unless `force`).
+    """
+    with closing(connect_db()) as db:
+        if not maintenance.claim(db, 0 if force else app.config['MAINTENANCE_INTERVAL']):
+            if app.config['METRICS_ENABLED']:
+                maintenance_passes.inc(result='skipped')
+            return None
+        try:
+            result = maintenance.run_pass(db, app.config['ARCHIVE_AFTER'], app.config['TOMBSTONE_GRACE'], app.config['MAINTENANCE_BATCH'], app.config['MAINTENANCE_VACUUM_PAGES'])
+        except Exception:
+            if app.config['METRICS_ENABLED']:
+                maintenance_passes.inc(result='failed')
+            raise
+    for boardID in result['purged']: # cached snapshots still have the purged components
+        pegasus.views.component_cache.discard(boardID)
+    if app.config['METRICS_ENABLED']:
+        maintenance_passes.inc(result='ok')
+        for step, seconds in result['seconds'].items():
+            maintenance_duration.observe(seconds, step=step)
+        boards_archived.inc(len(result['archived']))
+        components_purged.inc(sum(result['purged'].values()))
+        pages_freed.inc(result['pages_freed'] or 0)
+    return result
+
+_maintenance = None
+_maintenance_config = None
+
+def get_maintenance():
+    """Get the maintenance worker of this process, starting it (every ``MAINTENANCE_INTERVAL`` seconds) on first use, in every worker process
+    (forked after the app is loaded), or when the interval changes. None if ``MAINTENANCE_INTERVAL`` is 0.
+    """
+    global _maintenance, _maintenance_config
+    config = (os.getpid(), app.config['MAINTENANCE_INTERVAL'])
+    if _maintenance_config == config:
+        return _maintenance
+    with _pool_lock:
+        if _maintenance_config != config:
+            if _maintenance is not None and _maintenance_config[0] == os.getpid():
+                _maintenance.stop()
+            _maintenance = MaintenanceWorker(maintenance_pass, app.config['MAINTENANCE_INTERVAL']) if app.config['MAINTENANCE_INTERVAL'] else None
+            if _maintenance is not None:
+                _maintenance.start()
+            _maintenance_config = config
+        return _maintenance
+
+@app.before_request
+def start_maintenance():
+    """Make sure this process has its maintenance worker running (cheap once it has)."""
+    get_maintenance()
 
 # database requests
 @app.before_request
 def before_request():
-    """Before database requests, connect, and turn on foreign keys."""
-    g.db = connect_db()
-    g.db.execute('PRAGMA foreign_keys = ON')
+    """Before database requests, get a connection from the pool (already set up, foreign keys on)."""
+    checkout_db()
 
 @app.before_request
 def csrf_protect():
@@ -61,12 +462,29 @@ def csrf_protect():
         if not token or token != request.form.get('_csrf_token'):
             abort(400) 
 
+@app.after_request
+def sql_headers(response):
+    """With ``SQL_DEBUG_HEADERS`` (or in debug), tell the client what the request did with the database so far."""
+    stats = g.get('sql_stats')
+    if stats is not None and (app.config['SQL_DEBUG_HEADERS'] or app.debug):
+        response.headers['X-SQL-Queries'] = str(stats.queries)
+        response.headers['X-SQL-Time'] = '%.3f' % (stats.time * 1000)
+        response.headers['X-SQL-Rows'] = str(stats.rows)
+        response.headers['X-SQL-Commits'] = str(stats.commits)
+    return response
+
 @app.teardown_request
 def teardown_request(exception):
-    """If there's a database connection, close it."""
-    db = getattr(g, 'db', None)
-    if db is not None:
-        db.close()
+    """If there's a database connection, return it to the pool, and add what the request did with it to ``sql_recorder``."""
+    release_db()
+    record_request(500) # only if end_metrics() didn't get to it (unhandled exception)
+    finish_profile() # same for save_profile()
+    stats = g.get('sql_stats')
+    if stats is not None:
+        sql_recorder.record(request.endpoint or 'unknown', stats)
 
 
 
+# import other necessary modules
+import pegasus.views
+import pegasus.errorhandlers
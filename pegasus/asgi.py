@@ -0,0 +1,239 @@
+"""
+ASGI
+-----
+Serving pegasus from an asyncio server (``./run_pegasus.py --asgi``, with uvicorn installed) instead of one thread per request.
+Requests still go through the Flask app, in a pool of ``ASGI_THREADS`` threads (that's where SQLite is used), but clients
+that are only waiting for a board to change don't keep a thread: long-polls (``get_components`` with ``wait``) and update streams
+(``stream_components``) are parked as coroutines woken up by the board notifier, and only go back to a thread to read the changes.
+So thousands of open boards cost a few coroutines each, not a thread.
+
+WSGI middleware around ``app.wsgi_app`` is not applied here, requests are dispatched to the app directly.
+"""
+import asyncio
+import io
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+from pegasus import app, get_pool, get_locks
+from pegasus.events import board_events
+from pegasus import views
+
+_long_poll = re.compile(r'^/api/board/(\d+)/components/get$')
+_executor = None
+
+
+def get_executor():
+    """The thread pool requests run in, created on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS'])
+    return _executor
+
+async def run(function, *args):
+    """Run a blocking function in the thread pool."""
+    return await asyncio.get_event_loop().run_in_executor(get_executor(), function, *args)
+
+async def wait_for_change(boardID, since, timeout):
+    """Coroutine version of ``board_events.wait()``: returns the board's change counter once it moves past `since` or `timeout` seconds pass."""
+    loop = asyncio.get_event_loop()
+    changed = asyncio.Event()
+    def wake():
+        loop.call_soon_threadsafe(changed.set)
+    board_events.watch(boardID, wake)
+    try:
+        if board_events.version(boardID) == since: # registered first, so a change in between isn't missed
+            await asyncio.wait_for(changed.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        board_events.unwatch(boardID, wake)
+    return board_events.version(boardID)
+
+def make_environ(scope, body):
+    """Build the WSGI environ of an ASGI HTTP request."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+def dispatch(environ):
+    """Handle a request with the Flask app (what ``app.wsgi_app`` does) and return the response, with its body read unless it's streamed
+    (update streams and NDJSON dumps). Runs in the thread pool.
+    """
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        try:
+            ctx.push()
+            response = app.full_dispatch_request()
+        except Exception as e:
+            error = e
+            response = app.make_response(app.handle_exception(e))
+        if not response.is_streamed:
+            response.body = response.get_data()
+        return response
+    finally:
+        ctx.auto_pop(error)
+
+async def send_response_start(send, response):
+    """Send the status and headers of a response."""
+    headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.to_wsgi_list()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+async def send_response(send, response):
+    """Send a whole (non streamed) response."""
+    await send_response_start(send, response)
+    await send({'type': 'http.response.body', 'body': response.body})
+
+async def send_streamed(send, response, disconnected):
+    """Send a streamed response (other than an update stream) chunk by chunk, producing each one in the thread pool."""
+    chunks = iter(response.response)
+    done = object()
+    await send_response_start(send, response)
+    try:
+        while not disconnected.done():
+            chunk = await run(next, chunks, done)
+            if chunk is done:
+                break
+            await send({'type': 'http.response.body', 'body': chunk if isinstance(chunk, bytes) else chunk.encode(response.charset), 'more_body': True})
+    finally:
+        await run(response.close) # closes the generator too, giving back its connection
+    if not disconnected.done():
+        await send({'type': 'http.response.body', 'body': b''})
+
+def long_poll_environ(scope, body, again):
+    """The environ of one of the ``get_components`` requests a long-poll is made of. ``pegasus.long_poll`` tells the view to count it
+    as a long-poll, and on the first request (`again` False) not to count an empty answer, since the long-poll isn't over yet.
+    """
+    environ = make_environ(scope, body)
+    environ['pegasus.long_poll'] = 'again' if again else 'first'
+    return environ
+
+async def long_poll(scope, body, boardID, wait):
+    """A ``get_components`` request with ``wait``: asked without it, and if there's nothing new, asked again once the board changes.
+    Returns the response to send.
+    """
+    version = board_events.version(boardID) # before reading, so a write in between isn't missed
+    response = await run(dispatch, long_poll_environ(scope, body, False))
+    if response.status_code != 200 or json.loads(response.body.decode('utf-8')).get('error') != 'Nothing new.':
+        return response
+    lock = get_locks().holder(boardID)
+    if lock is not None: # nobody writes when a lock runs out, so don't wait past that
+        wait = min(wait, views.lock_time_left(lock))
+    if await wait_for_change(boardID, version, wait) != version:
+        response = await run(dispatch, long_poll_environ(scope, body, True))
+    elif app.config['METRICS_ENABLED']:
+        views.polls.inc(result='empty', mode='long_poll')
+    return response
+
+async def board_stream(send, response, disconnected):
+    """Run an update stream (see ``views.stream_components()``) as a coroutine, reading the changes in the thread pool."""
+    stream = response.board_stream
+    bid = stream['board']
+    pool = get_pool()
+    def read():
+        with pool.connection() as db:
+            return views.next_stream_event(db, stream)
+    await send_response_start(send, response)
+    version = board_events.version(bid)
+    changed = True
+    while not disconnected.done():
+        if changed or stream['wasLocked']:
+            event = await run(read)
+            if event is None: # board was deleted
+                await send({'type': 'http.response.body', 'body': b'event: gone\ndata: {}\n\n', 'more_body': True})
+                break
+            if event:
+                await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+        timeout = views.stream_wait_time(stream)
+        if timeout is None:
+            break
+        waiting = asyncio.ensure_future(wait_for_change(bid, version, timeout))
+        await asyncio.wait([waiting, disconnected], return_when=asyncio.FIRST_COMPLETED)
+        if not waiting.done():
+            waiting.cancel()
+            break
+        newVersion = waiting.result()
+        changed = newVersion != version
+        version = newVersion
+        if not changed and not stream['wasLocked']:
+            await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+    if not disconnected.done():
+        await send({'type': 'http.response.body', 'body': b''})
+
+async def wait_disconnect(receive):
+    """Wait until the client goes away."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+async def application(scope, receive, send):
+    """The ASGI application. Serve with ``uvicorn pegasus.asgi:application`` (or ``./run_pegasus.py --asgi``)."""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await run(views.position_buffer.flush)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        raise ValueError('Unsupported ASGI scope type: %r' % scope['type'])
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    query = parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+    match = _long_poll.match(scope['path'])
+    wait = dict(query).get('wait')
+    if match is not None and scope['method'] == 'GET' and wait:
+        try:
+            wait = min(max(float(wait), 0), app.config['LONG_POLL_MAX_WAIT'])
+        except ValueError:
+            wait = 0
+        scope = dict(scope, query_string=urlencode([(k, v) for k, v in query if k != 'wait']).encode('latin-1'))
+        response = await long_poll(scope, body, int(match.group(1)), wait)
+        await send_response(send, response)
+        return
+    response = await run(dispatch, make_environ(scope, body))
+    if response.is_streamed:
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        try:
+            if getattr(response, 'board_stream', None) is not None:
+                await board_stream(send, response, disconnected)
+            else:
+                await send_streamed(send, response, disconnected)
+        finally:
+            disconnected.cancel()
+        return
+    await send_response(send, response)
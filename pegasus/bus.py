@@ -0,0 +1,202 @@
+"""
+Bus
+----
+Board change events shared between processes.
+When pegasus runs as several worker processes on the same database, a write handled by one worker has to wake up the update streams
+and long-polls waiting in the others, and drop what they cached about who can access what.
+Views publish an event (a small dict, see below) for every change, and every process subscribes to the bus and gets the events of all of them.
+
+Events:
+    - ``{'kind': 'board', 'board': boardID, 'revision': revision or None}``: something on the board changed.
+    - ``{'kind': 'access', 'board': boardID or None, 'user': userID or None, 'email': email or None}``: access to a board, of a user or of the invites of an email changed.
+
+Backends:
+    - ``LocalBus``: a single process, events only go to its own subscribers.
+    - ``SocketBus``: every process binds a Unix datagram socket in a shared directory and sends its events to all the others.
+    - ``DataVersionBus``: for when sockets aren't an option. Watches ``PRAGMA data_version`` of the database, which changes whenever
+      another connection commits, and turns the board revisions changed since into board events. Access events are written to the database
+      for the other processes to read back.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+class ChangeBus(object):
+    """Delivers published events to the subscribers of this process, backends add the sending/receiving to and from the other processes.
+    A subscriber that raises doesn't keep the others from getting the event.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Call ``callback(event)`` for every event, published here or in another process."""
+        self._subscribers.append(callback)
+
+    def publish(self, event):
+        """Send an event to the subscribers of this process and the other processes."""
+        self._deliver(event)
+        self._send(event)
+
+    def close(self):
+        """Stop listening to the other processes."""
+        pass
+
+    def _deliver(self, event):
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception:
+                pass
+
+    def _send(self, event):
+        pass
+
+
+class LocalBus(ChangeBus):
+    """Events stay in the process."""
+    pass
+
+
+class SocketBus(ChangeBus):
+    """Processes find each other through their sockets in `directory` (named after the process ID, or `name`).
+    Sockets left behind by processes that died are removed when sending to them fails.
+    """
+
+    def __init__(self, directory, name=None):
+        ChangeBus.__init__(self)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, '%s.sock' % (name or os.getpid()))
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._out.settimeout(0.1) # a process that's too busy to read misses the event rather than holding up the request
+        self._closed = False
+        self._thread = threading.Thread(target=self._listen)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _send(self, event):
+        data = json.dumps(event).encode('utf-8')
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if not filename.endswith('.sock') or path == self.path:
+                continue
+            try:
+                self._out.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(path) # nobody's listening there anymore
+                except OSError:
+                    pass
+            except OSError:
+                pass
+
+    def _listen(self):
+        while not self._closed:
+            try:
+                data = self._sock.recv(65536)
+            except OSError:
+                break
+            try:
+                event = json.loads(data.decode('utf-8'))
+            except ValueError:
+                continue
+            self._deliver(event)
+
+    def close(self):
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR) # wakes up the listener thread
+        except OSError:
+            pass
+        self._sock.close()
+        self._out.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class DataVersionBus(ChangeBus):
+    """Checks ``PRAGMA data_version`` of `database` every `interval` seconds, and when it moved, publishes a board event for every board
+    whose revision changed (or that was deleted) since the last check. Triggers keep the latest change of each board in ``board_changes``
+    (see migration 6), and only the rows past the last ``seq`` seen are read. Commits of other connections of this process move it too,
+    so local changes may be delivered twice, which only means an extra wake up.
+    Access events published here are added to ``access_changes`` (migration 7) and read back the same way by the other processes.
+    They're deleted after `keep` seconds (``AUTH_CACHE_TTL``), when no process has a decision cached from before them anymore.
+    """
+
+    def __init__(self, database, interval=0.5, keep=60):
+        ChangeBus.__init__(self)
+        self.interval = interval
+        self.keep = keep
+        self._db = sqlite3.connect(database, check_same_thread=False, isolation_level=None) # autocommit, for the access_changes writes
+        self._version = self._db.execute('PRAGMA data_version').fetchone()[0]
+        self._seq = self._db.execute('select coalesce(max(seq), 0) from board_changes').fetchone()[0]
+        self._access_seq = self._db.execute('select coalesce(max(seq), 0) from access_changes').fetchone()[0]
+        self._published = {} # boardID: revision published here and not seen in board_changes yet
+        self._sent = set() # seq of the access changes written here, not to be delivered again
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _send(self, event):
+        if event.get('kind') == 'board' and event.get('revision') is not None:
+            with self._lock: # we know about this one already
+                self._published[event['board']] = max(event['revision'], self._published.get(event['board'], 0))
+        elif event.get('kind') == 'access':
+            now = time.time()
+            with self._lock:
+                try:
+                    self._db.execute('delete from access_changes where changed_at < ?', [now - self.keep])
+                    cur = self._db.execute('insert into access_changes (boardID, userID, email, changed_at) values (?, ?, ?, ?)',
+                                           [event.get('board'), event.get('user'), event.get('email'), now])
+                    self._sent.add(cur.lastrowid)
+                except sqlite3.Error:
+                    pass # the others will be behind by up to AUTH_CACHE_TTL, like before there was a bus
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except sqlite3.Error:
+                pass # try again next time
+
+    def check(self):
+        """Look for changes now (the polling thread does this every `interval` seconds). Returns the events delivered."""
+        with self._lock:
+            version = self._db.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._version:
+                return []
+            self._version = version
+            events = []
+            for seq, boardID, revision in self._db.execute('select seq, boardID, revision from board_changes where seq > ? order by seq', [self._seq]).fetchall():
+                self._seq = seq
+                published = self._published.pop(boardID, 0)
+                if revision is None or published < revision:
+                    events.append(dict(kind='board', board=boardID, revision=revision))
+            for seq, boardID, userID, email in self._db.execute('select seq, boardID, userID, email from access_changes where seq > ? order by seq', [self._access_seq]).fetchall():
+                self._access_seq = seq
+                if seq in self._sent:
+                    self._sent.discard(seq)
+                else:
+                    events.append(dict(kind='access', board=boardID, user=userID, email=email))
+        for event in events:
+            self._deliver(event)
+        return events
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._db.close()
@@ -0,0 +1,93 @@
+"""
+Cache
+------
+A small thread-safe LRU cache, used to keep the data of busy boards (and who has access to them) in memory so dozens of
+viewers polling the same board don't all hit the database for the same rows.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Keeps up to `maxsize` entries, dropping the least recently used one when full.
+    If `ttl` is given, entries also expire that many seconds after they were stored.
+    Counts hits and misses so its usefulness can be checked (``stats()``).
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (value, expiry time or None)
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        """Get the entry for `key` if it's there and hasn't expired (dropping it if it has). Must be called with the lock held."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] < time.time():
+            del self._entries[key]
+            return None
+        return entry
+
+    def __contains__(self, key):
+        """Check if there's a value for `key` (doesn't count as a hit or miss)."""
+        with self._lock:
+            return self._live(key) is not None
+
+    def get(self, key, default=None):
+        """Get the value stored for `key` (and mark it as recently used), or `default` if there's none."""
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Store `value` for `key`, dropping the least recently used entries if the cache is full."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + self.ttl if self.ttl else None)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def update(self, key, function):
+        """Replace the value stored for `key` with ``function(value)``, all while holding the lock so no one else changes it in between.
+        Does nothing if there's no value for `key`, and drops the entry if `function` returns None.
+        """
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return
+            value = function(entry[0])
+            if value is None:
+                del self._entries[key]
+            else:
+                self._entries[key] = (value, entry[1])
+
+    def discard(self, key):
+        """Forget `key`, if it's there."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        """Forget every entry for which ``predicate(key, value)`` is true."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if predicate(key, entry[0])]:
+                del self._entries[key]
+
+    def clear(self):
+        """Forget everything (the counters too)."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Hits, misses and size of the cache, as a dict."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._entries), maxsize=self.maxsize)
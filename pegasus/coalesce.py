@@ -0,0 +1,119 @@
+"""
+Coalesce
+---------
+Buffering of component position updates.
+Dragging a component makes the client report a new position many times a second, and only the last one matters.
+Instead of writing (and committing) each of them, the latest position of every component being moved is kept in memory
+and all of them are written together, in one transaction, at most every few hundred milliseconds.
+Until then, readers in this process see the buffered positions (``views.get_components()`` overlays them).
+"""
+import itertools
+import logging
+import threading
+
+
+logger = logging.getLogger('pegasus.coalesce')
+"""Where moves that couldn't be written are logged."""
+
+
+class PositionBuffer(object):
+    """Latest pending position per (board, component), flushed by calling ``write(moves)`` `window` seconds after the first one came in.
+    `moves` is a list of (boardID, componentID, move) tuples, where a move is a dict with type, position, who (did it), token (the fencing token
+    of their lock, see locks.py) and seq.
+    Every move gets a sequence number (``seq``, increasing in the process) so readers can tell which ones they already got.
+    If `write` raises one of the `retry` exceptions (the database being busy, say), the moves are kept (unless newer ones came in meanwhile)
+    and tried again after another window. Any other exception means the moves themselves are the problem, so they're dropped (and logged),
+    or they'd fail again on every flush and hold up all the moves after them.
+    """
+
+    def __init__(self, write, window=0.25, retry=()):
+        self.write = write
+        self.window = window
+        self.retry = tuple(retry)
+        self._pending = {} # (boardID, componentID) -> move
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # one flush at a time, so moves are written in order
+        self._timer = None
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+
+    def put(self, boardID, componentID, ty, position, who, token=None):
+        """Buffer a new position for a component, replacing any pending one. Returns the move's sequence number."""
+        with self._lock:
+            seq = self._last_seq = next(self._seq)
+            self._pending[(boardID, componentID)] = dict(type=ty, position=position, who=who, token=token, seq=seq)
+            self._schedule()
+        return seq
+
+    def pending(self, boardID):
+        """The pending moves of a board, as a dict of componentID -> move."""
+        with self._lock:
+            return dict((cid, move) for (bid, cid), move in self._pending.items() if bid == boardID)
+
+    def last_seq(self):
+        """Sequence number of the latest move buffered (0 if none yet)."""
+        with self._lock:
+            return self._last_seq
+
+    def discard(self, boardID, componentID=None):
+        """Drop the pending moves of a component (when it's deleted), or of a whole board.
+        Returns them, as a dict of (boardID, componentID) -> move, to be put back with ``restore()`` if what replaces them isn't written after all.
+        """
+        with self._lock:
+            return dict((key, self._pending.pop(key)) for key in list(self._pending) if key[0] == boardID and (componentID is None or key[1] == componentID))
+
+    def restore(self, moves):
+        """Put back moves taken out with ``discard()``, except where newer ones came in since."""
+        with self._lock:
+            for key, move in moves.items():
+                self._pending.setdefault(key, move)
+            if self._pending:
+                self._schedule()
+
+    def flush(self):
+        """Write all pending moves now. Returns how many there were."""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                moves = sorted(self._pending.items(), key=lambda item: item[1]['seq'])
+                self._pending = {}
+            if not moves:
+                return 0
+            try:
+                self.write([(key[0], key[1], move) for key, move in moves])
+            except self.retry:
+                with self._lock:
+                    for key, move in moves:
+                        self._pending.setdefault(key, move)
+                    self._schedule()
+                raise
+            except Exception:
+                logger.exception('Dropped %d moves that could not be written', len(moves))
+                raise
+            return len(moves)
+
+    def reset(self):
+        """Drop everything pending without writing it (used when the database is re-initialized)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending = {}
+
+    def _schedule(self):
+        """Start the flush timer if it isn't running. Must be called with the lock held."""
+        if self._timer is None:
+            self._timer = threading.Timer(self.window, self._flush_quietly)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_quietly(self):
+        """``flush()`` from the timer thread, where there's no one to raise to (failed moves are retried or logged)."""
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            pass
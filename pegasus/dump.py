@@ -0,0 +1,45 @@
+"""
+Dump
+-----
+Bulk export of boards as NDJSON (one JSON object per line), for archiving. Used by the ``export.ndjson`` views and dump_boards.py.
+Rows are read from the database one at a time as the output is written, never all at once, so dumping a board with a million
+components takes as much memory as dumping one with ten.
+
+Every board is written as a ``board`` record followed by a ``component`` record for each of its components (deleted ones included,
+with ``deleted`` set to 'Y', since this is the board's history), in the order they changed:
+    - ``{"record": "board", "id": ..., "title": ..., "creatorID": ..., "created_at": ..., "done_at": ..., "revision": ...}``
+    - ``{"record": "component", "boardID": ..., "id": ..., "content": ..., "type": ..., ...}`` (the fields of ``get_components()`` messages)
+"""
+import json
+
+
+def board_records(db, boardID, deleted=True):
+    """Yield the records of a board (nothing if there's no such board), leaving out deleted components unless `deleted`."""
+    board = db.execute('select id, title, creatorID, created_at, done_at, revision from boards where id=?', [boardID]).fetchone()
+    if board is None:
+        return
+    yield dict(record='board', id=board[0], title=board[1], creatorID=board[2], created_at=board[3], done_at=board[4], revision=board[5])
+    query = 'select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=?'
+    params = [boardID]
+    if not deleted:
+        query += ' and deleted=?'
+        params.append('N')
+    for row in db.execute(query + ' order by revision', params): # the cursor steps through the rows as they're asked for
+        yield dict(record='component', boardID=boardID, id=row[0], content=row[1], userID=row[2], userEmail=row[3], created_at=row[4],
+                   last_modified_at=row[5], last_modified_by=row[6], type=row[7], position=row[8], deleted=row[9], revision=row[10])
+
+def user_board_ids(db, userID):
+    """Yield the IDs of the boards a user created or was invited to (with the email they have now), oldest first."""
+    for row in db.execute('select id from boards where creatorID=? union select i.boardID from invites i join users u on u.email=i.userEmail where u.id=? order by 1', [userID, userID]):
+        yield row[0]
+
+def user_records(db, userID, deleted=True):
+    """Yield the records of all the boards of a user (see ``user_board_ids()``), one board after the other."""
+    for boardID in list(user_board_ids(db, userID)): # just the IDs, so the components query doesn't run inside this one
+        for record in board_records(db, boardID, deleted):
+            yield record
+
+def ndjson(records):
+    """Turn records into NDJSON lines."""
+    for record in records:
+        yield json.dumps(record, separators=(',', ':')) + '\n'
@@ -37,6 +37,11 @@ def gone(e):
     """Render error template with the message: Page Gone and no details."""
     return render_error(410, 'Page Gone')
 
+@app.errorhandler(503)
+def service_unavailable(e):
+    """Render error template with the message: Service Unavailable and details."""
+    return render_error(503, 'Service Unavailable', det="The server is too busy to handle your request right now. Please try again in a bit.")
+
 @app.errorhandler(500)
 def internal_error(e):
     """Render error template with the message: Internal Server Error and no details."""
@@ -0,0 +1,89 @@
+"""
+Events
+-------
+In-process board change notifications.
+Every write to a board (new component, edit, delete, lock) bumps a per-board counter and wakes up whoever
+is waiting on that board, like the update stream in ``views.stream_components()``.
+This way waiting clients cost nothing until something actually changes.
+Threads wait with ``wait()``, coroutines (asgi.py) register a callback with ``watch()`` instead.
+"""
+import threading
+import time
+
+
+class BoardNotifier(object):
+    """Keeps a change counter per board and a condition to wait on it.
+    All conditions share one lock, so checking a counter and going to sleep on it can't miss a notification.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._conditions = {}
+        self._watchers = {}
+
+    def _condition(self, boardID):
+        """Get (or create) the condition for a board. Must be called with the lock held."""
+        cond = self._conditions.get(boardID)
+        if cond is None:
+            cond = threading.Condition(self._lock)
+            self._conditions[boardID] = cond
+        return cond
+
+    def version(self, boardID):
+        """Current change counter of a board. Starts at 0."""
+        with self._lock:
+            return self._versions.get(boardID, 0)
+
+    def notify(self, boardID):
+        """Mark a board as changed and wake up everyone waiting on it."""
+        with self._lock:
+            self._versions[boardID] = self._versions.get(boardID, 0) + 1
+            self._condition(boardID).notify_all()
+            watchers = self._watchers.pop(boardID, [])
+        for callback in watchers: # outside the lock, they may want to check the version
+            callback()
+
+    def watch(self, boardID, callback):
+        """Call ``callback()`` (once, from the notifying thread) the next time the board changes."""
+        with self._lock:
+            self._watchers.setdefault(boardID, []).append(callback)
+
+    def unwatch(self, boardID, callback):
+        """Forget a callback registered with ``watch()`` that hasn't been called (the waiter gave up)."""
+        with self._lock:
+            watchers = self._watchers.get(boardID, [])
+            if callback in watchers:
+                watchers.remove(callback)
+            if not watchers:
+                self._watchers.pop(boardID, None)
+
+    def wait(self, boardID, since, timeout):
+        """Block until the board's counter moves past `since` or `timeout` seconds pass.
+        Returns the counter at wake up time, which equals `since` if nothing happened.
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            cond = self._condition(boardID)
+            while self._versions.get(boardID, 0) == since:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                cond.wait(remaining)
+            return self._versions.get(boardID, 0)
+
+    def reset(self):
+        """Forget all counters (used when the database is re-initialized)."""
+        with self._lock:
+            for cond in self._conditions.values():
+                cond.notify_all()
+            watchers = [callback for callbacks in self._watchers.values() for callback in callbacks]
+            self._versions.clear()
+            self._conditions.clear()
+            self._watchers.clear()
+        for callback in watchers:
+            callback()
+
+
+board_events = BoardNotifier()
+"""The notifier shared by all request threads of this process."""
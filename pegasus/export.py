@@ -0,0 +1,236 @@
+"""
+Export
+-------
+Rendering boards to files on the server: the canvas as an image (SVG, or PNG if Pillow is installed) and the whole board
+(canvas text and chat) as Markdown or plain text.
+This used to be done in the browser with html2canvas, which had to rasterize the whole board grid and often gave up on large boards.
+Rendering runs in a small pool of worker processes, and the results are cached by board revision (and title), so exporting a board that
+hasn't changed since (which is always the case once it's done) doesn't render anything.
+
+A board is passed to the renderers as a dict with its ``title`` and ``components``, a list of dicts with type, content,
+position (the JSON string stored with the component), author and created_at, in the order they were posted.
+"""
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.sax.saxutils import escape
+
+from pegasus.cache import LRUCache
+from pegasus.hashing import process_context
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError: # PNG export is off without it
+    Image = None
+
+logger = logging.getLogger('pegasus.export')
+"""Where broken pools are logged."""
+
+FONT_SIZE = 18
+"""Text size on the canvas, in pixels (``.draggable-text`` in styles.css)."""
+LINE_HEIGHT = 22
+CHAR_WIDTH = 10
+"""Rough width of a character, to size the image so text isn't cut off."""
+MIN_WIDTH = 800
+MIN_HEIGHT = 600
+MARGIN = 20
+
+
+class ExportBusy(Exception):
+    """Too many exports are already waiting for a worker."""
+    pass
+
+
+class ExportUnavailable(Exception):
+    """The format can't be rendered here (PNG without Pillow)."""
+    pass
+
+
+def canvas_items(board):
+    """The text components of a board as (left, top, lines) tuples, in reading order (top to bottom, then left to right)."""
+    items = []
+    for component in board['components']:
+        if component['type'] != 'text':
+            continue
+        try:
+            position = json.loads(component['position'] or '{}')
+            left, top = float(position.get('left', 0)), float(position.get('top', 0))
+        except (ValueError, TypeError, AttributeError):
+            left, top = 0, 0
+        items.append((max(left, 0), max(top, 0), component['content'].split('\n')))
+    items.sort(key=lambda item: (item[1], item[0]))
+    return items
+
+def canvas_size(items):
+    """Width and height of an image that fits all `items` (at least ``MIN_WIDTH`` by ``MIN_HEIGHT``)."""
+    width, height = MIN_WIDTH, MIN_HEIGHT
+    for left, top, lines in items:
+        width = max(width, int(left + CHAR_WIDTH * max(len(line) for line in lines)) + MARGIN)
+        height = max(height, int(top + LINE_HEIGHT * len(lines)) + MARGIN)
+    return width, height
+
+def render_svg(board):
+    """The canvas of a board as an SVG image."""
+    items = canvas_items(board)
+    width, height = canvas_size(items)
+    out = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">' % (width, height, width, height),
+           '<title>%s</title>' % escape(board['title']),
+           '<rect width="100%" height="100%" fill="#ffffff"/>',
+           '<g font-family="Helvetica, Arial, sans-serif" font-size="%d" fill="#333333">' % FONT_SIZE]
+    for left, top, lines in items:
+        out.append('<text x="%g" y="%g" xml:space="preserve">' % (left, top + FONT_SIZE))
+        for i, line in enumerate(lines):
+            out.append('<tspan x="%g" dy="%d">%s</tspan>' % (left, LINE_HEIGHT if i else 0, escape(line)))
+        out.append('</text>')
+    out += ['</g>', '</svg>', '']
+    return '\n'.join(out).encode('utf-8')
+
+def load_font():
+    """A TrueType font of ``FONT_SIZE`` if one can be found, or else Pillow's built-in one."""
+    for name in ('DejaVuSans.ttf', 'Arial.ttf', 'FreeSans.ttf'):
+        try:
+            return ImageFont.truetype(name, FONT_SIZE)
+        except (IOError, OSError):
+            pass
+    return ImageFont.load_default()
+
+def render_png(board):
+    """The canvas of a board as a PNG image. Raises ``ExportUnavailable`` without Pillow."""
+    if Image is None:
+        raise ExportUnavailable('PNG export needs Pillow, which is not installed.')
+    items = canvas_items(board)
+    image = Image.new('RGB', canvas_size(items), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    font = load_font()
+    for left, top, lines in items:
+        for i, line in enumerate(lines):
+            draw.text((left, top + i * LINE_HEIGHT), line, fill=(51, 51, 51), font=font)
+    out = io.BytesIO()
+    image.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+def render_markdown(board, plain=False):
+    """The text of a board (canvas, in reading order, then the chat) as Markdown, or as plain text if `plain`."""
+    if plain:
+        out = [board['title'], '=' * len(board['title']), '', 'Canvas', '------', '']
+    else:
+        out = ['# %s' % board['title'], '', '## Canvas', '']
+    for left, top, lines in canvas_items(board):
+        out += (lines if plain else [line + '  ' for line in lines]) + ['']
+    out += ['Chat', '----', ''] if plain else ['## Chat', '']
+    for component in board['components']:
+        if component['type'] != 'chat':
+            continue
+        if plain:
+            out.append('[%s] %s: %s' % (component['created_at'], component['author'], component['content'].replace('\n', ' ')))
+        else:
+            out.append('- **%s** (%s): %s' % (component['author'], component['created_at'], component['content'].replace('\n', ' ')))
+    out.append('')
+    return '\n'.join(out).encode('utf-8')
+
+def render_text(board):
+    """The text of a board as plain text."""
+    return render_markdown(board, plain=True)
+
+FORMATS = {
+    'svg': (render_svg, 'image/svg+xml'),
+    'png': (render_png, 'image/png'),
+    'md': (render_markdown, 'text/markdown'),
+    'txt': (render_text, 'text/plain'),
+}
+"""Export formats: extension -> (renderer, mimetype)."""
+
+def available(fmt):
+    """Check if the format `fmt` can be rendered here."""
+    return fmt in FORMATS and (fmt != 'png' or Image is not None)
+
+
+class ExportPool(object):
+    """Renders boards in `workers` processes, with at most `max_pending` renders running or waiting at a time,
+    and keeps the last `cache_size` results. With 0 `workers`, rendering is done in the calling thread.
+    Requests for something that's already being rendered wait for that instead of rendering it again.
+    Like ``hashing.HashingPool``, the processes are started on first use, so each server worker process gets its own.
+    """
+
+    def __init__(self, workers=1, max_pending=8, cache_size=64):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.cache = LRUCache(cache_size)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._rendering = {} # key -> Future of a render in progress
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def render(self, key, fmt, load):
+        """Get the board identified by `key` (which should include its revision) in format `fmt`, from the cache or by
+        rendering what ``load()`` returns (only called if needed, in the calling thread since it reads the database).
+        Raises ``ExportUnavailable`` if the format can't be rendered here and ``ExportBusy`` if too many renders are waiting.
+        """
+        if not available(fmt):
+            raise ExportUnavailable('Can not export to %s here.' % fmt)
+        data = self.cache.get((key, fmt))
+        if data is not None:
+            return data
+        with self._lock: # look for a render in progress and, if there's none, become it, all at once
+            future = self._rendering.get((key, fmt))
+            if future is not None:
+                waiting = True
+            elif not self._slots.acquire(False):
+                raise ExportBusy('%d exports are already waiting.' % self.max_pending)
+            else:
+                waiting = False
+                future = self._rendering[(key, fmt)] = Future()
+        if waiting:
+            return future.result()
+        try:
+            data = self.cache.get((key, fmt)) # in case a render finished between the first look and taking its place
+            if data is None:
+                board = load()
+                if not self.workers:
+                    data = FORMATS[fmt][0](board)
+                else:
+                    executor = self._get_executor()
+                    try:
+                        data = executor.submit(FORMATS[fmt][0], board).result()
+                    except BrokenProcessPool:
+                        logger.exception('Export pool broken, rendering in the request thread (a new pool is started next time)')
+                        self._drop_executor(executor)
+                        data = FORMATS[fmt][0](board)
+                self.cache.set((key, fmt), data)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            with self._lock:
+                self._rendering.pop((key, fmt), None)
+            self._slots.release()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=process_context())
+                self._pid = os.getpid()
+            return self._executor
+
+    def _drop_executor(self, executor):
+        """Forget `executor` (a worker died, and it won't take any more work), unless another thread already did."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        """Stop the worker processes (new ones are started if it's used again)."""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,100 @@
+"""
+Hashing
+--------
+Password hashing off the request threads.
+Hashing a password is slow on purpose, and a burst of logins or sign ups used to keep the request threads busy (and the GIL held)
+while everyone else waited for their board updates. Here the hashing runs in a small pool of worker processes, and the number of
+hashes waiting for one is bounded: when it's full, requests are turned away (``HashingBusy``, a 503) instead of piling up.
+
+The hash method (and cost) comes from ``PASSWORD_HASH_METHOD``. Hashes made with an older setting still check out, and are
+replaced with one of the current setting the next time their owner logs in (see ``needs_rehash()``).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+logger = logging.getLogger('pegasus.hashing')
+"""Where broken pools are logged."""
+
+
+class HashingBusy(Exception):
+    """Too many hashes are already waiting for a worker."""
+    pass
+
+
+def process_context():
+    """How worker processes are started: never by forking the server process, whose other threads may hold locks (connection pool, logging...)
+    the child would wait on forever. 'forkserver' forks them from a clean process instead, 'spawn' (where there's no forkserver) starts them fresh.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def needs_rehash(pwhash, method):
+    """Check if a stored hash was made with something other than `method` (e.g. fewer iterations), and should be replaced."""
+    return pwhash.split('$', 1)[0] != method
+
+
+class HashingPool(object):
+    """Hashes and checks passwords in `workers` processes, with at most `max_pending` of them running or waiting at a time.
+    With 0 `workers`, the hashing is done in the calling thread (still bounded by `max_pending`).
+    The processes are started on first use, so each server worker process (forked after the app is loaded) gets its own.
+    """
+
+    def __init__(self, workers=2, max_pending=32):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def hash(self, password, method):
+        """Hash `password` with `method` (as in werkzeug's ``generate_password_hash()``)."""
+        return self._run(generate_password_hash, password, method)
+
+    def check(self, pwhash, password):
+        """Check `password` against the stored `pwhash`."""
+        return self._run(check_password_hash, pwhash, password)
+
+    def _run(self, function, *args):
+        """Run `function` in a worker, raising ``HashingBusy`` if ``max_pending`` calls are already running or waiting."""
+        if not self._slots.acquire(False):
+            raise HashingBusy('%d password hashes are already waiting.' % self.max_pending)
+        try:
+            if not self.workers:
+                return function(*args)
+            executor = self._get_executor()
+            try:
+                return executor.submit(function, *args).result()
+            except BrokenProcessPool:
+                logger.exception('Hashing pool broken, hashing in the request thread (a new pool is started next time)')
+                self._drop_executor(executor)
+                return function(*args)
+        finally:
+            self._slots.release()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=process_context())
+                self._pid = os.getpid()
+            return self._executor
+
+    def _drop_executor(self, executor):
+        """Forget `executor` (a worker died, and it won't take any more work), unless another thread already did."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        """Stop the worker processes (new ones are started if it's used again)."""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,192 @@
+"""
+Instrumentation
+----------------
+Counting what every request does with the database, to find the queries (and the views) that cost the most under load.
+The connection a request gets (``g.db``) is wrapped in a proxy that counts its queries, the time spent in SQLite (running and
+fetching), the rows fetched and the commits. When the request ends, its counts are added to the totals of its endpoint and of every
+statement it ran, so views that run a query per item (N+1) or a statement that dominates show up in ``SQLRecorder.snapshot()``.
+
+Queries slower than ``SLOW_QUERY_MS`` are logged (``pegasus.sql`` logger) with their parameters redacted: only their types are written,
+never the values (passwords hashes, emails and board content go through these queries).
+
+The totals are per process, and since the app started (or ``reset()``).
+"""
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('pegasus.sql')
+"""Where slow queries are logged (as warnings)."""
+
+
+def redact(params):
+    """Replace query parameters by their types, e.g. ``['scott', 3]`` -> ``['<str>', '<int>']``."""
+    if isinstance(params, dict):
+        return dict((key, '<%s>' % type(value).__name__) for key, value in params.items())
+    return ['<%s>' % type(value).__name__ for value in params]
+
+
+class QueryStats(object):
+    """What one request did with the database."""
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+        self.rows = 0
+        self.commits = 0
+        self.statements = {} # sql -> [count, seconds, rows]
+
+    def add(self, sql, seconds, rows=0, query=True):
+        """Count a query (or just `seconds` and `rows` more of one, when its rows are fetched)."""
+        self.queries += 1 if query else 0
+        self.time += seconds
+        self.rows += rows
+        entry = self.statements.setdefault(sql, [0, 0.0, 0])
+        entry[0] += 1 if query else 0
+        entry[1] += seconds
+        entry[2] += rows
+
+
+class InstrumentedCursor(object):
+    """Proxy of a cursor that counts the time spent fetching rows, and the rows, as part of its statement."""
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+        self._sql = None
+
+    def execute(self, sql, params=()):
+        self._sql = sql
+        self._connection._run(self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, params):
+        self._sql = sql
+        self._connection._run(self._cursor.executemany, sql, params)
+        return self
+
+    def _fetch(self, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        self._connection.stats.add(self._sql, time.perf_counter() - start, rows, query=False)
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name): # rowcount, lastrowid, close...
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection(object):
+    """Proxy of a ``sqlite3.Connection`` that counts what's done with it in `stats` (a ``QueryStats``).
+    Queries taking more than `slow` seconds are logged. The connection itself is ``raw``.
+    """
+
+    def __init__(self, connection, stats, slow=None):
+        self.raw = connection
+        self.stats = stats
+        self.slow = slow
+
+    def _run(self, function, sql, params):
+        start = time.perf_counter()
+        try:
+            return function(sql, params)
+        finally:
+            seconds = time.perf_counter() - start
+            self.stats.add(sql, seconds)
+            if self.slow is not None and seconds >= self.slow:
+                logger.warning('Slow query (%.1f ms): %s %r', seconds * 1000, ' '.join(sql.split()), redact(params))
+
+    def cursor(self):
+        return InstrumentedCursor(self.raw.cursor(), self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            self.raw.commit()
+        finally:
+            self.stats.commits += 1
+            self.stats.time += time.perf_counter() - start
+
+    def __getattr__(self, name): # rollback, executescript, total_changes...
+        return getattr(self.raw, name)
+
+
+def unwrap(connection):
+    """The ``sqlite3.Connection`` behind a connection that may be instrumented."""
+    return getattr(connection, 'raw', connection)
+
+
+class SQLRecorder(object):
+    """Totals of the ``QueryStats`` of all requests, by endpoint and by statement (at most `max_statements` different ones, the
+    rest are counted together as 'other').
+    """
+
+    def __init__(self, max_statements=500):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self.reset()
+
+    def wrap(self, connection, stats, slow=None):
+        """Instrument `connection`, counting in `stats` and logging queries slower than `slow` seconds."""
+        return InstrumentedConnection(connection, stats, slow)
+
+    def record(self, endpoint, stats):
+        """Add the `stats` of a request to `endpoint` to the totals."""
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, dict(requests=0, queries=0, time=0.0, rows=0, commits=0, max_queries=0))
+            entry['requests'] += 1
+            entry['queries'] += stats.queries
+            entry['time'] += stats.time
+            entry['rows'] += stats.rows
+            entry['commits'] += stats.commits
+            entry['max_queries'] = max(entry['max_queries'], stats.queries)
+            for sql, (count, seconds, rows) in stats.statements.items():
+                if sql not in self._statements and len(self._statements) >= self.max_statements:
+                    sql = 'other'
+                total = self._statements.setdefault(sql, [0, 0.0, 0, set()])
+                total[0] += count
+                total[1] += seconds
+                total[2] += rows
+                total[3].add(endpoint)
+
+    def snapshot(self, top=20):
+        """The totals: for every endpoint, its requests and their queries, SQL time (ms), rows and commits, in total and per request
+        (and the most queries a single request made); and the `top` statements by total time, with the endpoints that run them.
+        """
+        with self._lock:
+            endpoints = {}
+            for endpoint, entry in self._endpoints.items():
+                n = entry['requests']
+                endpoints[endpoint] = dict(requests=n, queries=entry['queries'], sql_ms=round(entry['time'] * 1000, 3), rows=entry['rows'], commits=entry['commits'],
+                                           queries_per_request=round(float(entry['queries']) / n, 2), sql_ms_per_request=round(entry['time'] * 1000 / n, 3),
+                                           max_queries=entry['max_queries'])
+            statements = sorted(self._statements.items(), key=lambda item: -item[1][1])[:top]
+            statements = [dict(sql=' '.join(sql.split()), count=count, sql_ms=round(seconds * 1000, 3), rows=rows, endpoints=sorted(names))
+                          for sql, (count, seconds, rows, names) in statements]
+        return dict(since=self._since, endpoints=endpoints, statements=statements)
+
+    def reset(self):
+        """Start counting again."""
+        with self._lock:
+            self._endpoints = {}
+            self._statements = {} # sql -> [count, seconds, rows, endpoints]
+            self._since = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
@@ -0,0 +1,151 @@
+"""
+Locks
+------
+Board edit locks as leases, kept out of the main database.
+Whoever edits a board holds its lock for a short lease (renewed by every edit) so two people don't change the same thing at the same time.
+The lock used to be two columns of the boards row, written and committed on every edit. Here it lives in memory
+(``LocalLockManager``, one process) or in a small SQLite file of its own (``SQLiteLockManager``, shared by several processes),
+so taking and renewing locks doesn't write to the main database or wait on content writes.
+
+Every time a lock changes hands it gets a new, bigger fencing token. Writes made under a lock carry its token, and the database
+refuses writes with a token older than the last one it saw (see ``views.next_revision()``), so someone whose lease ran out
+in the middle of a request can't overwrite the work of the next holder.
+"""
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+
+Lease = namedtuple('Lease', 'holder expires token')
+"""A lock: who holds it, when it runs out (seconds since the epoch) and its fencing token."""
+
+
+class LockLost(Exception):
+    """A write was made with the token of a lock that has since changed hands."""
+    pass
+
+
+class LockManager(object):
+    """Lease logic shared by the backends, which only have to implement ``_get(key)``, ``_swap(key, function)`` and ``reset()``.
+    `lease` is the default lease length in seconds.
+    """
+
+    def __init__(self, lease=5):
+        self.lease = lease
+
+    def acquire(self, key, holder, lease=None):
+        """Take the lock on `key` for `holder`, or renew it if they already hold it.
+        Returns the fencing token (the same one on renewal), or None if someone else holds the lock.
+        """
+        now = time.time()
+        lease = lease or self.lease
+        def take(current):
+            if self._held(current, now) and current.holder != holder:
+                return current, None
+            if self._held(current, now):
+                token = current.token
+            else:
+                # tokens only go up, even across restarts of a process that keeps them in memory
+                token = max((current.token if current is not None else 0) + 1, int(now * 1000))
+            return Lease(holder, now + lease, token), token
+        return self._swap(key, take)
+
+    def renew(self, key, holder, token, lease=None):
+        """Extend the lease of a lock that `holder` still holds with `token`. Returns whether they did."""
+        now = time.time()
+        lease = lease or self.lease
+        def extend(current):
+            if self._held(current, now) and current.holder == holder and current.token == token:
+                return Lease(holder, now + lease, token), True
+            return current, False
+        return self._swap(key, extend)
+
+    def release(self, key, holder):
+        """Give up the lock on `key`, if `holder` holds it. Returns whether they did."""
+        now = time.time()
+        def free(current):
+            if self._held(current, now) and current.holder == holder:
+                return Lease(None, 0, current.token), True
+            return current, False
+        return self._swap(key, free)
+
+    def holder(self, key):
+        """The current ``Lease`` on `key`, or None if it's free."""
+        current = self._get(key)
+        return current if self._held(current, time.time()) else None
+
+    def _held(self, lease, now):
+        """Check if a stored lease is taken and hasn't run out."""
+        return lease is not None and lease.holder is not None and lease.expires > now
+
+
+class LocalLockManager(LockManager):
+    """Locks in a dict, for a single process."""
+
+    def __init__(self, lease=5):
+        LockManager.__init__(self, lease)
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            return self._leases.get(key)
+
+    def _swap(self, key, function):
+        """Replace the lease on `key` with ``function(lease)[0]`` atomically, returning ``function(lease)[1]``."""
+        with self._lock:
+            lease, result = function(self._leases.get(key))
+            self._leases[key] = lease
+            return result
+
+    def reset(self):
+        """Forget all locks."""
+        with self._lock:
+            self._leases.clear()
+
+
+class SQLiteLockManager(LockManager):
+    """Locks in a separate SQLite file (`path`), shared by all the processes that use the same file.
+    Every change runs in its own ``BEGIN IMMEDIATE`` transaction, so processes take turns.
+    """
+
+    def __init__(self, path, lease=5):
+        LockManager.__init__(self, lease)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute('PRAGMA journal_mode = WAL').fetchall()
+        self._db.execute('PRAGMA synchronous = OFF') # locks are short lived, not worth an fsync
+        self._db.execute('create table if not exists leases (key text primary key, holder text, expires real not null, token integer not null)')
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._db.execute('select holder, expires, token from leases where key=?', [str(key)]).fetchone()
+        return Lease(*row) if row is not None else None
+
+    def _swap(self, key, function):
+        """Replace the lease on `key` with ``function(lease)[0]`` in one transaction, returning ``function(lease)[1]``."""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute('select holder, expires, token from leases where key=?', [str(key)]).fetchone()
+                current = Lease(*row) if row is not None else None
+                lease, result = function(current)
+                if lease is not current:
+                    self._db.execute('insert or replace into leases (key, holder, expires, token) values (?, ?, ?, ?)', [str(key), lease.holder, lease.expires, lease.token])
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            return result
+
+    def reset(self):
+        """Forget all locks."""
+        with self._lock:
+            self._db.execute('delete from leases')
+
+    def close(self):
+        """Close the connection to the lock file."""
+        with self._lock:
+            self._db.close()
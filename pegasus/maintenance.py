@@ -0,0 +1,174 @@
+"""
+Maintenance
+------------
+Housekeeping of the database, run every ``MAINTENANCE_INTERVAL`` seconds by a background thread in each process (or ``./init_db.py --maintenance``),
+so requests never wait on it:
+
+    1. Archiving boards that are done. Once ``done_at`` is more than ``ARCHIVE_AFTER`` seconds ago nothing can change on a board anymore,
+       so its deleted components are dropped and it's marked ``archived_at``. What's left is exactly what the board shows, read-only.
+    2. Purging the deleted components of open boards ``TOMBSTONE_GRACE`` seconds after they were deleted. Deleted components are only kept
+       (``deleted='Y'``) so that clients polling for changes hear about the deletion, and by then they have.
+    3. ``PRAGMA optimize`` (``ANALYZE`` of the tables whose statistics are out of date, reading at most ``analysis_limit`` rows of each)
+       and ``PRAGMA incremental_vacuum``, giving up to ``MAINTENANCE_VACUUM_PAGES`` free pages back to the file system.
+       Only databases created with ``auto_vacuum = INCREMENTAL`` (see ``SQLITE_PRAGMAS``) can do the latter, ``./init_db.py --vacuum`` converts older ones.
+
+Deleting components is done in batches of ``MAINTENANCE_BATCH`` rows, each in its own short transaction, so writers only ever wait for one batch.
+
+A client that polls with a ``since_rev`` from before a purged deletion would never hear about it, so boards keep the highest revision
+purged (``purged_rev``) and clients that far behind get the whole board again, flagged ``reset`` (see ``get_components()``).
+With several processes, only one of them runs each pass: it has to claim it first (``claim()``).
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+logger = logging.getLogger('pegasus.maintenance')
+"""Where failed passes are logged."""
+
+
+def claim(db, interval, now=None):
+    """Claim the next maintenance pass for this process. Returns False if another one ran a pass less than `interval` seconds ago."""
+    now = time.time() if now is None else now
+    cur = db.execute('update maintenance set last_run=? where id=1 and last_run<=?', [now, now - interval])
+    db.commit()
+    return cur.rowcount == 1
+
+def cutoff(seconds, now=None):
+    """The UTC date `seconds` ago, as the dates in the database are written (and compared)."""
+    now = datetime.utcnow() if now is None else now
+    return (now - timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+def delete_components(db, rows):
+    """Delete the components in `rows` (ID, boardID, revision) and raise the ``purged_rev`` of their boards to match. Doesn't commit."""
+    db.executemany('delete from board_content where id=?', [(row[0],) for row in rows])
+    purged = {}
+    for componentID, boardID, revision in rows:
+        purged[boardID] = max(purged.get(boardID, 0), revision)
+    db.executemany('update boards set purged_rev=max(purged_rev, ?) where id=?', [(revision, boardID) for boardID, revision in purged.items()])
+    return purged
+
+def purge_tombstones(db, before, batch=500):
+    """Delete the components deleted before the date `before`, `batch` at a time. Returns the number deleted, by board."""
+    counts = {}
+    while True:
+        db.execute('BEGIN IMMEDIATE') # read and delete under the same write lock
+        try:
+            rows = db.execute("select id, boardID, revision from board_content where deleted='Y' and last_modified_at < ? limit ?", [before, batch]).fetchall()
+            delete_components(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        for row in rows:
+            counts[row[1]] = counts.get(row[1], 0) + 1
+        if len(rows) < batch:
+            return counts
+
+def archive_boards(db, before, batch=500):
+    """Archive the boards done before the date `before`: delete their deleted components (`batch` at a time) and set their ``archived_at``.
+    Returns the number of components deleted, by board archived.
+    """
+    archived = {}
+    for (boardID,) in db.execute('select id from boards where archived_at is null and done_at < ? order by done_at', [before]).fetchall():
+        archived[boardID] = 0
+        while True:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = db.execute("select id, boardID, revision from board_content where boardID=? and deleted='Y' limit ?", [boardID, batch]).fetchall()
+                delete_components(db, rows)
+                if len(rows) < batch:
+                    db.execute('update boards set archived_at=? where id=?', [datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), boardID])
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            archived[boardID] += len(rows)
+            if len(rows) < batch:
+                break
+    return archived
+
+def optimize(db, vacuum_pages=0, analysis_limit=400):
+    """Update the query planner's statistics where they're out of date, and free up to `vacuum_pages` pages of the file (if it has
+    ``auto_vacuum = INCREMENTAL``, None otherwise). Returns the number of pages freed.
+    """
+    db.execute('PRAGMA analysis_limit = %d' % analysis_limit).fetchall()
+    db.execute('PRAGMA optimize').fetchall()
+    if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return None
+    if not vacuum_pages:
+        return 0
+    free = db.execute('PRAGMA freelist_count').fetchone()[0]
+    db.execute('PRAGMA incremental_vacuum(%d)' % vacuum_pages).fetchall()
+    return free - db.execute('PRAGMA freelist_count').fetchone()[0]
+
+def run_pass(db, archive_after=3600, tombstone_grace=3600, batch=500, vacuum_pages=0, now=None):
+    """A maintenance pass: archive the boards done more than `archive_after` seconds ago, purge components deleted more than
+    `tombstone_grace` seconds ago, then ``optimize()``. Returns what was done: a dict with the boards `archived` and the components
+    deleted by board (`purged`, archived boards included), the `pages_freed` and the `seconds` each step took.
+    """
+    start = time.perf_counter()
+    archived = archive_boards(db, cutoff(archive_after, now), batch)
+    archived_at = time.perf_counter()
+    purged = purge_tombstones(db, cutoff(tombstone_grace, now), batch)
+    purged_at = time.perf_counter()
+    pages = optimize(db, vacuum_pages)
+    for boardID, count in archived.items():
+        purged[boardID] = purged.get(boardID, 0) + count
+    return dict(archived=sorted(archived), purged=purged, pages_freed=pages,
+                seconds=dict(archive=archived_at - start, purge=purged_at - archived_at, optimize=time.perf_counter() - purged_at))
+
+
+class MaintenanceWorker(object):
+    """Calls `task` every `interval` seconds in a background thread, from ``start()`` to ``stop()``, and keeps track of how that went.
+    `task` returns what it did (a dict), or None if it had nothing to do (another process got to it first).
+    """
+
+    def __init__(self, task, interval):
+        self.task = task
+        self.interval = interval
+        self.passes = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_pass = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop calling `task` (a pass that's running finishes first, in the background)."""
+        self._stop.set()
+
+    def run_once(self):
+        """Run `task` now, in the calling thread (after the one running, if any). Returns what it returned, None if it failed."""
+        with self._lock:
+            started = time.time()
+            try:
+                result = self.task()
+            except Exception as e:
+                logger.exception('Maintenance pass failed')
+                self.errors += 1
+                self.last_error = dict(at=started, error='%s: %s' % (type(e).__name__, e))
+                return None
+            if result is None:
+                self.skipped += 1
+            else:
+                self.passes += 1
+                self.last_pass = dict(result, at=started)
+            return result
+
+    def status(self):
+        """How the passes went so far, ready for JSON."""
+        return dict(running=self._thread is not None and self._thread.is_alive(), interval=self.interval, passes=self.passes,
+                    skipped=self.skipped, errors=self.errors, last_pass=self.last_pass, last_error=self.last_error)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
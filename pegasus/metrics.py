@@ -0,0 +1,295 @@
+"""
+Metrics
+--------
+Counters, gauges and histograms served at ``/metrics`` in the Prometheus text format, so request latency, lock contention,
+poll volume and database connection waits can be graphed and alerted on.
+
+Updating a metric only takes a lock and adds to a number, so it's cheap enough for every request.
+With several worker processes, every process writes its values to a file of its own in ``METRICS_DIR`` every few seconds
+(and when asked for ``/metrics``), and ``/metrics`` adds up the files of all of them, whichever process answers.
+When a process is gone, its counters and histograms are added to ``dead.json`` (counters must not go down), its gauges are dropped
+and its file is removed (``remove_dead()``): by gunicorn's ``child_exit`` hook (see run_pegasus.py), or else the next time ``/metrics`` is asked for.
+"""
+import atexit
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+
+def format_value(value):
+    """A number as Prometheus writes it."""
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def format_labels(names, values, extra=()):
+    """``{name="value",...}`` (or '' without labels), with values escaped."""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+
+class Metric(object):
+    """A metric with a value per combination of label values. Subclasses define what the value is."""
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = registry._lock
+        self._values = {} # label values -> value
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError('%s takes the labels %s, got %s' % (self.name, ', '.join(self.labels), ', '.join(sorted(labels))))
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def state(self):
+        """The values, ready for JSON. Must be called with the registry's lock held."""
+        return dict(type=self.kind, help=self.help, labels=list(self.labels), values=[[list(key), value] for key, value in self._values.items()])
+
+
+class Counter(Metric):
+    """A number that only goes up."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A number that goes up and down."""
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Observations (durations, usually) counted in `buckets` (upper bounds, in increasing order), plus their sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        Metric.__init__(self, registry, name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0] # per bucket (not cumulative), sum, count
+            entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def state(self):
+        state = Metric.state(self)
+        state['buckets'] = [b if b != math.inf else 'inf' for b in self.buckets]
+        return state
+
+
+class Registry(object):
+    """All the metrics of the process. Metrics are made with ``counter()``, ``gauge()`` and ``histogram()``, which return the
+    existing one if there's already a metric by that name.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher = None # (pid, directory) the flushing thread was started for
+
+    def _add(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(self, name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), **kwargs):
+        return self._add(Histogram, name, help, labels, **kwargs)
+
+    def state(self):
+        """The values of all metrics, as a dict of name -> ``Metric.state()``."""
+        with self._lock:
+            return dict((name, metric.state()) for name, metric in self._metrics.items())
+
+    def reset(self):
+        """Forget all values (the metrics stay)."""
+        with self._lock:
+            for metric in self._metrics.values():
+                metric._values.clear()
+
+    def dump(self, directory):
+        """Write the values of this process to its file in `directory` (replacing it in one go, so readers never see half of it)."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump(dict(pid=os.getpid(), time=time.time(), metrics=self.state()), f)
+        os.replace(path + '.tmp', path)
+
+    def start_flushing(self, directory, interval):
+        """Make sure this process writes its values to `directory` every `interval` seconds (and when it exits).
+        Cheap to call on every request: the thread is only started once per process (and again in a forked child).
+        """
+        if self._flusher == (os.getpid(), directory):
+            return
+        with self._lock:
+            if self._flusher == (os.getpid(), directory):
+                return
+            self._flusher = (os.getpid(), directory)
+        def flush():
+            while self._flusher == (os.getpid(), directory):
+                time.sleep(interval)
+                try:
+                    self.dump(directory)
+                except OSError:
+                    pass
+        thread = threading.Thread(target=flush)
+        thread.daemon = True
+        thread.start()
+        atexit.register(self.dump, directory)
+
+    def render(self, directory=None):
+        """All metrics in the Prometheus text format: of this process, or added up over all processes writing to `directory`."""
+        if directory is None:
+            return exposition(self.state())
+        self.dump(directory)
+        remove_dead(directory)
+        return exposition(aggregate(load_states(directory)))
+
+
+def pid_alive(pid):
+    """Check if a process is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def load_states(directory):
+    """The files written by ``Registry.dump()`` in `directory`, as a list of dicts (files being replaced or broken are skipped)."""
+    states = []
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                states.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return states
+
+def mark_process_dead(directory, pid):
+    """Add the counters and histograms of the process `pid`, which has exited, to ``dead.json`` in `directory` and remove its file.
+    Returns False if it had no file (anymore).
+    """
+    path = os.path.join(directory, '%d.json' % pid)
+    dead = os.path.join(directory, 'dead.json')
+    with open(os.path.join(directory, 'dead.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX) # every process may be cleaning up after the same one
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError:
+            state = dict(metrics={}) # half written when it died, nothing to keep
+        states = [dict(pid=pid, metrics=dict((name, metric) for name, metric in state['metrics'].items() if metric['type'] != 'gauge'))]
+        try:
+            with open(dead) as f:
+                states.append(json.load(f))
+        except FileNotFoundError:
+            pass
+        with open(dead + '.tmp', 'w') as f:
+            json.dump(dict(pid=None, time=time.time(), metrics=aggregate(states)), f)
+        os.replace(dead + '.tmp', dead)
+        os.unlink(path)
+    return True
+
+def remove_dead(directory):
+    """``mark_process_dead()`` for every process with a file in `directory` that's no longer running. Returns their PIDs."""
+    removed = []
+    for filename in os.listdir(directory):
+        name, ext = os.path.splitext(filename)
+        if ext == '.json' and name.isdigit() and int(name) != os.getpid() and not pid_alive(int(name)):
+            if mark_process_dead(directory, int(name)):
+                removed.append(int(name))
+    return removed
+
+def aggregate(states):
+    """Add up the metrics of several processes (``load_states()``) into one ``Registry.state()``-like dict.
+    Gauges of processes that are no longer running are left out.
+    """
+    merged = {}
+    for state in states:
+        alive = None
+        for name, metric in state['metrics'].items():
+            if metric['type'] == 'gauge':
+                if alive is None:
+                    alive = pid_alive(state['pid'])
+                if not alive:
+                    continue
+            total = merged.setdefault(name, dict(metric, values={}))
+            for key, value in metric['values']:
+                key = tuple(key)
+                if key not in total['values']:
+                    total['values'][key] = value
+                elif metric['type'] == 'histogram':
+                    total['values'][key] = [a + b for a, b in zip(total['values'][key], value)]
+                else:
+                    total['values'][key] += value
+    for metric in merged.values():
+        metric['values'] = [[list(key), value] for key, value in metric['values'].items()]
+    return merged
+
+def exposition(state):
+    """Turn a ``Registry.state()`` into the Prometheus text format."""
+    lines = []
+    for name in sorted(state):
+        metric = state[name]
+        lines.append('# HELP %s %s' % (name, metric['help'].replace('\\', '\\\\').replace('\n', '\\n')))
+        lines.append('# TYPE %s %s' % (name, metric['type']))
+        for key, value in sorted(metric['values']):
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric['buckets'], value):
+                    cumulative += count
+                    le = '+Inf' if bound == 'inf' else format_value(bound)
+                    lines.append('%s_bucket%s %s' % (name, format_labels(metric['labels'], key, [('le', le)]), format_value(cumulative)))
+                lines.append('%s_sum%s %s' % (name, format_labels(metric['labels'], key), format_value(value[-2])))
+                lines.append('%s_count%s %s' % (name, format_labels(metric['labels'], key), format_value(value[-1])))
+            else:
+                lines.append('%s%s %s' % (name, format_labels(metric['labels'], key), format_value(value)))
+    return '\n'.join(lines) + '\n'
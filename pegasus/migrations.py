@@ -0,0 +1,124 @@
+"""
+Migrations
+-----------
+Versioned upgrades for live databases, so schema changes don't mean dropping everything and running schema.sql again.
+The version of a database is kept in ``PRAGMA user_version``: schema.sql creates version 0 (the original tables), and every
+migration in ``MIGRATIONS`` takes it one version further. Each migration runs in its own transaction together with the version bump,
+so a failed migration leaves the database exactly as it was.
+
+To change the schema, append a migration here (never edit one that has been released) and run ``./init_db.py --upgrade``.
+"""
+import sqlite3
+
+
+MIGRATIONS = [
+    (1, 'Indexes for the board_content delta query and invite/board lookups', [
+        # get_components / update streams: changes of a board since the last poll. Also used by the board_content cascade when a board is deleted.
+        'create index if not exists board_content_board_modified on board_content (boardID, last_modified_at)',
+        # is_authorized, index, remove_self, edit_profile: invites of an email (covers the access type too).
+        'create index if not exists invites_email_board on invites (userEmail, boardID, type)',
+        # invited_users: invites of a board in order. Also used by the invites cascade when a board is deleted.
+        'create index if not exists invites_board_date on invites (boardID, invite_date, userEmail, type)',
+        # show_profile: boards created by a user.
+        'create index if not exists boards_creator on boards (creatorID, id, title)',
+        'analyze',
+    ]),
+    (2, 'Per-board revision counter for component deltas', [
+        'alter table boards add column revision integer not null default 0',
+        'alter table board_content add column revision integer not null default 0',
+        # existing rows: ids only go up, so they make a good starting revision
+        'update board_content set revision = id',
+        'update boards set revision = coalesce((select max(revision) from board_content where board_content.boardID = boards.id), 0)',
+        'create index if not exists board_content_board_revision on board_content (boardID, revision)',
+    ]),
+    (3, 'Fencing token of the last locked write to a board', [
+        # locks themselves moved out of the database (locks.py), locked_until and locked_by are no longer used
+        'alter table boards add column lock_token integer not null default 0',
+    ]),
+    (4, 'Index for paging through the chat of a board', [
+        # get_components: latest chat messages of a board, and the ones before a given ID when scrolling back.
+        'create index if not exists board_content_board_type on board_content (boardID, type, id)',
+    ]),
+    (5, 'Archiving of finished boards and purging of deleted components (maintenance.py)', [
+        'alter table boards add column archived_at datetime',
+        # highest revision of a deleted component that was purged: clients behind it get the whole board again
+        'alter table boards add column purged_rev integer not null default 0',
+        # boards done but not archived yet
+        'create index if not exists boards_archive on boards (archived_at, done_at)',
+        # deleted components past their grace period. Partial, so it only holds the deleted ones (queries must say deleted='Y' literally to use it).
+        "create index if not exists board_content_tombstones on board_content (last_modified_at) where deleted = 'Y'",
+        # when the last pass ran, so only one process runs each
+        'create table if not exists maintenance (id integer primary key check (id = 1), last_run real not null default 0)',
+        'insert or ignore into maintenance (id) values (1)',
+    ]),
+    (6, 'Log of board revision changes for the data_version bus (bus.py)', [
+        # one row per board, replaced (with a new seq) on every change, so readers only ask for what's past the last seq they saw.
+        # AUTOINCREMENT, so a replaced row never gets back a seq that was handed out already.
+        'create table if not exists board_changes (seq integer primary key autoincrement, boardID integer not null unique, revision integer)',
+        'create trigger if not exists board_changes_revision after update of revision on boards when new.revision != old.revision begin '
+        'insert or replace into board_changes (boardID, revision) values (new.id, new.revision); end',
+        # revision null: the board was deleted
+        'create trigger if not exists board_changes_delete after delete on boards begin '
+        'insert or replace into board_changes (boardID, revision) values (old.id, null); end',
+    ]),
+    (7, 'Log of access changes for the data_version bus (bus.py)', [
+        # written by the bus itself (access events don't come from a single row), and pruned once they're older than any cached decision
+        'create table if not exists access_changes (seq integer primary key autoincrement, boardID integer, userID integer, email text, changed_at real not null)',
+        'create index if not exists access_changes_changed on access_changes (changed_at)',
+    ]),
+]
+"""Ordered list of (version, description, steps). Steps are either a list of SQL statements or a function that takes the connection."""
+
+
+class MigrationError(Exception):
+    """A migration failed (and was rolled back)."""
+    pass
+
+
+def latest_version():
+    """The version a fully upgraded database has."""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def current_version(db):
+    """The version of the database `db` is connected to."""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def pending(db):
+    """List of (version, description) of the migrations that haven't been applied to the database yet."""
+    version = current_version(db)
+    return [(v, description) for v, description, steps in MIGRATIONS if v > version]
+
+def upgrade(db, target=None):
+    """Apply all pending migrations (up to `target`, if given) in order, each in its own transaction.
+    Safe to run while the app is serving requests: each migration takes the write lock (``BEGIN IMMEDIATE``) and checks the version again,
+    so two processes upgrading at the same time don't apply anything twice.
+    Returns the list of versions applied. Raises ``MigrationError`` if one fails, after rolling it back.
+    """
+    applied = []
+    isolation_level = db.isolation_level
+    db.isolation_level = None # we handle the transactions ourselves
+    try:
+        for version, description, steps in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            if version <= current_version(db):
+                continue
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                if version <= current_version(db): # someone else got here first
+                    db.execute('ROLLBACK')
+                    continue
+                if callable(steps):
+                    steps(db)
+                else:
+                    for statement in steps:
+                        db.execute(statement)
+                db.execute('PRAGMA user_version = %d' % version)
+                db.execute('COMMIT')
+            except sqlite3.Error as e:
+                db.execute('ROLLBACK')
+                raise MigrationError('Migration %d (%s) failed: %s' % (version, description, e.args[0]))
+            applied.append(version)
+    finally:
+        db.isolation_level = isolation_level
+    return applied
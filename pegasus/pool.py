@@ -0,0 +1,101 @@
+"""
+Pool
+-----
+A small, thread-safe pool of SQLite connections.
+Opening a connection and setting it up (PRAGMAs) is done once per connection instead of once per request.
+The pool is bounded: when all connections are checked out, ``checkout()`` waits for one to be returned and gives up
+with ``PoolTimeout`` after a while, instead of opening more and more connections under load.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """No connection was returned to the pool in time."""
+    pass
+
+
+class ConnectionPool(object):
+    """Pool of at most `size` connections created by calling `connect`.
+    Connections that have been idle for more than `ping_after` seconds are checked (``select 1``) before being handed out,
+    and connections that can't be rolled back when returned are thrown away.
+    """
+
+    def __init__(self, connect, size=10, timeout=10, ping_after=60):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = queue.LifoQueue() # last returned is the first to be reused
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def checkout(self, timeout=None):
+        """Get a connection from the pool, opening a new one if none is idle.
+        Raises ``PoolTimeout`` if all `size` connections are in use for longer than `timeout` (defaults to the pool's).
+        """
+        if not self._slots.acquire(timeout=self.timeout if timeout is None else timeout):
+            raise PoolTimeout('All %d database connections are in use.' % self.size)
+        try:
+            while True:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                if time.time() - idle_since < self.ping_after or self._healthy(conn):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, conn):
+        """Return a connection to the pool. Anything left uncommitted on it is rolled back."""
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+        else:
+            if self._closed:
+                self._discard(conn)
+            else:
+                self._idle.put((conn, time.time()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a ``with`` block."""
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def close(self):
+        """Close all idle connections. Connections still checked out are closed when they're returned."""
+        self._closed = True
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def _healthy(self, conn):
+        """Check that a connection still works."""
+        try:
+            conn.execute('select 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        """Close a connection that won't be reused, ignoring errors (it may be broken already)."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
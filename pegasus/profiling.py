@@ -0,0 +1,160 @@
+"""
+Profiling
+----------
+Profiling single requests on a live server, to find out where a slow view spends its time without slowing down all the others.
+A request is profiled when it carries the ``X-Profile`` header with the secret ``PROFILE_TOKEN``, or for a random ``PROFILE_RATE``
+of all requests. Everything else runs as usual, with no profiler around.
+
+Two profilers (``PROFILER``):
+    - 'sampling': a background thread looks at the request thread's stack every ``PROFILE_INTERVAL`` seconds, and the stacks seen are
+      saved as collapsed stacks (``a;b;c count`` lines, what flamegraph.pl and speedscope read). Little overhead, but short requests get few samples.
+    - 'cprofile': the request runs under ``cProfile``, and its ``pstats`` file is saved. Exact call counts, but it slows the request down.
+
+Profiles are saved in ``PROFILE_DIR``, a directory per endpoint, keeping only the last ``PROFILE_KEEP`` of each endpoint.
+profile_pegasus.py adds them up.
+"""
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_name(frame):
+    """How a stack frame shows up in collapsed stacks: function (file:line where it starts)."""
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+def collapse(frame):
+    """The stack that ends in `frame`, as the semicolon separated names of its frames from the outermost in."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame).replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(object):
+    """Samples the stack of thread `thread_id` every `interval` seconds, from ``start()`` to ``stop()``."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling. Returns the stacks seen, as a ``Counter`` of collapsed stack -> samples."""
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+
+class RequestProfiler(object):
+    """Profiles the calling thread with `kind` ('sampling' or 'cprofile') from ``start()`` to ``stop()``."""
+
+    def __init__(self, kind='sampling', interval=0.005):
+        if kind not in ('sampling', 'cprofile'):
+            raise ValueError('Unknown profiler: %r' % kind)
+        self.kind = kind
+        self.interval = interval
+        self._profiler = None
+
+    def start(self):
+        """Start profiling. Returns False if it couldn't (another cProfile is running in this thread, for example)."""
+        if self.kind == 'sampling':
+            self._profiler = Sampler(threading.get_ident(), self.interval)
+            self._profiler.start()
+            return True
+        self._profiler = cProfile.Profile()
+        try:
+            self._profiler.enable()
+        except ValueError:
+            self._profiler = None
+            return False
+        return True
+
+    def stop(self):
+        """Stop profiling. Returns what to save: collapsed stacks (a ``Counter``) or the ``cProfile.Profile``."""
+        profiler, self._profiler = self._profiler, None
+        if self.kind == 'sampling':
+            return profiler.stop()
+        profiler.disable()
+        return profiler
+
+
+EXTENSIONS = {'sampling': '.collapsed', 'cprofile': '.pstats'}
+
+
+class ProfileStore(object):
+    """Profiles on disk, in a directory per endpoint under `directory`, keeping the last `keep` of each endpoint.
+    File names start with the time they were saved, so they sort oldest first (and processes sharing the directory don't collide).
+    """
+
+    def __init__(self, directory, keep=20):
+        self.directory = directory
+        self.keep = keep
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def save(self, endpoint, kind, result):
+        """Save what a ``RequestProfiler`` of `kind` returned for a request to `endpoint`, and drop the oldest ones past ``keep``.
+        Returns the path of the file.
+        """
+        folder = os.path.join(self.directory, endpoint.replace(os.sep, '_'))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, '%020d-%d-%d%s' % (time.time() * 1e6, os.getpid(), next(self._seq), EXTENSIONS[kind]))
+        if kind == 'sampling':
+            with open(path + '.tmp', 'w') as f:
+                f.writelines('%s %d\n' % (stack, count) for stack, count in result.items())
+        else:
+            result.dump_stats(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            files = sorted(f for f in os.listdir(folder) if not f.endswith('.tmp'))
+            for old in files[:max(len(files) - self.keep, 0)]:
+                try:
+                    os.unlink(os.path.join(folder, old))
+                except OSError:
+                    pass # another process got to it first
+        return path
+
+    def endpoints(self):
+        """The endpoints that have profiles."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, name)))
+
+    def files(self, endpoints=None, kind='sampling'):
+        """Paths of the saved profiles of `kind` for `endpoints` (all of them by default)."""
+        paths = []
+        for endpoint in endpoints or self.endpoints():
+            folder = os.path.join(self.directory, endpoint)
+            if os.path.isdir(folder):
+                paths += [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(EXTENSIONS[kind])]
+        return paths
+
+
+def merge_collapsed(paths, prefix=None):
+    """Add up collapsed stack files into one ``Counter``. With `prefix`, every stack starts with it (the endpoint, say)."""
+    stacks = Counter()
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[prefix + ';' + stack if prefix else stack] += int(count)
+    return stacks
@@ -1,3 +1,9 @@
+/* Version 0 of the schema. Don't change it for existing tables, add a migration in migrations.py instead (init_db() runs them right after this). */
+PRAGMA user_version = 0;
+
+drop table if exists access_changes;
+drop table if exists board_changes;
+drop table if exists maintenance;
 drop table if exists invites;
 drop table if exists board_content;
 drop table if exists boards;
@@ -171,29 +171,60 @@ var TextElement = function(softID, canvasID, boardID, invite, canEdit){ // canEd
 		if(self.editable){
 			var posToString = JSON.stringify(position);
 			self.position = posToString;
-			$.ajax({
-				method: 'POST',
-				url: Flask.url_for('edit_component', {boardID:self.boardID, componentID:self.elementID}),
-				async: false,
-				data:{
-					'_csrf_token': $("input[name='_csrf_token']").val(),
-					'invite': self.invite,
-					'content-type': 'text',
-					'hasMessages': 'false',
-					'position': posToString
-				},
-				success: function(data){
-					if(data.error == 'None'){
-						console.log("Successfully updated position!");
-					}
-					else{
-						$(self.canvasID).prepend('<div id="board-error" class="alert alert-warning">'
-												+'<a href="#" class="close" data-dismiss="alert" aria-label="close">&times;</a>'
-												+'<strong>Error: </strong>'+data.error+'</div>');
-					}
-					$("input[name='_csrf_token']").val(data.token);
-				}
-			});
+			queueMove(self.boardID, self.invite, self.canvasID, {'op': 'move', 'id': self.elementID, 'content-type': 'text', 'position': posToString});
 		}
 	}
-};
\ No newline at end of file
+};
+// BATCH
+// Send several component changes (see batch_components) in one request, e.g. when a group of elements is dragged.
+// operations: [{op: 'insert'|'update'|'move'|'delete', id: ..., 'content-type': ..., message: ..., position: ...}, ...]
+var sendBatch = function(boardID, invite, operations, callback){
+	$.ajax({
+		method: 'POST',
+		async: false, // like every other request here: each one rotates the CSRF token the next one needs
+		url: Flask.url_for('batch_components', {boardID:boardID}),
+		data:{
+			'_csrf_token': $("input[name='_csrf_token']").val(),
+			'invite': invite,
+			'operations': JSON.stringify(operations)
+		},
+		success: function(data){
+			$("input[name='_csrf_token']").val(data.token);
+			if(callback){
+				callback(data);
+			}
+		}
+	});
+};
+// Moves are held for MOVE_DELAY ms and sent together, so dragging several elements one after another is one request (and one lock check).
+var MOVE_DELAY = 250;
+var MOVE_QUEUE = {}; // boardID: {invite, canvasID, operations (by component ID, the latest move wins), timer}
+var queueMove = function(boardID, invite, canvasID, operation){
+	var queued = MOVE_QUEUE[boardID];
+	if(!queued){
+		queued = MOVE_QUEUE[boardID] = {invite: invite, canvasID: canvasID, operations: {}, timer: null};
+	}
+	queued.operations[operation.id] = operation;
+	clearTimeout(queued.timer);
+	queued.timer = setTimeout(function(){
+		delete MOVE_QUEUE[boardID];
+		var operations = [];
+		for(var id in queued.operations){
+			operations.push(queued.operations[id]);
+		}
+		sendBatch(boardID, queued.invite, operations, function(data){
+			var error = data.error;
+			for(var i=0; error == 'None' && i<data.results.length; i++){
+				error = data.results[i].error;
+			}
+			if(error == 'None'){
+				console.log("Successfully updated " + operations.length + " position(s)!");
+			}
+			else{
+				$(queued.canvasID).prepend('<div id="board-error" class="alert alert-warning">'
+										+'<a href="#" class="close" data-dismiss="alert" aria-label="close">&times;</a>'
+										+'<strong>Error: </strong>'+error+'</div>');
+			}
+		});
+	}, MOVE_DELAY);
+};
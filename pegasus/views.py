@@ -31,7 +31,7 @@ In order for the following to make sense, here's the database schema/logic:
         |               |   - Done_at (Created_at + 24hrs at creation)                                                                                                             |
         |   BOARDS      |   - Locked_until (Locks are placed when someone edits the board and last 5 seconds to prevent editing the same thing at the same time by someone else.   |
         |               |    This column defaults to date of creation and is changed later)                                                                                        |
-        |               |   - Locked_by (Who, in terms of userID or email, was the last to lock the board)                                                                         |
+        |               |   - Locked_by (Who, in terms of userID or email, was the last to lock the board). Both lock columns are unused now, see locks.py                         |
         +---------------+----------------------------------------------------------------------------------------------------------------------------------------------------------+
         |               |   - ID                                                                                                                                                   |
         |               |   - BoardID                                                                                                                                              |
@@ -50,15 +50,24 @@ In order for the following to make sense, here's the database schema/logic:
         |               |   - Type (view or edit)                                                                                                                                  |
         +---------------+----------------------------------------------------------------------------------------------------------------------------------------------------------+
 """
-from pegasus import app
+from pegasus import app, get_pool, get_locks, get_bus, get_maintenance, checkout_db, release_db, sql_recorder, metrics_registry
+from pegasus.events import board_events
+from pegasus.cache import LRUCache
+from pegasus.coalesce import PositionBuffer
+from pegasus.locks import LockLost
+from pegasus.hashing import HashingPool, HashingBusy, needs_rehash
+from pegasus.export import ExportPool, ExportBusy, ExportUnavailable, FORMATS
+from pegasus import dump
 import sqlite3
 import uuid
 import string
 import random
-from flask import request, session, g, redirect, url_for, abort, render_template, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+from flask import request, session, g, redirect, url_for, abort, render_template, flash, jsonify, json, Response
 from datetime import datetime, timedelta
 from itertools import islice
+import atexit
+import zlib
 
 
 
@@ -76,6 +85,44 @@ def generate_csrf_token():
 app.jinja_env.globals['csrf_token'] = generate_csrf_token
 """Whenever `{{ csrf_token() }}` is used in a Jinja2 template, it returns the result of the function `generate_csrf_token()` """
 
+component_cache = LRUCache(app.config['COMPONENT_CACHE_SIZE'])
+"""Snapshots of the components of busy boards, kept up to date by the write paths: boardID -> (revision, components in the order they changed)."""
+
+auth_cache = LRUCache(app.config['AUTH_CACHE_SIZE'], ttl=app.config['AUTH_CACHE_TTL'])
+"""Access decisions: (boardID, 'user', userID) or (boardID, 'invite', inviteID) -> what ``get_access()`` returns."""
+
+hashing_pool = HashingPool(app.config['HASH_WORKERS'], app.config['HASH_MAX_PENDING'])
+"""Where passwords are hashed and checked (see hashing.py)."""
+
+def hash_password(password):
+    """Hash a password with ``PASSWORD_HASH_METHOD`` in the hashing pool. Aborts with 503 if the pool is too busy."""
+    try:
+        return hashing_pool.hash(password, app.config['PASSWORD_HASH_METHOD'])
+    except HashingBusy:
+        abort(503)
+
+def check_password(pwhash, password):
+    """Check a password against its stored hash in the hashing pool. Aborts with 503 if the pool is too busy."""
+    try:
+        return hashing_pool.check(pwhash, password)
+    except HashingBusy:
+        abort(503)
+
+export_pool = ExportPool(app.config['EXPORT_WORKERS'], app.config['EXPORT_MAX_PENDING'], app.config['EXPORT_CACHE_SIZE'])
+"""Where board exports are rendered and cached (see export.py)."""
+
+def load_board_export(boardID, title, pending):
+    """Read what ``export.py`` renders for a board titled `title`: its components that weren't deleted, with the author's username
+    (or email, for invitees) and the positions of the `pending` moves (from ``position_buffer``) applied.
+    """
+    curList = g.db.execute('select c.id, c.type, c.content, c.position, c.created_at, coalesce(u.username, c.userEmail) from board_content c left join users u on u.id=c.userID where c.boardID=? and c.deleted=? order by c.id', [boardID, 'N']).fetchall()
+    components = []
+    for row in curList:
+        move = pending.get(row[0])
+        position = move['position'] if move is not None and move['type'] == row[1] else row[3]
+        components.append(dict(type=row[1], content=row[2], position=position, created_at=row[4], author=row[5]))
+    return dict(title=title, components=components)
+
 def login_user(username):
     """Login user using their username. Put username and userid (find in database) in their respective sessions."""
     session['logged_in'] = True
@@ -87,22 +134,372 @@ def login_user(username):
 
 def is_owner(boardID, userID):
     """Check if a user is the owner of a certain board."""
-    cur = g.db.execute('select creatorID from boards where id=?', [boardID]).fetchone()[0]
-    if cur == userID:
-        return True
+    return get_access(boardID, userID=userID)['isOwner']
+
+def get_access(boardID, userID=None, invite=None):
+    """Find out what access a logged in user (`userID`) or an invite (`invite`, its ID) has to a board.
+    Returns a dict that includes isOwner (boolean), accessType ('edit', 'view', or None for no access), and email (of the user or invitee, None for owners).
+    Decisions are remembered for the rest of the request and, in ``auth_cache``, for ``AUTH_CACHE_TTL`` seconds.
+    Views that change who can access what call ``invalidate_access()``.
+    """
+    key = access_key(boardID, userID, invite)
+    access = cached_access(key)
+    if access is None:
+        state = load_board_state(boardID, userID, invite)
+        access = remember_access(key, state if state is not None else {'isOwner':False, 'accessType':None, 'email':None})
+    return access
+
+def board_state(boardID, userID=None, invite=None):
+    """Everything the component views need to know about a board before reading or writing it, in one query:
+    done_at, revision, purged_rev (see maintenance.py) and title of the board, plus the access of the caller (same keys as ``get_access()``) and the board's `lock` (a ``locks.Lease``, None if it's free).
+    Returns None if there's no such board. If the access decision is cached, only the board row is read.
+    """
+    key = access_key(boardID, userID, invite)
+    access = cached_access(key)
+    if access is None:
+        state = load_board_state(boardID, userID, invite)
+        if state is not None:
+            remember_access(key, state)
+    else:
+        cur = g.db.execute('select done_at, revision, purged_rev, title from boards where id=?', [boardID]).fetchone()
+        if cur is None:
+            return None
+        state = {'done_at':cur[0], 'revision':cur[1], 'purged_rev':cur[2], 'title':cur[3]}
+        state.update(access)
+    if state is not None:
+        state['lock'] = get_locks().holder(int(boardID))
+    return state
+
+def load_board_state(boardID, userID=None, invite=None):
+    """Read a board and the access of a user or invite to it with a single joined query (see ``board_state()``). None if there's no such board."""
+    if userID is not None:
+        cur = g.db.execute('select b.done_at, b.revision, b.creatorID, u.email, i.type, b.purged_rev, b.title from boards b left join users u on u.id=? left join invites i on i.boardID=b.id and i.userEmail=u.email where b.id=?', [userID, boardID]).fetchone()
+    else:
+        cur = g.db.execute('select b.done_at, b.revision, b.creatorID, i.userEmail, i.type, b.purged_rev, b.title from boards b left join invites i on i.id=? and i.boardID=b.id where b.id=?', [invite, boardID]).fetchone()
+    if cur is None:
+        return None
+    state = {'done_at':cur[0], 'revision':cur[1], 'purged_rev':cur[5], 'title':cur[6], 'isOwner':False, 'accessType':cur[4], 'email':cur[3]}
+    if userID is not None and cur[2] == userID:
+        state.update(isOwner=True, accessType='edit', email=None)
+    return state
+
+def access_key(boardID, userID=None, invite=None):
+    """Key of an access decision in the caches."""
+    return (int(boardID), 'user', userID) if userID is not None else (int(boardID), 'invite', invite)
+
+def cached_access(key):
+    """Get an access decision from the request's cache or ``auth_cache``, None if it's in neither."""
+    requestCache = getattr(g, 'access', None)
+    if requestCache is None:
+        requestCache = g.access = {}
+    access = requestCache.get(key)
+    if access is None and app.config['AUTH_CACHE_TTL']:
+        access = auth_cache.get(key)
+        if access is not None:
+            requestCache[key] = access
+    return access
+
+def remember_access(key, state):
+    """Cache the access part of `state` (a ``board_state()`` or ``get_access()`` dict) for the request and the process. Returns it."""
+    access = {'isOwner':state['isOwner'], 'accessType':state['accessType'], 'email':state['email']}
+    if app.config['AUTH_CACHE_TTL']:
+        auth_cache.set(key, access)
+    g.access[key] = access
+    return access
+
+def invalidate_access(boardID=None, userID=None, email=None):
+    """Forget the cached access decisions about a board, a user, and/or the invites of an email, after they've changed. Other processes are told through the change bus."""
+    g.access = {}
+    get_bus().publish(dict(kind='access', board=boardID, user=userID, email=email))
+
+def forget_access(boardID=None, userID=None, email=None):
+    """Drop the decisions of ``auth_cache`` that ``invalidate_access()`` (in this process or another) said changed."""
+    def stale(key, access):
+        return key[0] == boardID or (key[1] == 'user' and key[2] == userID) or (email is not None and access['email'] == email)
+    auth_cache.discard_where(stale)
+
+lock_attempts = metrics_registry.counter('pegasus_lock_attempts_total', 'Attempts to take (or renew) a board edit lock, by result: acquired or denied (someone else holds it).', ['result'])
+polls = metrics_registry.counter('pegasus_polls_total', 'get_components answers, by result (changes or empty, meaning "Nothing new.") and mode (poll or long_poll).', ['result', 'mode'])
+
+def lock_board(boardID, who):
+    """Lock the board for `who` (a user ID as a string, or an invitee's email) for ``LOCK_LEASE_SECONDS``, or renew their lock.
+    Called after making sure the user has editing access. Locks are kept by ``get_locks()`` (see locks.py), not in the database.
+    Returns the fencing token of the lock, or None if someone else holds it.
+    """
+    token = get_locks().acquire(int(boardID), who)
+    if app.config['METRICS_ENABLED']:
+        lock_attempts.inc(result='denied' if token is None else 'acquired')
+    return token
+
+def board_changed(boardID, componentID=None, revision=None):
+    """Called after a write to a board is committed. Wakes up everyone waiting for changes on that board (update streams, long-polls),
+    in this process and, through the change bus, the others.
+    If a component was written (with `revision`), the cached snapshot of the board is brought up to date with it too.
+    """
+    if componentID is not None and app.config['COMPONENT_CACHE_ENABLED']:
+        cache_component(boardID, componentID, revision)
+    get_bus().publish(dict(kind='board', board=int(boardID), revision=revision))
+
+def on_change(event):
+    """Subscriber of the change bus: handles the events of this process and of the others (see bus.py).
+    Board events wake up whoever is waiting on the board. Component snapshots need nothing, as readers compare them with the board's revision.
+    """
+    if event.get('kind') == 'board':
+        board_events.notify(event['board'])
+    elif event.get('kind') == 'access':
+        forget_access(event.get('board'), event.get('user'), event.get('email'))
+
+def component_from_row(row):
+    """Turn a board_content row (columns in the order used by all component queries) into the dict sent to clients."""
+    return dict(id=row[0], content=row[1], userID=row[2], userEmail=row[3], created_at=row[4], last_modified_at=row[5], last_modified_by=row[6], type=row[7], position=row[8], deleted=row[9], revision=row[10])
+
+def cache_component(boardID, componentID, revision):
+    """Write-through for ``component_cache``: add a component written at `revision` to the cached snapshot of its board.
+    Only works if the snapshot is at the revision right before. If another write got in between, the snapshot is left as it is
+    and ``get_board_snapshot()`` catches it up with both.
+    The snapshot list is replaced rather than changed, so readers holding the old one are not affected.
+    """
+    if boardID not in component_cache:
+        return
+    row = g.db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where id=?', [componentID]).fetchone()
+    def apply(snapshot):
+        snapRevision, components = snapshot
+        if row is None or row[10] != revision or snapRevision != revision - 1: # nothing was written, or we missed a write
+            return snapshot
+        return (revision, [c for c in components if c['id'] != componentID] + [component_from_row(row)])
+    component_cache.update(boardID, apply)
+
+def get_board_snapshot(db, boardID, revision):
+    """Get all components of a board as of `revision` (or later), in the order they changed.
+    They come from ``component_cache`` if it has that revision. A cached snapshot that's behind (written to by another process) is
+    caught up with the components changed since (deletions are changes too, ``deleted='Y'``), otherwise the whole board is read and cached.
+    (Components purged by maintenance stay in the snapshots of other processes as deleted ones, which is what clients would see anyway.)
+    """
+    cache = app.config['COMPONENT_CACHE_ENABLED']
+    if cache:
+        cached = component_cache.get(boardID)
+        if cached is not None and cached[0] >= revision:
+            return cached[1]
+        if cached is not None:
+            curList = db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and revision > ? order by revision', [boardID, cached[0]]).fetchall()
+            changed = [component_from_row(row) for row in curList]
+            changedIDs = set(c['id'] for c in changed)
+            components = [c for c in cached[1] if c['id'] not in changedIDs] + changed
+            newRevision = max([revision, cached[0]] + [c['revision'] for c in changed])
+            component_cache.update(boardID, lambda snapshot: (newRevision, components) if snapshot[0] < newRevision else snapshot)
+            return components
+    curList = db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? order by revision', [boardID]).fetchall()
+    components = [component_from_row(row) for row in curList]
+    if cache:
+        # rows committed after the board was read are in there too (writes commit in revision order)
+        component_cache.set(boardID, (max([revision] + [c['revision'] for c in components]), components))
+    return components
+
+def is_locked(lock, who):
+    """Check if a board is locked for `who`, meaning someone else holds its `lock` (a ``locks.Lease`` or None)."""
+    return lock is not None and lock.holder != who
+
+def lock_time_left(lock):
+    """Seconds until a board lock runs out (0 if there's none)."""
+    return max(lock.expires - time.time(), 0) if lock is not None else 0
+
+class BoardGone(Exception):
+    """A write was made to a board that has been deleted (by another request or process) since it was read."""
+    pass
+
+def next_revision(boardID, token=None):
+    """Bump the revision of a board and return the new one, to be stored with the component being written.
+    Has to happen in the same transaction as that write (commit after both): the update takes SQLite's write lock, so no two writes get the same revision.
+    Writes made under the board's lock pass its fencing `token`, and raise ``LockLost`` if a write with a newer token was made since.
+    Raises ``BoardGone`` if there's no such board anymore.
+    """
+    if token is None:
+        updated = g.db.execute('update boards set revision=revision+1 where id=?', [boardID]).rowcount
+    else:
+        updated = g.db.execute('update boards set revision=revision+1, lock_token=? where id=? and lock_token<=?', [token, boardID, token]).rowcount
+    cur = g.db.execute('select revision from boards where id=?', [boardID]).fetchone()
+    if cur is None:
+        raise BoardGone('Board %s was deleted.' % boardID)
+    if updated == 0:
+        raise LockLost('Board %s was locked by someone else in the meantime.' % boardID)
+    return cur[0]
+
+def get_board_changes(db, boardID, lastModified=0, sinceRev=None, revision=None):
+    """Get the components of a board that changed after revision `sinceRev`, in the order they changed, as a list of dicts.
+    If the current `revision` of the board is known, they're taken from its (cached) snapshot instead of queried.
+    Older clients that don't send a revision get the ones modified after the date `lastModified` instead (oldest first).
+    Takes the database connection as an argument so it can be used outside of a request (update streams).
+    """
+    if sinceRev is not None and revision is not None and app.config['COMPONENT_CACHE_ENABLED']:
+        changes = []
+        for component in reversed(get_board_snapshot(db, boardID, revision)):
+            if component['revision'] <= sinceRev:
+                break
+            changes.append(component)
+        changes.reverse()
+        return changes
+    elif sinceRev is not None:
+        curList = db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and revision > ? order by revision', [boardID, sinceRev]).fetchall()
+    else:
+        curList = db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and last_modified_at > ? order by created_at', [boardID, lastModified]).fetchall()
+    return [component_from_row(row) for row in curList]
+
+def is_first_load(lastModified='0', sinceRev=None):
+    """Check if a client asking for the changes after `sinceRev` (or `lastModified`) has nothing of the board yet."""
+    return sinceRev == 0 or (sinceRev is None and lastModified == '0')
+
+def is_behind_purge(sinceRev, purgedRev):
+    """Check if a client asking for the changes after `sinceRev` missed deletions that maintenance has purged since (the board's `purgedRev`, see maintenance.py).
+    Such clients need the whole board again. (Older clients asking by ``lastModified`` can't be told, they keep what was deleted until they reload.)
+    """
+    return sinceRev is not None and 0 < sinceRev < purgedRev
+
+def get_chat_page(db, boardID, before=None, limit=None):
+    """Get the latest `limit` (``CHAT_PAGE_SIZE``) chat messages of a board, or the latest ones before the message with ID `before`, oldest first.
+    Returns them with the ID to pass as `before` for the ones before them, or None if there are none.
+    """
+    limit = limit or app.config['CHAT_PAGE_SIZE']
+    if before is None:
+        curList = db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and type=? order by id desc limit ?', [boardID, 'chat', limit + 1]).fetchall()
+    else:
+        curList = db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and type=? and id<? order by id desc limit ?', [boardID, 'chat', before, limit + 1]).fetchall()
+    messages = [component_from_row(row) for row in reversed(curList[:limit])]
+    return messages, messages[0]['id'] if len(curList) > limit else None
+
+def get_first_load(db, boardID, revision):
+    """Get what a client that has nothing of a board yet needs: all of its canvas components, but only the latest page of chat (``get_chat_page()``).
+    Returns the components in the order they changed, and the ID to pass as `before` for earlier chat (None if there is none).
+    """
+    limit = app.config['CHAT_PAGE_SIZE']
+    if app.config['COMPONENT_CACHE_ENABLED']:
+        components = get_board_snapshot(db, boardID, revision)
+        chat = sorted([c for c in components if c['type'] == 'chat'], key=lambda c: c['id']) # pages go by ID, and edited messages have moved on in revision order
+        if len(chat) <= limit:
+            return components, None
+        page = set(c['id'] for c in chat[-limit:])
+        return [c for c in components if c['type'] != 'chat' or c['id'] in page], chat[-limit]['id']
+    curList = db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and type!=? order by revision', [boardID, 'chat']).fetchall()
+    chat, chatBefore = get_chat_page(db, boardID)
+    return sorted([component_from_row(row) for row in curList] + chat, key=lambda c: c['revision']), chatBefore
+
+def get_board_page(db, boardID, lastModified='0', sinceRev=None, revision=None, purgedRev=0):
+    """``get_board_changes()``, except that a first load (``is_first_load()``) only gets the latest page of chat (``get_first_load()``), unless ``CHAT_PAGE_SIZE`` is 0.
+    Clients that are behind the board's `purgedRev` (``is_behind_purge()``) get a first load too.
+    Returns the components and the ID to pass as `before` for earlier chat (None if there is none, or this isn't a first load).
+    """
+    if is_behind_purge(sinceRev, purgedRev):
+        sinceRev = 0
+    if app.config['CHAT_PAGE_SIZE'] and revision is not None and is_first_load(lastModified, sinceRev):
+        return get_first_load(db, boardID, revision)
+    return get_board_changes(db, boardID, lastModified, sinceRev, revision), None
+
+def insert_component(boardID, who, loggedIn, ty, msg, position, revision):
+    """Insert a component written by `who` (a user ID if `loggedIn`, an invitee's email if not) at `revision`. Returns its ID.
+    Like all the component writes below, leaves committing (and calling ``board_changed()``) to the caller.
+    """
+    cursor = g.db.cursor()
+    if loggedIn:
+        cursor.execute('insert into board_content (boardID, userID, content, type, position, last_modified_at, last_modified_by, revision) values (?, ?, ?, ?, ?, ?, ?, ?)', [boardID, who, msg, ty, position, datetime.utcnow(), who, revision])
+    else:
+        cursor.execute('insert into board_content (boardID, userEmail, content, type, position, last_modified_at, last_modified_by, revision) values (?, ?, ?, ?, ?, ?, ?, ?)', [boardID, who, msg, ty, position, datetime.utcnow(), who, revision])
+    componentID = cursor.lastrowid
+    cursor.close()
+    return componentID
+
+def update_component(boardID, componentID, ty, who, revision, content=None, position=None):
+    """Change the content or (if `content` is None) the position of a component that wasn't deleted. Returns whether there was such a component."""
+    nowDate = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    if content is not None:
+        cur = g.db.execute('update board_content set content=?, last_modified_at=?, last_modified_by=?, revision=? where id=? and boardID=? and type=? and deleted=?', [content, nowDate, who, revision, componentID, boardID, ty, 'N'])
+    else:
+        cur = g.db.execute('update board_content set position=?, last_modified_at=?, last_modified_by=?, revision=? where id=? and boardID=? and type=? and deleted=?', [position, nowDate, who, revision, componentID, boardID, ty, 'N'])
+    return cur.rowcount > 0
+
+def remove_component(boardID, componentID, who, revision):
+    """Mark a component (anything but chat) as deleted. Returns whether there was such a component.
+    Any move of it still in ``position_buffer`` has to be discarded first (and restored if the delete is rolled back).
+    """
+    nowDate = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    cur = g.db.execute('update board_content set deleted=?, last_modified_at=?, last_modified_by=?, revision=? where id=? and boardID=? and type!=?', ['Y', nowDate, who, revision, componentID, boardID, 'chat'])
+    return cur.rowcount > 0
+
+def write_positions(moves):
+    """Write the moves flushed from ``position_buffer`` (see coalesce.py), all in one transaction with a revision each.
+    Moves of boards or components deleted in the meantime (by another process, or before their moves were discarded) are skipped,
+    and so are moves made under a lock that someone else has taken since (the move's fencing token is checked like any other write's).
+    Runs outside of any request (in the buffer's timer thread), so it gets its own app context and pooled connection.
+    """
+    with app.app_context():
+        checkout_db()
+        try:
+            written = []
+            for boardID, componentID, move in moves:
+                try:
+                    revision = next_revision(boardID, move['token'])
+                except (BoardGone, LockLost):
+                    continue
+                if update_component(boardID, componentID, move['type'], move['who'], revision, position=move['position']):
+                    written.append((boardID, componentID, revision))
+            g.db.commit()
+            for boardID, componentID, revision in written:
+                board_changed(boardID, componentID, revision)
+        finally:
+            release_db()
+
+position_buffer = PositionBuffer(write_positions, app.config['POSITION_COALESCE_WINDOW'], retry=(sqlite3.OperationalError,))
+"""Component positions waiting to be written, when ``POSITION_COALESCE_WINDOW`` is on."""
+atexit.register(position_buffer.flush)
+
+def overlay_moves(db, boardID, messages, movesSince, revision):
+    """Make the moves waiting in ``position_buffer`` visible to readers: components in `messages` get their pending position,
+    and components with a move newer than `movesSince` (a move sequence number the client got before) are added with it.
+    Returns the new list, the dicts in `messages` (which may come from the cache) are not changed.
+    """
+    pending = position_buffer.pending(boardID)
+    if not pending:
+        return messages
+    result = []
+    for component in messages:
+        move = pending.get(component['id'])
+        if move is not None and move['type'] == component['type']:
+            component = dict(component, position=move['position'])
+        result.append(component)
+    sent = set(component['id'] for component in messages)
+    newer = sorted([(move['seq'], cid) for cid, move in pending.items() if move['seq'] > movesSince and cid not in sent])
+    if newer:
+        components = dict((component['id'], component) for component in get_board_snapshot(db, boardID, revision))
+        for seq, cid in newer:
+            component = components.get(cid)
+            if component is not None and component['deleted'] == 'N' and component['type'] == pending[cid]['type']:
+                result.append(dict(component, position=pending[cid]['position']))
+    return result
+
+def caller_board_state(boardID, inv):
+    """``board_state()`` for whoever is making the request: a logged in user, or else the holder of invite `inv` ('-1' for none).
+    Aborts with 404 if there's no such board and 401 if the caller has no access to it.
+    Also includes `who`, what locks and modifications are recorded as: the ID (as a string) of a logged in user or the email of an invitee.
+    """
+    if session.get('logged_in'): # don't care if there's an invite string as long as they're logged in
+        state = board_state(boardID, userID=session['userid'])
+        who = str(session['userid'])
+    elif inv != '-1':
+        state = board_state(boardID, invite=inv)
+        who = state['email'] if state is not None else None
     else:
-        return False
+        abort(401)
+    if state is None:
+        abort(404)
+    if state['accessType'] is None:
+        abort(401)
+    state['who'] = who
+    return state
 
-def lock_board(boardID, userID=None, userEmail=None): 
-    """Called after making sure the board isn't currently locked and the user has editing access.
-    Any sqlite3.Error s handled in calling function.
-    Lock the board for 5 seconds.
+def acquire_edit_lock(boardID, state):
+    """Lock the board for the caller of ``caller_board_state()`` (`state`), unless someone else holds the lock. Returns whether they got it.
+    The fencing token of the lock goes in ``state['token']``, for the writes that follow (``next_revision()``).
     """
-    user = userID if userID is not None else userEmail
-    lock = datetime.utcnow() + timedelta(seconds=5) 
-    lock_time = lock.strftime('%Y-%m-%d %H:%M:%S')
-    g.db.execute('update boards set locked_until=?, locked_by=? where id=?', [lock_time, user, boardID])
-    g.db.commit()
+    state['token'] = lock_board(boardID, state['who'])
+    return state['token'] is not None
 
 def is_authorized(boardID, wantToEdit=False):
     """Check if a certain signed in user (who by default doesn't want to edit the board) is authorized to access it, 
@@ -117,29 +514,14 @@ def is_authorized(boardID, wantToEdit=False):
     if session.get('logged_in'):
         # not counting in the invitation link logic here
         uid = session['userid']
-        # are they the owner?
-        if is_owner(boardID, uid):
-            access = True
-            isOwner = True
-            accessType = 'edit'
-        else:
-            uemail = g.db.execute('select email from users where id=?', [uid]).fetchone()[0]
-            cur2 = g.db.execute('select type from invites where boardID=? and userEmail=?', [boardID, uemail]).fetchone()
-            if cur2 is not None:
-                access = True
-                accessType = cur2[0]
+        # are they the owner? or invited?
+        userAccess = get_access(boardID, userID=uid)
+        isOwner = userAccess['isOwner']
+        accessType = userAccess['accessType']
+        access = accessType is not None
         if accessType =='edit' and wantToEdit:
             # boardID must exist at this point, checked by calling functions
-            lock = g.db.execute('select locked_until, locked_by from boards where id=?', [boardID]).fetchone()
-            if lock is not None:
-                lockedUntil = datetime.strptime(lock[0], '%Y-%m-%d %H:%M:%S')
-                lockedBy = lock[1]
-                if (datetime.utcnow() > lockedUntil) or (datetime.utcnow() < lockedUntil and int(lockedBy) == uid):
-                    try:
-                        lock_board(boardID, userID=str(uid))
-                        canEditNow = True
-                    except sqlite3.Error as e:
-                        pass
+            canEditNow = lock_board(boardID, str(uid)) is not None
     return {'access':access, 'isOwner':isOwner, 'accessType':accessType, 'canEditNow':canEditNow}
 
 
@@ -168,16 +550,20 @@ def register_user():
         abort(401)
     error = None
     if request.method == 'POST':
+        un = request.form['username'].lower()
+        em = request.form['email'].lower()
+        taken = g.db.execute('select username, email from users where username=? or email=?', [un, em]).fetchone()
+        if taken is not None: # no need to hash the password to find out
+            error = 'Username is already in use.' if taken[0] == un else 'Email is already in use.'
+            return render_template('register.html', error=error)
         try:
-            pw = generate_password_hash(request.form['password'], method='pbkdf2:sha512:10000')
-            un = request.form['username'].lower()
-            em = request.form['email'].lower()
+            pw = hash_password(request.form['password'])
             g.db.execute('insert into users (username, password, email, name) values (?, ?, ?, ?)', [un, pw, em, request.form['name']])
             g.db.commit()
             login_user(un)
             flash('Successfully registered!')
             return redirect(url_for('index'))
-        except sqlite3.IntegrityError as e:
+        except sqlite3.IntegrityError as e: # someone took it in the meantime
             if e.args[0][32:] == 'email':
                 error = 'Email is already in use.'
             elif e.args[0][32:] == 'username':
@@ -195,14 +581,20 @@ def login():
     if request.method == 'POST':
         cur = g.db.execute('select username, password from users where username=?', [request.form['username'].lower()])
         cur_res = cur.fetchone()
-        if cur_res is None:
+        if cur_res is None: # turned away without hashing anything
             error = 'Invalid username'
         else:
             username = cur_res[0]
             pw = cur_res[1]
-            if check_password_hash(pw, request.form['password']) == False: # ouch
+            if check_password(pw, request.form['password']) == False: # ouch
                 error = 'Invalid password'
             else:
+                if needs_rehash(pw, app.config['PASSWORD_HASH_METHOD']): # made with an older setting, now's the time to upgrade it
+                    try:
+                        g.db.execute('update users set password=? where username=?', [hash_password(request.form['password']), username])
+                        g.db.commit()
+                    except sqlite3.Error:
+                        pass # next time
                 login_user(username)
                 flash('Hey there!', 'info')
                 return redirect(url_for('index'))
@@ -279,13 +671,13 @@ def show_board(boardID):
                 can_participate = True
             return render_template('show-board.html', canEdit=can_participate, isDone=isDone, title=curB[0], created_at=curB[1], done_at=curB[2], isOwner=auth['isOwner'], boardID=boardID)
         elif invite is not None:
-            cur = g.db.execute('select userEmail, type from invites where id=? and boardID=?', [invite, boardID]).fetchone()
-            if cur is None:
+            cur = get_access(boardID, invite=invite)
+            if cur['accessType'] is None:
                 abort(401)
             else:
-                if cur[1] == 'edit':
+                if cur['accessType'] == 'edit':
                     can_participate = True
-                return render_template('show-board.html', canEdit=can_participate, isDone=isDone, title=curB[0], created_at=curB[1], done_at=curB[2], email=cur[0], boardID=boardID)
+                return render_template('show-board.html', canEdit=can_participate, isDone=isDone, title=curB[0], created_at=curB[1], done_at=curB[2], email=cur['email'], boardID=boardID)
         else:
             abort(401)
 
@@ -307,6 +699,7 @@ def remove_self():
                 email = cur[0].lower()
                 g.db.execute('delete from invites where boardID=? and userEmail=?', [bid, email])
                 g.db.commit()
+                invalidate_access(boardID=bid)
         except sqlite3.Error as e:
             error = e.args[0]
         if(error=='None'):
@@ -341,6 +734,39 @@ def validate_email():
 
 
 ## POST
+def internal_only():
+    """Abort with 404 unless the request comes from one of the ``INTERNAL_ADDRESSES`` (so internal endpoints look like they're not there)."""
+    if request.remote_addr not in app.config['INTERNAL_ADDRESSES']:
+        abort(404)
+
+@app.route('/_sqlStats', methods=['GET'])
+def sql_stats():
+    """What requests did with the database in this process (see instrumentation.py): per endpoint, and the ``top`` statements (default 20) by total time.
+    Internal only. ``reset=1`` starts counting again after answering.
+    """
+    internal_only()
+    stats = sql_recorder.snapshot(request.args.get('top', 20, int))
+    if request.args.get('reset', 0, int):
+        sql_recorder.reset()
+    return jsonify(stats)
+
+@app.route('/_maintenance', methods=['GET'])
+def show_maintenance():
+    """How the maintenance passes of this process went (see maintenance.py): how many ran, were skipped (another process ran them) or failed,
+    and what the last one did. Internal only.
+    """
+    internal_only()
+    worker = get_maintenance()
+    if worker is None:
+        return jsonify(running=False)
+    return jsonify(worker.status())
+
+@app.route('/metrics', methods=['GET'])
+def show_metrics():
+    """The metrics (see metrics.py) in the Prometheus text format, added up over all worker processes if ``METRICS_DIR`` is set. Internal only."""
+    internal_only()
+    return Response(metrics_registry.render(app.config['METRICS_DIR']), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/_editProfile', methods=['POST'])
 def edit_profile():
     """Edit user info, such as username, email, and name for the logged in user."""
@@ -379,6 +805,7 @@ def edit_profile():
                     session['username'] = un;
                     g.db.execute('update invites set userEmail=? where userEmail=?', [em, old_em])
                     g.db.commit()
+                    invalidate_access(userID=session['userid'], email=old_em)
                 except sqlite3.Error as e:
                     error = e.args[0]
         return jsonify(error=error, token=new_token)
@@ -391,12 +818,12 @@ def change_password():
     else:
         error = 'None'
         new_token = generate_csrf_token()
-        password = generate_password_hash(request.form['password'], method='pbkdf2:sha512:10000')
         pw = g.db.execute('select password from users where id=?', [session['userid']]).fetchone()[0]
-        if not check_password_hash(pw, request.form['old-password']):
+        if not check_password(pw, request.form['old-password']):
             error = 'Old password you entered is incorrect.'
         else: 
             try:
+                password = hash_password(request.form['password'])
                 g.db.execute('update users set password=? where id=?', [password, session['userid']])
                 g.db.commit()
             except sqlite3.Error as e:
@@ -425,6 +852,7 @@ def edit_invite():
         try:
             g.db.execute('update invites set type=? where boardID=? and userEmail=?', [new_type, bid, em])
             g.db.commit()
+            invalidate_access(boardID=bid)
         except sqlite3.Error as e:
             error = e.args[0]
         return jsonify(error=error, token=new_token)
@@ -446,6 +874,7 @@ def invite_user(email, boardID):
         try:
             g.db.execute('insert into invites (id, userEmail, boardID, type) values (?, ?, ?, ?)', [inviteID, em, bid, ty])
             g.db.commit()
+            invalidate_access(boardID=bid)
             successful = 'true'
         except sqlite3.IntegrityError as e:
             error = 'This email has already been invited to this board.'
@@ -506,6 +935,10 @@ def delete_board(boardID):
         try:
             g.db.execute('delete from boards where id=? and creatorID=?', [bid, session['userid']])
             g.db.commit()
+            component_cache.discard(bid)
+            position_buffer.discard(bid)
+            invalidate_access(boardID=bid)
+            board_changed(bid) # so open update streams find out it's gone
         except sqlite3.Error as e:
             error = e.args[0]
         if(error!='None'):
@@ -517,49 +950,167 @@ def get_components(boardID):
     """Get all components of a board. This includes:
         - Chat, text, and other components along with all their relevant data (date, who, etc).
         - State of the board: locked/unlocked.
+
+    Long-poll mode: with ``wait=<seconds>`` (capped at ``LONG_POLL_MAX_WAIT``), instead of answering "Nothing new." right away
+    the request waits until something is written to the board or the time is up, whichever comes first. The response looks the same either way.
+
+    Clients send the ``revision`` of the last response they got as ``since_rev`` and get exactly the components changed after it.
+    (``lastModified``, a date, still works for older clients but misses changes made within the same second.)
+
+    Moves that are still buffered (``POSITION_COALESCE_WINDOW``) are included with their new position. Clients send the ``moveSeq``
+    of the last response as ``moves_since`` so they only get those once.
+
+    The first load (``since_rev=0``) only has the latest ``CHAT_PAGE_SIZE`` chat messages. If there are earlier ones, ``chatBefore``
+    is the cursor to get them: ``before=<chatBefore>`` answers with the page of chat before it (``messages``) and the next cursor.
+
+    Clients whose ``since_rev`` is from before deletions that maintenance has purged since (``is_behind_purge()``) get a first load instead, with ``reset``
+    set: they should drop what they have of the board and start over with it.
     """
     bid = int(boardID)
-    curBoard = g.db.execute('select locked_until, locked_by from boards where id=?', [bid]).fetchone()
-    if curBoard is None:
-        abort(404)
-    else:
-        inv = request.args.get('invite', 0, str)
-        if inv != '-1' and not session.get('logged_in'):
-            curInvite = g.db.execute('select userEmail from invites where id=?', [inv]).fetchone()
-            if curInvite is None:
-                abort(401)
-            else:
-                who = curInvite[0]
-        elif session.get('logged_in'):
-            auth = is_authorized(bid)
-            if not auth['access']:
-                abort(401)
-            else:
-                who = str(session['userid'])
-        else:
-            abort(401)
-        lastClientGot = request.args.get('lastModified', 0, str)
-        lock_until = datetime.strptime(curBoard[0], '%Y-%m-%d %H:%M:%S')
-        lock_by = curBoard[1]
-        LOCKED = False
-        if datetime.utcnow() < lock_until and lock_by != who:
-            LOCKED = True
-        # get list
+    inv = request.args.get('invite', '-1', str)
+    movesSince = request.args.get('moves_since', 0, int)
+    before = request.args.get('before', None, int)
+    version = board_events.version(bid) # before reading, so a write in between isn't missed
+    state = caller_board_state(bid, inv)
+    if before is not None:
         try:
-            curList = g.db.execute('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted from board_content where boardID=? and last_modified_at > ? order by created_at', [bid, lastClientGot]).fetchall()
-            if len(curList) > 0:
-                messages = [dict(id=row[0], content=row[1], userID=row[2], userEmail=row[3], created_at=row[4], last_modified_at=row[5], last_modified_by=row[6], type=row[7], position=row[8], deleted=row[9]) for row in curList]
-                return jsonify(messages=messages, locked=LOCKED, lockedBy=lock_by)
-            else:
-                error = 'Nothing new.'
-                return jsonify(error=error, locked=LOCKED, lockedBy=lock_by)
+            messages, chatBefore = get_chat_page(g.db, bid, before)
+            return jsonify(messages=messages, chatBefore=chatBefore)
         except sqlite3.Error as e:
-            error = e.args[0]
-            return jsonify(error=error, locked=LOCKED, lockedBy=lock_by)
+            return jsonify(error=e.args[0])
+    lastClientGot = request.args.get('lastModified', '0', str)
+    sinceRev = request.args.get('since_rev', None, int)
+    wait = min(max(request.args.get('wait', 0, float), 0), app.config['LONG_POLL_MAX_WAIT'])
+    lock_by = state['lock'].holder if state['lock'] is not None else None
+    LOCKED = is_locked(state['lock'], state['who'])
+    revision = state['revision']
+    reset = is_behind_purge(sinceRev, state['purged_rev'])
+    # get list
+    try:
+        moveSeq = position_buffer.last_seq()
+        messages, chatBefore = get_board_page(g.db, bid, lastClientGot, sinceRev, revision, state['purged_rev'])
+        messages = overlay_moves(g.db, bid, messages, movesSince, revision)
+        if len(messages) == 0 and wait > 0:
+            if LOCKED: # nobody writes when a lock runs out, so don't wait past that
+                wait = min(wait, lock_time_left(state['lock']))
+            release_db() # don't keep a pooled connection while waiting
+            changed = board_events.wait(bid, version, wait) != version
+            checkout_db()
+            if changed:
+                state = caller_board_state(bid, inv) # access is cached by now, so this only reads the board
+                lock_by = state['lock'].holder if state['lock'] is not None else None
+                LOCKED = is_locked(state['lock'], state['who'])
+                revision = state['revision']
+                moveSeq = position_buffer.last_seq()
+                messages, chatBefore = get_board_page(g.db, bid, lastClientGot, sinceRev, revision, state['purged_rev'])
+                messages = overlay_moves(g.db, bid, messages, movesSince, revision)
+        if app.config['METRICS_ENABLED']:
+            asgiPoll = request.environ.get('pegasus.long_poll') # the ASGI adapter does the waiting (see asgi.py)
+            if messages or asgiPoll != 'first':
+                polls.inc(result='changes' if messages else 'empty', mode='long_poll' if wait > 0 or asgiPoll else 'poll')
+        if len(messages) > 0:
+            revision = max([revision] + [row['revision'] for row in messages]) # rows written after the board was read
+            return jsonify(messages=messages, locked=LOCKED, lockedBy=lock_by, revision=revision, moveSeq=moveSeq, chatBefore=chatBefore, reset=reset)
+        else:
+            error = 'Nothing new.'
+            return jsonify(error=error, locked=LOCKED, lockedBy=lock_by, revision=revision, moveSeq=moveSeq, reset=reset)
+    except sqlite3.Error as e:
+        error = e.args[0]
+        return jsonify(error=error, locked=LOCKED, lockedBy=lock_by, revision=revision, moveSeq=movesSince)
+
+@app.route('/api/board/<boardID>/components/stream', methods=['GET'])
+def stream_components(boardID):
+    """Push the changes of a board to the client as Server-Sent Events instead of having it poll ``get_components()``.
+    Each event has the same data a non-empty ``get_components()`` response would have (messages, locked, lockedBy, revision, chatBefore, reset), and is sent
+    whenever a write to the board is committed or the lock state changes. Idle streams only get a keep-alive comment every ``STREAM_KEEPALIVE`` seconds.
+    Like ``get_components()``, takes ``since_rev`` (or ``lastModified`` for older clients).
+    The event ID is the last revision (or modification date) sent, so a reconnecting client (``Last-Event-ID``) picks up where it left off.
+    """
+    bid = int(boardID)
+    who = caller_board_state(bid, request.args.get('invite', '-1', str))['who']
+    request_moves_since = request.args.get('moves_since', 0, int)
+    lastClientGot = request.args.get('lastModified', '0', str)
+    sinceRev = request.args.get('since_rev', None, int)
+    lastEventID = request.headers.get('Last-Event-ID')
+    if lastEventID:
+        if sinceRev is not None:
+            try:
+                sinceRev = int(lastEventID)
+            except ValueError:
+                pass # not one of ours, since_rev will do
+        else:
+            lastClientGot = lastEventID
+    stream = dict(board=bid, who=who, lastModified=lastClientGot, lastRev=sinceRev, lastMoveSeq=request_moves_since, wasLocked=None,
+                  closes_at=time.time() + app.config['STREAM_MAX_DURATION'])
+    pool = get_pool()
+
+    def generate():
+        version = board_events.version(bid)
+        changed = True
+        while True:
+            if changed or stream['wasLocked']:
+                with pool.connection() as db: # only held while reading, not for the whole stream
+                    event = next_stream_event(db, stream)
+                if event is None: # board was deleted
+                    yield 'event: gone\ndata: {}\n\n'
+                    return
+                if event:
+                    yield event
+            timeout = stream_wait_time(stream)
+            if timeout is None:
+                return
+            newVersion = board_events.wait(bid, version, timeout)
+            changed = newVersion != version
+            version = newVersion
+            if not changed and not stream['wasLocked']:
+                yield ': keepalive\n\n'
+
+    response = Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.board_stream = stream # so asgi.py can run the stream without a thread per client
+    return response
+
+def next_stream_event(db, stream):
+    """Read what changed on the board of an update `stream` (a dict with the board, who is watching and what they got so far, see ``stream_components()``).
+    Returns the Server-Sent Event to send for it, '' if there's nothing to send, or None if the board was deleted.
+    """
+    bid = stream['board']
+    curBoard = db.execute('select revision, purged_rev from boards where id=?', [bid]).fetchone()
+    if curBoard is None:
+        return None
+    moveSeq = position_buffer.last_seq()
+    reset = is_behind_purge(stream['lastRev'], curBoard[1])
+    messages, chatBefore = get_board_page(db, bid, stream['lastModified'], stream['lastRev'], curBoard[0], curBoard[1])
+    messages = overlay_moves(db, bid, messages, stream['lastMoveSeq'], curBoard[0])
+    lock = get_locks().holder(bid)
+    LOCKED = is_locked(lock, stream['who'])
+    if len(messages) == 0 and LOCKED == stream['wasLocked'] and not reset:
+        return ''
+    revision = max([curBoard[0]] + [row['revision'] for row in messages])
+    for row in messages:
+        if row['last_modified_at'] > stream['lastModified']:
+            stream['lastModified'] = row['last_modified_at']
+    if stream['lastRev'] is not None:
+        stream['lastRev'] = revision
+    stream['lastMoveSeq'] = moveSeq
+    stream['wasLocked'] = LOCKED
+    data = json.dumps(dict(messages=messages, locked=LOCKED, lockedBy=lock.holder if lock is not None else None, revision=revision, moveSeq=moveSeq, chatBefore=chatBefore, reset=reset))
+    return 'id: %s\ndata: %s\n\n' % (stream['lastModified'] if stream['lastRev'] is None else stream['lastRev'], data)
+
+def stream_wait_time(stream):
+    """How long an update `stream` can wait for the board to change before checking again (or sending a keep-alive). None if it's time to close it."""
+    remaining = stream['closes_at'] - time.time()
+    if remaining <= 0:
+        return None
+    timeout = min(app.config['STREAM_KEEPALIVE'], remaining)
+    if stream['wasLocked']: # nobody writes when a lock runs out, so check again soon
+        timeout = min(timeout, 1)
+    return timeout
 
 @app.route('/api/board/<boardID>/components/post', methods=['POST'])
 def post_components(boardID):
-    """Post a component to the board. Works for all types."""
+    """Post a component to the board. Works for all types.
+    Chat is open to everyone with access, other components need edit access and the board's lock (which posting takes).
+    """
     bid = int(boardID)
     new_token = generate_csrf_token()
     msg = request.form['message']
@@ -567,59 +1118,27 @@ def post_components(boardID):
     position = request.form['position']
     error = 'None'
     componentID = None
-    wantEdit = False if ty == 'chat' else True
-    curBoard = g.db.execute('select done_at, locked_until, locked_by from boards where id=?', [bid]).fetchone()
-    if curBoard is None:
-        abort(404)
-    done_at = datetime.strptime(curBoard[0], '%Y-%m-%d %H:%M:%S')
-    inv = request.form['invite']
-    if inv != '-1' and not session.get('logged_in'):
-        curInvite = g.db.execute('select type, userEmail from invites where id=? and boardID=?', [inv, bid]).fetchone()
-        if curInvite is None:
-            abort(401)
-        else:
-            who = curInvite[1]
-    elif session.get('logged_in'):
-        auth = is_authorized(bid, wantToEdit=wantEdit)
-        if not auth['access'] and auth['accessType'] == 'edit':
-            abort(401)
-        who = session['userid']
+    state = caller_board_state(bid, request.form['invite'])
+    who = state['who']
+    done_at = datetime.strptime(state['done_at'], '%Y-%m-%d %H:%M:%S')
     if(done_at > datetime.utcnow()):
         if len(msg)>=1:
-            if session.get('logged_in'):
-                if (ty != 'chat' and auth['canEditNow']) or (ty == 'chat'):
-                    try:
-                        cursor = g.db.cursor()
-                        cursor.execute('insert into board_content (boardID, userID, content, type, position, last_modified_at, last_modified_by) values (?, ?, ?, ?, ?, ?, ?)', [bid, who, msg, ty, position, datetime.utcnow(), who])
-                        g.db.commit()
-                        componentID = cursor.lastrowid
-                        cursor.close()
-                    except sqlite3.Error as e:
-                        error = e.args[0]
-                else:
-                    error = 'This board is locked for edit by another user.'
-            elif inv != '-1' and ((curInvite[0] == 'edit' and ty != 'chat') or (ty == 'chat')):
-                lockedUntil = datetime.strptime(curBoard[1],'%Y-%m-%d %H:%M:%S')
-                lockedBy = curBoard[2]
-                allowEdit = False
-                if datetime.utcnow() > lockedUntil or (datetime.utcnow() < lockedUntil and lockedBy == who):
-                    try:
-                        lock_board(bid, userEmail=who)
-                        allowEdit = True
-                    except sqlite3.Error as e:
-                        error = e.args[0]
-                if allowEdit:
-                    try:
-                        cursor = g.db.cursor()
-                        cursor.execute('insert into board_content (boardID, userEmail, content, type, position, last_modified_at, last_modified_by) values (?, ?, ?, ?, ?, ?, ?)', [bid, who, msg, ty, position, datetime.utcnow(), who])
-                        g.db.commit()
-                        cursor.close()
-                    except sqlite3.Error as e:
-                        error = e.args[0]
-                else:
-                    error = 'This board is locked for edit by another user.'
-            else:
+            if ty != 'chat' and state['accessType'] != 'edit':
                 error = 'Your priviliges do not allow you to post to this board.'
+            elif ty != 'chat' and not acquire_edit_lock(bid, state):
+                error = 'This board is locked for edit by another user.'
+            else:
+                try:
+                    revision = next_revision(bid, state.get('token'))
+                    componentID = insert_component(bid, who, session.get('logged_in'), ty, msg, position, revision)
+                    g.db.commit()
+                    board_changed(bid, componentID, revision)
+                except sqlite3.Error as e:
+                    error = e.args[0]
+                except LockLost:
+                    error = 'This board is locked for edit by another user.'
+                except BoardGone:
+                    error = 'This board was deleted.'
         else:
             error = 'Content too short.'
     else:
@@ -676,58 +1195,50 @@ def edit_component(componentID, boardID):
     new_token = generate_csrf_token()
     bid = int(boardID)
     cid = int(componentID)
-    inv = request.form['invite']
-    curBoard = g.db.execute('select locked_until, locked_by from boards where id=?', [bid]).fetchone()
-    if curBoard is None:
-        abort(404)
-    if inv != '-1' and not session.get('logged_in'): # don't care if there's an invite string as long as they're logged in
-        cur = g.db.execute('select type, userEmail from invites where id=? and boardID=?', [inv, bid]).fetchone()
-        if cur is None:
-            abort(401)
-        elif cur[0] != 'edit':
-            abort(401)
-        else:
-            mod = cur[1]
-            lockedUntil = datetime.strptime(curBoard[0], '%Y-%m-%d %H:%M:%S')
-            lockedBy = curBoard[1]
-            if(datetime.utcnow() > lockedUntil) or (datetime.utcnow() < lockedUntil and lockedBy == mod):
-                try:
-                    lock_board(bid,userEmail=mod)
-                    allowEdit = True
-                except sqlite3.Error as e:
-                    error = e.args[0]
-    elif session.get('logged_in'):
-        auth = is_authorized(bid, wantToEdit=True)
-        if not auth['access'] or not auth['accessType'] == 'edit' or not auth['canEditNow']:
-            abort(401)
-        else:
-            allowEdit = True
-            mod = session['userid']
-    else:
+    state = caller_board_state(bid, request.form['invite'])
+    if state['accessType'] != 'edit':
         abort(401)
+    mod = state['who']
     # if we get this far, user has editing access
-    if allowEdit:
+    done_at = datetime.strptime(state['done_at'], '%Y-%m-%d %H:%M:%S')
+    if done_at <= datetime.utcnow():
+        error = 'This board has expired. You cannot make any more changes.'
+    elif acquire_edit_lock(bid, state):
         ty = request.form['content-type']
-        nowDate = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        curDone = g.db.execute('select done_at from boards where id=?', [bid]).fetchone()
-        done_at = datetime.strptime(curDone[0], '%Y-%m-%d %H:%M:%S')
-        if done_at > datetime.utcnow():
-            try:
-                if request.form['hasMessages']=='true':
-                    msg = request.form['message']
-                    if len(msg)>=1:
-                        g.db.execute('update board_content set content=?, last_modified_at=?, last_modified_by=? where id=? and boardID=? and type=? and deleted=?', [msg, nowDate, mod, cid, bid, ty, 'N'])
+        try:
+            if request.form['hasMessages']=='true':
+                msg = request.form['message']
+                if len(msg)>=1:
+                    revision = next_revision(bid, state['token'])
+                    if update_component(bid, cid, ty, mod, revision, content=msg):
                         g.db.commit()
+                        board_changed(bid, cid, revision)
                     else:
-                        error = 'Content too short.'
-                else: # refreshing position only
-                    pos = request.form['position']
-                    g.db.execute('update board_content set position=?, last_modified_at=?, last_modified_by=? where id=? and boardID=? and type=? and deleted=?', [pos, nowDate, mod, cid, bid, ty, 'N'])
+                        g.db.rollback()
+                        error = 'No such component.'
+                else:
+                    error = 'Content too short.'
+            elif app.config['POSITION_COALESCE_WINDOW']: # refreshing position only, written with the other moves in a moment
+                if g.db.execute('select id from board_content where id=? and boardID=? and type=? and deleted=?', [cid, bid, ty, 'N']).fetchone() is None:
+                    error = 'No such component.'
+                else:
+                    position_buffer.put(bid, cid, ty, request.form['position'], mod, state['token'])
+                    board_changed(bid)
+            else:
+                pos = request.form['position']
+                revision = next_revision(bid, state['token'])
+                if update_component(bid, cid, ty, mod, revision, position=pos):
                     g.db.commit()
-            except sqlite3.Error as e:
-                error = e.args[0]
-        else:
-            error = 'This board has expired. You cannot make any more changes.'
+                    board_changed(bid, cid, revision)
+                else:
+                    g.db.rollback()
+                    error = 'No such component.'
+        except sqlite3.Error as e:
+            error = e.args[0]
+        except LockLost:
+            error = 'This board is locked for edit by another user.'
+        except BoardGone:
+            error = 'This board was deleted.'
     else: 
         error = 'This board is locked for edit by another user.'
     return jsonify(error=error, token=new_token)
@@ -739,50 +1250,193 @@ def delete_component(boardID, componentID):
     new_token = generate_csrf_token()
     bid = int(boardID)
     cid = int(componentID)
-    inv = request.form['invite']
-    curBoard = g.db.execute('select locked_until, locked_by from boards where id=?', [bid]).fetchone()
-    if curBoard is None:
-        abort(404)
-    if inv != '-1' and not session.get('logged_in'): # don't care if there's an invite string as long as they're logged in
-        cur = g.db.execute('select type, userEmail from invites where id=? and boardID=?', [inv, bid]).fetchone()
-        if cur is None:
-            abort(401)
-        elif cur[0] != 'edit':
-            abort(401)
-        else:
-            mod = cur[1]
-            lockedUntil = datetime.strptime(curBoard[0], '%Y-%m-%d %H:%M:%S')
-            lockedBy = curBoard[1]
-            if(datetime.utcnow() > lockedUntil) or (datetime.utcnow() < lockedUntil and lockedBy == mod):
-                try:
-                    lock_board(bid,userEmail=mod)
-                    allowDelete = True
-                except sqlite3.Error as e:
-                    error = e.args[0]
-    elif session.get('logged_in'):
-        auth = is_authorized(bid, wantToEdit=True)
-        if not auth['access'] or not auth['accessType'] == 'edit' or not auth['canEditNow']:
-            abort(401)
-        else:
-            allowDelete = True
-            mod = session['userid']
-    else:
+    state = caller_board_state(bid, request.form['invite'])
+    if state['accessType'] != 'edit':
         abort(401)
-    if allowDelete:
-        nowDate = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        curDone = g.db.execute('select done_at from boards where id=?', [bid]).fetchone()
-        done_at = datetime.strptime(curDone[0], '%Y-%m-%d %H:%M:%S')
-        if done_at > datetime.utcnow():
-            try:
-                g.db.execute('update board_content set deleted=?, last_modified_at=?, last_modified_by=? where id=? and boardID=? and type!=?', ['Y', nowDate, mod, cid, bid, 'chat'])
-                g.db.commit()
-            except sqlite3.Error as e:
-                error = e.args[0]
-        else:
-            error = 'This board has expired. You cannot make any more changes.'
+    mod = state['who']
+    done_at = datetime.strptime(state['done_at'], '%Y-%m-%d %H:%M:%S')
+    if done_at <= datetime.utcnow():
+        error = 'This board has expired. You cannot make any more changes.'
+    elif acquire_edit_lock(bid, state):
+        moves = position_buffer.discard(bid, cid) # so a flush can't write them after the delete
+        try:
+            revision = next_revision(bid, state['token'])
+            remove_component(bid, cid, mod, revision)
+            g.db.commit()
+            board_changed(bid, cid, revision)
+        except sqlite3.Error as e:
+            error = e.args[0]
+        except LockLost:
+            error = 'This board is locked for edit by another user.'
+        except BoardGone:
+            error = 'This board was deleted.'
+        if error != 'None':
+            g.db.rollback()
+            position_buffer.restore(moves)
     else:
         error = 'This board is locked for edit by another user.'
     return jsonify(error=error, token=new_token)
 
+@app.route('/api/board/<boardID>/components/batch', methods=['POST'])
+def batch_components(boardID):
+    """Apply several component changes at once, in one transaction and under one lock check (dragging a group of components, pasting many of them).
+    ``operations`` is a JSON list of operations, each one a dict with an ``op`` of:
+        - insert: a new component, with ``content-type``, ``message`` and ``position`` (like ``post_components()``).
+        - update: new ``message`` for the component ``id`` of type ``content-type``.
+        - move: new ``position`` for the component ``id`` of type ``content-type``.
+        - delete: delete the component ``id``.
+    Chat messages can be inserted by viewers too, everything else needs edit access and takes the board's lock.
+    Returns a result per operation (error, and id and revision if it was applied) in the same order, and the board's revision after the batch.
+    An operation that fails on its own (unknown operation, missing id or content type, no such component, content too short) doesn't stop the others,
+    a database error rolls back the whole batch.
+    """
+    bid = int(boardID)
+    new_token = generate_csrf_token()
+    error = 'None'
+    results = []
+    try:
+        operations = json.loads(request.form['operations'])
+    except ValueError:
+        abort(400)
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        abort(400)
+    if len(operations) > app.config['BATCH_MAX_OPERATIONS']:
+        return jsonify(error='Too many operations (the limit is %d).' % app.config['BATCH_MAX_OPERATIONS'], token=new_token, results=results)
+    state = caller_board_state(bid, request.form['invite'])
+    who = state['who']
+    revision = state['revision']
+    wantEdit = any(op.get('op') != 'insert' or op.get('content-type') != 'chat' for op in operations)
+    done_at = datetime.strptime(state['done_at'], '%Y-%m-%d %H:%M:%S')
+    if done_at <= datetime.utcnow():
+        error = 'This board has expired. You cannot make any more changes.'
+    elif wantEdit and state['accessType'] != 'edit':
+        error = 'Your priviliges do not allow you to post to this board.'
+    elif wantEdit and not acquire_edit_lock(bid, state):
+        error = 'This board is locked for edit by another user.'
+    else:
+        written = []
+        moves = {} # taken out of position_buffer, put back if the batch is rolled back
+        try:
+            for op in operations:
+                kind = op.get('op')
+                ty = op.get('content-type')
+                msg = op.get('message')
+                if kind not in ('insert', 'update', 'move', 'delete'):
+                    results.append(dict(error='Unknown operation.'))
+                    continue
+                try:
+                    cid = int(op['id']) if kind != 'insert' else None
+                except (KeyError, TypeError, ValueError):
+                    results.append(dict(error='Missing component id.'))
+                    continue
+                if kind != 'delete' and (not isinstance(ty, str) or not ty):
+                    results.append(dict(error='Missing content type.', id=cid))
+                elif kind in ('insert', 'update') and (not isinstance(msg, str) or len(msg) < 1):
+                    results.append(dict(error='Content too short.'))
+                else:
+                    revision = next_revision(bid, state.get('token'))
+                    if kind == 'insert':
+                        cid = insert_component(bid, who, session.get('logged_in'), ty, msg, op.get('position', 'None'), revision)
+                        found = True
+                    elif kind == 'update':
+                        found = update_component(bid, cid, ty, who, revision, content=msg)
+                    elif kind == 'move':
+                        moves.update(position_buffer.discard(bid, cid)) # or it would be written over with an older position
+                        found = update_component(bid, cid, ty, who, revision, position=op.get('position'))
+                    else:
+                        moves.update(position_buffer.discard(bid, cid))
+                        found = remove_component(bid, cid, who, revision)
+                    if found:
+                        written.append((cid, revision))
+                        results.append(dict(error='None', id=cid, revision=revision))
+                    else:
+                        results.append(dict(error='No such component.', id=cid))
+            g.db.commit()
+        except (sqlite3.Error, LockLost, BoardGone) as e:
+            g.db.rollback()
+            position_buffer.restore(moves)
+            if isinstance(e, sqlite3.Error):
+                error = e.args[0]
+            else:
+                error = 'This board was deleted.' if isinstance(e, BoardGone) else 'This board is locked for edit by another user.'
+            results = []
+            revision = state['revision']
+        else:
+            for cid, rev in written:
+                board_changed(bid, cid, rev)
+            if not written and wantEdit:
+                board_changed(bid) # the lock changed hands, at least
+    return jsonify(error=error, token=new_token, results=results, revision=revision)
+
+@app.route('/api/board/<boardID>/lock/release', methods=['POST'])
+def release_lock(boardID):
+    """Give up the caller's lock on a board before its lease runs out (when they're done editing), so others can edit right away."""
+    bid = int(boardID)
+    new_token = generate_csrf_token()
+    state = caller_board_state(bid, request.form['invite'])
+    released = get_locks().release(bid, state['who'])
+    if released:
+        board_changed(bid) # so viewers see it's unlocked
+    return jsonify(error='None', token=new_token, released=released)
 
+@app.route('/api/board/<boardID>/export.<fmt>', methods=['GET'])
+def export_board(boardID, fmt):
+    """Download a board as an image of its canvas (svg, or png if the server has Pillow) or as the text of the canvas and the chat (md, txt).
+    Rendered once per board revision and title (see export.py), and answered with 304 if the client already has that version.
+    With ``download=1`` the browser saves it as a file instead of showing it.
+    """
+    bid = int(boardID)
+    if fmt not in FORMATS:
+        abort(404)
+    state = caller_board_state(bid, request.args.get('invite', '-1', str))
+    pending = position_buffer.pending(bid)
+    lastMove = max([0] + [move['seq'] for move in pending.values()])
+    titleStamp = zlib.crc32(state['title'].encode('utf-8')) # renaming doesn't change the revision
+    etag = '%d-%d-%d-%08x-%s' % (bid, state['revision'], lastMove, titleStamp, fmt)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        try:
+            data = export_pool.render((bid, state['revision'], lastMove, state['title']), fmt, lambda: load_board_export(bid, state['title'], pending))
+        except ExportUnavailable as e:
+            return jsonify(error=e.args[0]), 501
+        except ExportBusy:
+            abort(503)
+        response = Response(data, mimetype=FORMATS[fmt][1])
+        if request.args.get('download'):
+            response.headers['Content-Disposition'] = 'attachment; filename="board-%d.%s"' % (bid, fmt)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if datetime.strptime(state['done_at'], '%Y-%m-%d %H:%M:%S') <= datetime.utcnow():
+        response.cache_control.max_age = 86400 # done boards don't change anymore
+    else:
+        response.cache_control.no_cache = True
+    return response
 
+def ndjson_response(records, filename):
+    """Stream the NDJSON lines of a generator of ``dump.py`` records (which takes a database connection) as a download.
+    The generator gets a pooled connection of its own, held until it's done, since the request's is given back before the response is sent.
+    """
+    pool = get_pool()
+    def generate():
+        with pool.connection() as db:
+            for line in dump.ndjson(records(db)):
+                yield line
+    return Response(generate(), mimetype='application/x-ndjson', headers={'Content-Disposition': 'attachment; filename="%s"' % filename})
+
+@app.route('/api/board/<boardID>/export.ndjson', methods=['GET'])
+def dump_board(boardID):
+    """Download the full history of a board as NDJSON (see dump.py), streamed as it's read. Deleted components are left out with ``deleted=0``."""
+    bid = int(boardID)
+    caller_board_state(bid, request.args.get('invite', '-1', str))
+    deleted = request.args.get('deleted', 1, int) != 0
+    return ndjson_response(lambda db: dump.board_records(db, bid, deleted), 'board-%d.ndjson' % bid)
+
+@app.route('/api/boards/export.ndjson', methods=['GET'])
+def dump_boards():
+    """Download all the boards of the logged in user (created or invited to) as NDJSON, like ``dump_board()``."""
+    if not session.get('logged_in'):
+        abort(401)
+    uid = session['userid']
+    deleted = request.args.get('deleted', 1, int) != 0
+    return ndjson_response(lambda db: dump.user_records(db, uid, deleted), 'boards.ndjson')
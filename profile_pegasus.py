@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import argparse
+import pstats
+import sys
+from pegasus import app
+from pegasus.profiling import ProfileStore, merge_collapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Add up the request profiles saved in PROFILE_DIR (see pegasus/profiling.py).')
+    parser.add_argument('endpoints', nargs='*', help='endpoints to include (default: all)')
+    parser.add_argument('--dir', default=app.config['PROFILE_DIR'], help='profile directory (default: PROFILE_DIR, %(default)s)')
+    parser.add_argument('--list', action='store_true', help='list the endpoints and how many profiles each has')
+    parser.add_argument('--split', action='store_true', help='start every stack with its endpoint, to compare them in one flame graph')
+    parser.add_argument('--pstats', action='store_true', help='add up the cProfile profiles instead, and print the top functions')
+    parser.add_argument('--sort', default='cumulative', help='order of the --pstats listing (default: cumulative)')
+    parser.add_argument('--top', type=int, default=30, help='functions in the --pstats listing (default: 30)')
+    parser.add_argument('-o', '--output', help='write the collapsed stacks (or, with --pstats, the merged pstats file) here instead of printing them')
+    args = parser.parse_args(argv)
+
+    store = ProfileStore(args.dir)
+    if args.list:
+        for endpoint in store.endpoints():
+            print('%-30s %4d sampled %4d cprofile' % (endpoint, len(store.files([endpoint], 'sampling')), len(store.files([endpoint], 'cprofile'))))
+    elif args.pstats:
+        paths = store.files(args.endpoints, 'cprofile')
+        if not paths:
+            sys.exit('No cProfile profiles in %s' % args.dir)
+        stats = pstats.Stats(*paths)
+        if args.output:
+            stats.dump_stats(args.output)
+        else:
+            stats.sort_stats(args.sort).print_stats(args.top)
+    else:
+        stacks = {}
+        for endpoint in args.endpoints or store.endpoints():
+            for stack, count in merge_collapsed(store.files([endpoint], 'sampling'), endpoint if args.split else None).items():
+                stacks[stack] = stacks.get(stack, 0) + count
+        if not stacks:
+            sys.exit('No sampled profiles in %s' % args.dir)
+        out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1]): # feed to flamegraph.pl or speedscope
+                out.write('%s %d\n' % (stack, count))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == '__main__':
+    main()
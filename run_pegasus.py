@@ -1,13 +1,98 @@
 #!/usr/bin/env python3
 import argparse
-from pegasus import app
+import os
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError: # --production is off without it
+    BaseApplication = None
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-ip', help='type in an IP address', type=str, default='127.0.0.1', nargs='?', metavar='IP ADDRESS')
 parser.add_argument('-port', help='type in a port number', type=int, choices=range(0, 65535), default=5000, metavar='PORT NUMBER', nargs='?')
 parser.add_argument('--debug', dest='debug', action='store_true')
 parser.add_argument('--no-debug', dest='debug', action='store_false')
+parser.add_argument('--config', metavar='FILE', help='settings file overriding the defaults in pegasus/__init__.py (same as setting PEGASUS_SETTINGS)')
+parser.add_argument('--asgi', action='store_true', help='serve with uvicorn through pegasus/asgi.py (waiting clients don\'t take a thread each)')
+production = parser.add_argument_group('production', 'serve with gunicorn instead of the development server')
+production.add_argument('--production', action='store_true', help='use gunicorn (debug is always off)')
+production.add_argument('--workers', type=int, default=1, help='worker processes (default: 1). More than one needs the sqlite LOCK_BACKEND and a CHANGE_BUS other than local')
+production.add_argument('--threads', type=int, default=8, help='threads per worker (default: 8). Each open update stream or long-poll takes one')
+production.add_argument('--keepalive', type=int, default=5, help='seconds to keep idle client connections open (default: 5)')
+production.add_argument('--backlog', type=int, default=2048, help='connections that can wait to be accepted (default: 2048)')
+production.add_argument('--graceful-timeout', type=int, default=30, help='seconds workers get to finish their requests on restart or shutdown (default: 30)')
+production.add_argument('--timeout', type=int, default=60, help='seconds before a silent worker is killed and restarted (default: 60)')
+production.add_argument('--max-requests', type=int, default=0, help='restart workers after this many requests, 0 for never (default: 0)')
 parser.set_defaults(debug=True)
-args = parser.parse_args()
 
-app.run(host=args.ip, port=args.port, debug=args.debug)
+
+if BaseApplication is not None:
+    class ProductionServer(BaseApplication):
+        """Runs the app with gunicorn, configured from the command line instead of a gunicorn config file."""
+
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            BaseApplication.__init__(self)
+
+        def load_config(self):
+            for name, value in self.options.items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            return self.application
+
+
+def child_exit(server, worker):
+    """gunicorn hook: a worker exited, its metrics file goes (its counters are kept, see pegasus/metrics.py)."""
+    from pegasus import app
+    if app.config['METRICS_ENABLED'] and app.config['METRICS_DIR']:
+        from pegasus.metrics import mark_process_dead
+        mark_process_dead(app.config['METRICS_DIR'], worker.pid)
+
+def production_options(args):
+    """The gunicorn settings for the command line `args`."""
+    return {
+        'bind': '%s:%d' % (args.ip, args.port),
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread', # threads even with --threads 1, so keep-alive works
+        'keepalive': args.keepalive,
+        'backlog': args.backlog,
+        'graceful_timeout': args.graceful_timeout,
+        'timeout': args.timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10, # so workers don't all restart at once
+        'child_exit': child_exit,
+    }
+
+def main(argv=None):
+    # Only ever run as a script: worker processes started by the hashing and export pools (forkserver/spawn) import this file again
+    args = parser.parse_args(argv)
+    if args.config:
+        os.environ['PEGASUS_SETTINGS'] = os.path.abspath(args.config) # before the app is imported, so everything is set up with it
+    from pegasus import app
+
+    if args.production and args.workers > 1 and (app.config['LOCK_BACKEND'] == 'local' or app.config['CHANGE_BUS'] == 'local'):
+        print('Warning: with more than one worker, set LOCK_BACKEND = \'sqlite\' and CHANGE_BUS to \'socket\' or \'data_version\', '
+              'or workers won\'t see each other\'s locks and changes.', file=sys.stderr)
+
+    if args.asgi:
+        try:
+            import uvicorn
+        except ImportError:
+            sys.exit('--asgi needs uvicorn (pip install uvicorn)')
+        uvicorn.run('pegasus.asgi:application', host=args.ip, port=args.port, workers=args.workers, backlog=args.backlog,
+                    timeout_keep_alive=args.keepalive, log_level='debug' if args.debug and not args.production else 'info')
+    elif args.production:
+        if BaseApplication is None:
+            sys.exit('--production needs gunicorn (pip install gunicorn)')
+        app.config['DEBUG'] = False
+        ProductionServer(app, production_options(args)).run()
+    else:
+        app.run(host=args.ip, port=args.port, debug=args.debug, threaded=True) # threaded so open update streams don't block everyone else
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,10 @@ import os
 import pegasus
 import unittest
 import tempfile
+import sqlite3
+import threading
+import time
+import json
 from bs4 import BeautifulSoup
 
 class PegasusTestCase(unittest.TestCase):
@@ -85,6 +89,12 @@ class PegasusTestCase(unittest.TestCase):
         data['old-password'] = old_password
         return self.app.post('/_changePassword', data = data, follow_redirects = True)
 
+    def post_component(self, boardID, message, ty='chat', position='None'):
+        """Post a component to a board while logged in"""
+        data = dict(message = message, invite = '-1', position = position)
+        data['content-type'] = ty
+        return self.app.post('/api/board/' + boardID + '/components/post', data = data)
+
     def test_basic_ops(self):
         """
         Sequence of tests divided into categories:
@@ -158,6 +168,1031 @@ class PegasusTestCase(unittest.TestCase):
         assert rv.status == '404 NOT FOUND'
         print(prefix + success)
 
+    def test_board_updates(self):
+        """
+        Board update stream:
+            a. The first event has the current state of the board
+            b. A chat message posted after that is pushed to the stream
+        Long-polling:
+            c. Get "Nothing new." once the wait is over if nothing changed
+            d. Get the new message (and only that) as soon as it's posted while waiting
+        Reconnecting:
+            e. A Last-Event-ID that isn't a revision is ignored, since_rev is used instead
+        """
+        keepalive, duration = pegasus.app.config['STREAM_KEEPALIVE'], pegasus.app.config['STREAM_MAX_DURATION']
+        pegasus.app.config['STREAM_KEEPALIVE'] = 1
+        pegasus.app.config['STREAM_MAX_DURATION'] = 2
+        try:
+            self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+            self.create('New Board')
+            rv = self.app.get('/api/board/1/components/stream?invite=-1&lastModified=0', buffered = False)
+            assert rv.mimetype == 'text/event-stream'
+            events = iter(rv.response)
+            event = next(events).decode()
+            assert '"messages": []' in event
+            self.post_component('1', 'hello there')
+            event = next(events).decode()
+            assert 'hello there' in event
+            rv.close()
+            rv = self.app.get('/api/board/1/components/get?invite=-1&lastModified=9999-12-31&wait=0.2')
+            assert b'Nothing new.' in rv.data
+            other = pegasus.app.test_client()
+            other.post('/login', data = dict(username = 'scott', password = 'tiger123'))
+            data = dict(message = 'anyone?', invite = '-1', position = 'None')
+            data['content-type'] = 'chat'
+            rv = self.app.get('/api/board/1/components/get?invite=-1&lastModified=0')
+            revision = json.loads(rv.data.decode())['revision']
+            poster = threading.Timer(0.2, other.post, ['/api/board/1/components/post'], dict(data = data))
+            poster.start()
+            started = time.time()
+            rv = self.app.get('/api/board/1/components/get', query_string = dict(invite = '-1', since_rev = revision, wait = 10))
+            poster.join()
+            assert b'anyone?' in rv.data
+            assert b'hello there' not in rv.data
+            assert time.time() - started < 5
+            assert json.loads(rv.data.decode())['revision'] == revision + 1
+            rv = self.app.get('/api/board/1/components/stream?invite=-1&since_rev=%d' % revision, headers={'Last-Event-ID': 'bogus'}, buffered = False)
+            assert rv.status_code == 200
+            event = next(iter(rv.response)).decode()
+            assert 'anyone?' in event and 'hello there' not in event
+            rv.close()
+        finally:
+            pegasus.app.config['STREAM_KEEPALIVE'] = keepalive
+            pegasus.app.config['STREAM_MAX_DURATION'] = duration
+        print('[BOARD UPDATES]: OK')
+
+    def test_asgi(self):
+        """
+        ASGI serving (asgi.py):
+            a. Plain requests get the same answers as through WSGI
+            b. A long-poll is parked until the board changes, then gets the change
+            c. An update stream pushes the current state and then new changes, and stops when the client goes away
+            d. Other streamed responses (NDJSON dumps) are sent as they're produced
+            e. Long-polls are counted once each, as long-polls, in the metrics
+        """
+        import asyncio
+        from pegasus.asgi import application
+        keepalive = pegasus.app.config['STREAM_KEEPALIVE']
+        pegasus.app.config['STREAM_KEEPALIVE'] = 1
+        try:
+            self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+            self.create('New Board')
+            cookie = '; '.join('%s=%s' % (c.name, c.value) for c in self.app.cookie_jar).encode()
+            def request(path, query, disconnect):
+                scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'headers': [(b'cookie', cookie)]}
+                messages = [{'type': 'http.request', 'body': b''}]
+                sent = []
+                async def receive():
+                    if messages:
+                        return messages.pop(0)
+                    await disconnect.wait()
+                    return {'type': 'http.disconnect'}
+                async def send(message):
+                    sent.append(message)
+                return application(scope, receive, send), sent
+            def body(sent):
+                return b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body').decode()
+            async def scenario():
+                disconnect = asyncio.Event()
+                call, sent = request('/api/board/1/components/get', 'invite=-1', disconnect)
+                await call
+                assert sent[0]['status'] == 200 and json.loads(body(sent))['revision'] == 0
+                pegasus.metrics_registry.reset()
+                call, sent = request('/api/board/1/components/get', 'invite=-1&since_rev=0&wait=10', disconnect)
+                poll = asyncio.ensure_future(call)
+                await asyncio.sleep(0.2)
+                assert not poll.done()
+                await asyncio.get_event_loop().run_in_executor(None, self.post_component, '1', 'hello there')
+                await asyncio.wait_for(poll, 5)
+                assert 'hello there' in body(sent)
+                call, sent = request('/api/board/1/components/get', 'invite=-1&since_rev=1&wait=0.2', disconnect)
+                await asyncio.wait_for(call, 5)
+                assert 'Nothing new.' in body(sent)
+                assert pegasus.views.polls._values == {('changes', 'long_poll'): 1, ('empty', 'long_poll'): 1}
+                call, sent = request('/api/board/1/components/stream', 'invite=-1&since_rev=0', disconnect)
+                stream = asyncio.ensure_future(call)
+                await asyncio.sleep(0.2)
+                assert 'hello there' in body(sent)
+                await asyncio.get_event_loop().run_in_executor(None, self.post_component, '1', 'anyone?')
+                await asyncio.sleep(0.2)
+                assert 'anyone?' in body(sent)
+                disconnect.set()
+                await asyncio.wait_for(stream, 5)
+                call, sent = request('/api/board/1/export.ndjson', 'invite=-1', asyncio.Event())
+                await asyncio.wait_for(call, 5)
+                assert [json.loads(line)['record'] for line in body(sent).splitlines()] == ['board', 'component', 'component']
+                assert sum(1 for m in sent if m.get('more_body')) == 3
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(scenario())
+            finally:
+                loop.close()
+        finally:
+            pegasus.app.config['STREAM_KEEPALIVE'] = keepalive
+        print('[ASGI]: OK')
+
+    def test_component_cache(self):
+        """
+        Component cache:
+            a. Polls of the same board revision are served from memory
+            b. Writes update the cached snapshot instead of throwing it away
+            c. Deltas are the same with the cache turned off
+            d. A snapshot that's behind (another process wrote to the board) is caught up with what changed, not read again
+        """
+        from pegasus.views import component_cache
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('New Board')
+        self.post_component('1', 'first')
+        get = lambda since: json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d' % since).data.decode())
+        get(0)
+        get(0)
+        assert component_cache.stats()['hits'] == 1
+        self.post_component('1', 'second')
+        self.post_component('1', 'third')
+        cached = get(1)
+        assert component_cache.stats()['misses'] == 1
+        assert [m['content'] for m in cached['messages']] == ['second', 'third']
+        pegasus.app.config['COMPONENT_CACHE_ENABLED'] = False
+        try:
+            assert get(1) == cached
+        finally:
+            pegasus.app.config['COMPONENT_CACHE_ENABLED'] = True
+        revision = get(0)['revision']
+        db = pegasus.connect_db()
+        db.execute("update boards set revision=revision+1 where id=1")
+        db.execute("update board_content set content='second!', revision=? where content='second'", [revision + 1])
+        db.commit()
+        db.close()
+        pegasus.sql_recorder.reset()
+        assert [(m['content'], m['revision']) for m in get(revision)['messages']] == [('second!', revision + 1)]
+        assert [m['content'] for m in get(0)['messages']] == ['first', 'third', 'second!']
+        statements = [s['sql'] for s in pegasus.sql_recorder.snapshot(100)['statements']]
+        assert not any(sql.endswith('where boardID=? order by revision') for sql in statements), statements
+        print('[COMPONENT CACHE]: OK')
+
+    def test_access_cache(self):
+        """
+        Cached access decisions are dropped as soon as access changes:
+            a. An invited user sees the board right after being invited
+            b. Changing the invite from edit to view takes effect right away
+            c. Removing yourself from a board takes effect right away
+        """
+        self.register('Tammy', 'tammy', 'catfish122', 'tammy@catfish.org')
+        self.logout()
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('New Board')
+        self.logout()
+        self.login('tammy', 'catfish122')
+        assert self.app.get('/api/board/1/components/get?invite=-1').status_code == 401
+        self.logout()
+        self.login('scott', 'tiger123')
+        self.app.post('/api/invite/user/tammy@catfish.org/board/1', data = dict(type = 'edit'))
+        self.logout()
+        self.login('tammy', 'catfish122')
+        assert self.app.get('/api/board/1/components/get?invite=-1').status_code == 200
+        assert b'None' in self.post_component('1', 'some text', 'text', '{"top": 0, "left": 0}').data
+        self.logout()
+        self.login('scott', 'tiger123')
+        self.app.post('/_editInvite', data = dict(boardID = '1', email = 'tammy@catfish.org', inviteType = 'edit'))
+        self.logout()
+        self.login('tammy', 'catfish122')
+        assert b'None' not in self.post_component('1', 'more text', 'text', '{"top": 0, "left": 0}').data
+        self.app.post('/_removeSelf', data = dict(boardID = '1'))
+        assert self.app.get('/api/board/1/components/get?invite=-1').status_code == 401
+        print('[ACCESS CACHE]: OK')
+
+    def test_write_access(self):
+        """
+        Writing to a board:
+            a. Viewers can chat but not post other components
+            b. Editors can't post or edit while another editor holds the lock, and get an error instead of a 401
+            c. Editing and deleting need edit access
+        """
+        self.register('Tammy', 'tammy', 'catfish122', 'tammy@catfish.org')
+        self.logout()
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('New Board')
+        self.app.post('/api/invite/user/tammy@catfish.org/board/1', data = dict(type = 'view'))
+        self.logout()
+        self.login('tammy', 'catfish122')
+        assert b'None' in self.post_component('1', 'hi').data
+        assert b'priviliges' in self.post_component('1', 'some text', 'text', '{"top": 0, "left": 0}').data
+        assert self.app.post('/api/delete/board/1/component/1', data = dict(invite = '-1')).status_code == 401
+        self.logout()
+        self.login('scott', 'tiger123')
+        self.app.post('/_editInvite', data = dict(boardID = '1', email = 'tammy@catfish.org', inviteType = 'view'))
+        componentID = json.loads(self.post_component('1', 'some text', 'text', '{"top": 0, "left": 0}').data.decode())['componentID']
+        self.logout()
+        self.login('tammy', 'catfish122')
+        assert b'locked' in self.post_component('1', 'more text', 'text', '{"top": 0, "left": 0}').data
+        data = {'invite': '-1', 'content-type': 'text', 'hasMessages': 'false', 'position': '{"top": 1, "left": 1}'}
+        rv = self.app.post('/api/edit/board/1/component/%d' % componentID, data = data)
+        assert rv.status_code == 200 and b'locked' in rv.data
+        assert b'None' in self.post_component('1', 'still chatting').data
+        print('[WRITE ACCESS]: OK')
+
+    def test_batch_components(self):
+        """
+        Batched component changes:
+            a. Inserts, updates, moves and deletes are applied in order, each with its own result and revision
+            b. A bad operation doesn't stop the others
+            c. Viewers can only batch chat messages
+            d. Unknown operations and operations without a content type fail on their own
+            e. A batch that's rolled back leaves the moves waiting in the position buffer as they were
+        """
+        self.register('Tammy', 'tammy', 'catfish122', 'tammy@catfish.org')
+        self.logout()
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('New Board')
+        self.app.post('/api/invite/user/tammy@catfish.org/board/1', data = dict(type = 'view'))
+        def batch(operations):
+            rv = self.app.post('/api/board/1/components/batch', data = dict(invite = '-1', operations = json.dumps(operations)))
+            return json.loads(rv.data.decode())
+        ops = [{'op': 'insert', 'content-type': 'text', 'message': 'one', 'position': '{"top": 0, "left": 0}'},
+               {'op': 'insert', 'content-type': 'text', 'message': 'two', 'position': '{"top": 0, "left": 0}'},
+               {'op': 'insert', 'content-type': 'text', 'message': '', 'position': '{"top": 0, "left": 0}'}]
+        data = batch(ops)
+        assert data['error'] == 'None'
+        assert [r['error'] for r in data['results']] == ['None', 'None', 'Content too short.']
+        first, second = data['results'][0]['id'], data['results'][1]['id']
+        data = batch([{'op': 'move', 'id': first, 'content-type': 'text', 'position': '{"top": 5, "left": 5}'},
+                      {'op': 'update', 'id': second, 'content-type': 'text', 'message': 'deux'},
+                      {'op': 'delete', 'id': first},
+                      {'op': 'move', 'id': 999, 'content-type': 'text', 'position': '{"top": 5, "left": 5}'}])
+        assert [r['error'] for r in data['results']] == ['None', 'None', 'None', 'No such component.']
+        assert data['results'][0]['revision'] < data['results'][2]['revision'] <= data['revision']
+        components = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=0').data.decode())['messages']
+        assert [(c['content'], c['deleted']) for c in components] == [('deux', 'N'), ('one', 'Y')]
+        data = batch([{'op': 'rename'}, {'op': 'insert', 'message': 'three'}, {'op': 'update', 'id': second, 'message': 'drei'}])
+        assert data['error'] == 'None'
+        assert [r['error'] for r in data['results']] == ['Unknown operation.', 'Missing content type.', 'Missing content type.']
+        buffer = pegasus.views.position_buffer
+        buffer.window = 60 # flushed by hand below
+        db = pegasus.connect_db()
+        try:
+            self.app.post('/api/edit/board/1/component/%d' % second, data = {'invite': '-1', 'content-type': 'text', 'hasMessages': 'false', 'position': '{"top": 7, "left": 7}'})
+            db.execute("create trigger boom before insert on board_content when new.content = 'boom' begin select raise(abort, 'boom'); end")
+            db.commit()
+            data = batch([{'op': 'move', 'id': second, 'content-type': 'text', 'position': '{"top": 1, "left": 1}'},
+                          {'op': 'insert', 'content-type': 'text', 'message': 'boom', 'position': '{}'}])
+            assert data['error'] == 'boom' and data['results'] == []
+            assert buffer.flush() == 1
+            assert db.execute('select position from board_content where id=?', [second]).fetchone()[0] == '{"top": 7, "left": 7}'
+        finally:
+            db.execute('drop trigger if exists boom')
+            db.commit()
+            db.close()
+            buffer.window = pegasus.app.config['POSITION_COALESCE_WINDOW']
+        self.logout()
+        self.login('tammy', 'catfish122')
+        assert 'priviliges' in batch(ops[:1])['error']
+        data = batch([{'op': 'insert', 'content-type': 'chat', 'message': 'hi'}])
+        assert data['error'] == 'None' and data['results'][0]['error'] == 'None'
+        print('[BATCH COMPONENTS]: OK')
+
+    def test_position_coalescing(self):
+        """
+        Buffered position updates:
+            a. Moves aren't written right away, but readers see them (once)
+            b. Only the latest position of a component is written when the buffer is flushed, with a new revision
+            c. Deleting a component drops its pending move
+            d. Moves of a board deleted in the meantime are skipped, and don't hold up the others
+            e. Moves that fail to be written are only kept for another try if the error is one worth retrying
+            f. Moving a component that isn't on the board is an error, and nothing is buffered
+            g. A move made under a lock that someone else has taken since isn't written
+        """
+        from pegasus.coalesce import PositionBuffer
+        buffer = pegasus.views.position_buffer
+        buffer.window = 60 # flushed by hand below
+        try:
+            self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+            self.create('New Board')
+            first = json.loads(self.post_component('1', 'one', 'text', '{"top": 0, "left": 0}').data.decode())['componentID']
+            second = json.loads(self.post_component('1', 'two', 'text', '{"top": 0, "left": 0}').data.decode())['componentID']
+            data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=0').data.decode())
+            revision = data['revision']
+            for left in range(1, 6):
+                data = {'invite': '-1', 'content-type': 'text', 'hasMessages': 'false', 'position': '{"top": 0, "left": %d}' % left}
+                assert b'None' in self.app.post('/api/edit/board/1/component/%d' % first, data = data).data
+            db = pegasus.connect_db()
+            assert db.execute('select position from board_content where id=?', [first]).fetchone()[0] == '{"top": 0, "left": 0}'
+            data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d' % revision).data.decode())
+            assert [(c['id'], c['position']) for c in data['messages']] == [(first, '{"top": 0, "left": 5}')]
+            data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d&moves_since=%d' % (revision, data['moveSeq'])).data.decode())
+            assert data['error'] == 'Nothing new.'
+            data = {'invite': '-1', 'content-type': 'text', 'hasMessages': 'false', 'position': '{"top": 9, "left": 9}'}
+            self.app.post('/api/edit/board/1/component/%d' % second, data = data)
+            self.app.post('/api/delete/board/1/component/%d' % second, data = dict(invite = '-1'))
+            assert buffer.flush() == 1
+            assert db.execute('select position from board_content where id=?', [first]).fetchone()[0] == '{"top": 0, "left": 5}'
+            assert db.execute('select position from board_content where id=?', [second]).fetchone()[0] == '{"top": 0, "left": 0}'
+            data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d' % revision).data.decode())
+            assert [c['id'] for c in data['messages']] == [second, first] and data['revision'] == revision + 2
+            self.create('Doomed Board')
+            third = json.loads(self.post_component('2', 'three', 'text', '{"top": 0, "left": 0}').data.decode())['componentID']
+            for cid, board in [(third, '2'), (first, '1')]:
+                data = {'invite': '-1', 'content-type': 'text', 'hasMessages': 'false', 'position': '{"top": 7, "left": 7}'}
+                self.app.post('/api/edit/board/%s/component/%d' % (board, cid), data = data)
+            db.execute('delete from boards where id=2') # by another process, which can't drop our pending move
+            db.commit()
+            assert buffer.flush() == 2 and buffer.pending(2) == {} and buffer.flush() == 0
+            assert db.execute('select position from board_content where id=?', [first]).fetchone()[0] == '{"top": 7, "left": 7}'
+            data = {'invite': '-1', 'content-type': 'text', 'hasMessages': 'false', 'position': '{"top": 8, "left": 8}'}
+            assert b'No such component' in self.app.post('/api/edit/board/1/component/%d' % third, data = data).data
+            assert buffer.pending(1) == {}
+            self.app.post('/api/edit/board/1/component/%d' % first, data = data)
+            db.execute('update boards set lock_token=lock_token+100 where id=1') # a later holder wrote in the meantime
+            db.commit()
+            assert buffer.flush() == 1
+            assert db.execute('select position from board_content where id=?', [first]).fetchone()[0] == '{"top": 7, "left": 7}'
+            db.close()
+            def fail(moves):
+                raise error
+            failing = PositionBuffer(fail, window=60, retry=(sqlite3.OperationalError,))
+            for error, kept in [(sqlite3.OperationalError('database is locked'), [1]), (TypeError('bad move'), [])]:
+                failing.put(1, 1, 'text', '{}', '1')
+                try:
+                    failing.flush()
+                    assert False, 'should have raised'
+                except type(error):
+                    pass
+                assert list(failing.pending(1)) == kept
+            failing.reset()
+        finally:
+            buffer.window = pegasus.app.config['POSITION_COALESCE_WINDOW']
+        print('[POSITION COALESCING]: OK')
+
+    def test_locks(self):
+        """
+        Board locks:
+            a. Leases can be taken by one holder at a time, renewed (same token), released, and run out (new, bigger token)
+            b. Both the in-process and the SQLite backends behave the same
+            c. Releasing a lock through the API lets another editor in right away
+            d. Writes with an older fencing token than the last one are refused
+            e. Writes to a board that's gone raise BoardGone instead of crashing
+        """
+        from pegasus.locks import LocalLockManager, SQLiteLockManager, LockLost
+        fd, path = tempfile.mkstemp()
+        for locks in [LocalLockManager(lease=5), SQLiteLockManager(path, lease=5)]:
+            token = locks.acquire(1, 'scott')
+            assert token is not None and locks.holder(1).holder == 'scott'
+            assert locks.acquire(1, 'tammy') is None
+            assert locks.acquire(1, 'scott') == token
+            assert locks.renew(1, 'scott', token) and not locks.renew(1, 'scott', token + 1)
+            assert not locks.release(1, 'tammy') and locks.release(1, 'scott')
+            assert locks.holder(1) is None
+            newToken = locks.acquire(1, 'tammy', lease=0.01)
+            assert newToken > token
+            time.sleep(0.02)
+            assert locks.holder(1) is None and locks.acquire(1, 'scott') > newToken
+        locks.close()
+        os.close(fd)
+        os.unlink(path)
+        self.register('Tammy', 'tammy', 'catfish122', 'tammy@catfish.org')
+        self.logout()
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('New Board')
+        self.app.post('/api/invite/user/tammy@catfish.org/board/1', data = dict(type = 'view'))
+        self.app.post('/_editInvite', data = dict(boardID = '1', email = 'tammy@catfish.org', inviteType = 'view'))
+        assert b'None' in self.post_component('1', 'some text', 'text', '{"top": 0, "left": 0}').data
+        assert json.loads(self.app.post('/api/board/1/lock/release', data = dict(invite = '-1')).data.decode())['released']
+        self.logout()
+        self.login('tammy', 'catfish122')
+        assert b'None' in self.post_component('1', 'more text', 'text', '{"top": 0, "left": 0}').data
+        with pegasus.app.test_request_context():
+            pegasus.checkout_db()
+            token = pegasus.get_locks().holder(1).token
+            pegasus.views.next_revision(1, token)
+            try:
+                pegasus.views.next_revision(1, token - 1)
+                assert False, 'stale token accepted'
+            except LockLost:
+                pass
+            for args in [(2,), (2, token)]:
+                try:
+                    pegasus.views.next_revision(*args)
+                    assert False, 'no such board'
+                except pegasus.views.BoardGone:
+                    pass
+            pegasus.release_db()
+        print('[LOCKS]: OK')
+
+    def test_change_bus(self):
+        """
+        Change bus:
+            a. Events published on a socket bus reach the other processes' buses, not the publisher's twice
+            b. The data_version bus turns commits of other connections into board events, once each (only the changes since the last check are read)
+            c. Access events go through the data_version bus too
+            d. Board events wake up the waiters of this process
+        """
+        from pegasus.bus import SocketBus, DataVersionBus
+        directory = tempfile.mkdtemp()
+        first, second = SocketBus(directory, name='first'), SocketBus(directory, name='second')
+        got = {'first': [], 'second': []}
+        received = threading.Event()
+        first.subscribe(got['first'].append)
+        second.subscribe(lambda event: (got['second'].append(event), received.set()))
+        first.publish(dict(kind='board', board=1, revision=2))
+        assert received.wait(2)
+        assert got['first'] == got['second'] == [dict(kind='board', board=1, revision=2)]
+        first.close()
+        second.close()
+        os.rmdir(directory)
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('New Board')
+        bus = DataVersionBus(pegasus.app.config['DATABASE'], interval=60) # checked by hand below
+        assert bus.check() == []
+        self.post_component('1', 'hi')
+        assert bus.check() == [dict(kind='board', board=1, revision=1)]
+        bus.publish(dict(kind='board', board=1, revision=2)) # made in this process, delivered already
+        self.post_component('1', 'hello')
+        assert bus.check() == []
+        self.create('Other Board')
+        db = pegasus.connect_db()
+        db.execute('delete from boards where id=1')
+        db.commit()
+        db.close()
+        assert bus.check() == [dict(kind='board', board=1, revision=None)]
+        assert bus.check() == []
+        other = DataVersionBus(pegasus.app.config['DATABASE'], interval=60)
+        heard = []
+        other.subscribe(heard.append)
+        other.publish(dict(kind='access', board=2, user=None, email=None))
+        assert bus.check() == [dict(kind='access', board=2, user=None, email=None)]
+        assert other.check() == [] and heard == [dict(kind='access', board=2, user=None, email=None)] # once, when published
+        other.close()
+        bus.close()
+        version = pegasus.board_events.version(1)
+        pegasus.get_bus().publish(dict(kind='board', board=1, revision=None))
+        assert pegasus.board_events.version(1) == version + 1
+        print('[CHANGE BUS]: OK')
+
+    def test_password_hashing(self):
+        """
+        Password hashing:
+            a. Hashes made with an older PASSWORD_HASH_METHOD still work, and are upgraded on login
+            b. Changing the password checks the old one first
+            c. When too many hashes are waiting, logins get a 503
+            d. A pool whose workers died hashes in the calling thread, and is replaced
+            e. Signing up works through ./run_pegasus.py (the pool's workers import it again)
+        """
+        import signal
+        import socket
+        import subprocess
+        import sys
+        from urllib.request import urlopen
+        from urllib.parse import urlencode
+        from pegasus.hashing import HashingPool
+        method = pegasus.app.config['PASSWORD_HASH_METHOD']
+        pegasus.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.logout()
+        pegasus.app.config['PASSWORD_HASH_METHOD'] = method
+        db = pegasus.connect_db()
+        stored = lambda: db.execute('select password from users where username=?', ['scott']).fetchone()[0]
+        assert stored().startswith('pbkdf2:sha256:1000$')
+        assert b'Hey there' in self.login('scott', 'tiger123').data
+        assert stored().startswith(method + '$')
+        assert b'incorrect' in self.change_password('wrong', 'lion456').data
+        assert b'None' in self.change_password('tiger123', 'lion456').data
+        self.logout()
+        assert b'Hey there' in self.login('scott', 'lion456').data
+        self.logout()
+        db.close()
+        pool = pegasus.views.hashing_pool
+        slots = pool._slots
+        pool._slots = threading.BoundedSemaphore(1)
+        pool._slots.acquire() # someone else's hash
+        try:
+            assert self.login('scott', 'lion456').status_code == 503
+            assert b'Invalid username' in self.login('nobody', 'lion456').data # no hashing needed to turn them away
+        finally:
+            pool._slots = slots
+        pool = HashingPool(workers=1)
+        executor = pool._get_executor()
+        assert pool.check(pool.hash('tiger123', 'pbkdf2:sha256:1000'), 'tiger123')
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+        assert pool.check(pool.hash('tiger123', 'pbkdf2:sha256:1000'), 'tiger123')
+        assert pool._executor is not executor
+        assert pool.check(pool.hash('lion456', 'pbkdf2:sha256:1000'), 'lion456')
+        assert pool._executor is not None and pool._executor is not executor
+        pool.shutdown()
+        fd, config = tempfile.mkstemp(suffix='.py')
+        with os.fdopen(fd, 'w') as f:
+            f.write('DATABASE = %r\nCSRF_ENABLED = False\nPASSWORD_HASH_METHOD = %r\n' % (pegasus.app.config['DATABASE'], 'pbkdf2:sha256:1000'))
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        log = tempfile.TemporaryFile()
+        server = subprocess.Popen([sys.executable, 'run_pegasus.py', '--no-debug', '-port', str(port), '--config', config],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL, stderr=log,
+                                  start_new_session=True) # so its pool's processes can be stopped with it
+        try:
+            for i in range(100):
+                try:
+                    urlopen('http://127.0.0.1:%d/login' % port, timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            data = urlencode(dict(name='Tammy', username='tammy', password='catfish122', email='tammy@catfish.org')).encode('utf-8')
+            with urlopen('http://127.0.0.1:%d/register' % port, data, timeout=30) as rv:
+                assert rv.status == 200
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+            os.unlink(config)
+        log.seek(0)
+        log = log.read().decode('utf-8')
+        assert 'pool broken' not in log, log # not even saved by hashing in the request thread
+        db = pegasus.connect_db()
+        assert db.execute('select password from users where username=?', ['tammy']).fetchone()[0].startswith('pbkdf2:sha256:1000$')
+        db.close()
+        print('[PASSWORD HASHING]: OK')
+
+    def test_board_export(self):
+        """
+        Board export:
+            a. The canvas exports as SVG with the text where it was put, the chat and canvas as Markdown and text
+            b. Exports are rendered once per revision, and a client with the current one gets a 304
+            c. Only people with access can export, unknown formats are a 404, and PNG without Pillow is a 501
+            d. Concurrent requests for the same export load and render it once
+            e. Renaming the board changes the export (and its ETag), though not the revision
+            f. A pool whose workers died renders in the calling thread, and is replaced
+        """
+        from pegasus import export
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('Export Board')
+        self.post_component('1', 'Hello <there>', 'text', json.dumps({'top': 40, 'left': 120}))
+        self.post_component('1', 'hi all')
+        rv = self.app.get('/api/board/1/export.svg')
+        assert rv.status_code == 200 and rv.mimetype == 'image/svg+xml'
+        assert b'Hello &lt;there&gt;' in rv.data and b'x="120"' in rv.data and b'hi all' not in rv.data
+        rv = self.app.get('/api/board/1/export.md?download=1')
+        assert b'# Export Board' in rv.data and b'Hello <there>' in rv.data and b'**scott**' in rv.data and b'hi all' in rv.data
+        assert 'attachment' in rv.headers['Content-Disposition']
+        assert b'scott: hi all' in self.app.get('/api/board/1/export.txt').data
+        pool = pegasus.views.export_pool
+        rendered = pool.cache.misses
+        etag = self.app.get('/api/board/1/export.svg').headers['ETag']
+        assert pool.cache.misses == rendered
+        assert self.app.get('/api/board/1/export.svg', headers={'If-None-Match': etag}).status_code == 304
+        self.post_component('1', 'more')
+        assert b'more' in self.app.get('/api/board/1/export.md').data
+        assert self.app.get('/api/board/1/export.svg', headers={'If-None-Match': etag}).status_code == 200
+        etag = self.app.get('/api/board/1/export.md').headers['ETag']
+        self.app.post('/api/edit/board/1/title', data=dict(title='Renamed Board'))
+        rv = self.app.get('/api/board/1/export.md', headers={'If-None-Match': etag})
+        assert rv.status_code == 200 and b'# Renamed Board' in rv.data
+        assert self.app.get('/api/board/1/export.exe').status_code == 404
+        if export.Image is None:
+            assert self.app.get('/api/board/1/export.png').status_code == 501
+        else:
+            assert self.app.get('/api/board/1/export.png').data.startswith(b'\x89PNG')
+        self.logout()
+        self.register('Tammy', 'tammy', 'catfish122', 'tammy@catfish.org')
+        assert self.app.get('/api/board/1/export.svg').status_code == 401
+        loads = []
+        def load():
+            loads.append(1)
+            time.sleep(0.1)
+            return dict(title='Busy Board', components=[])
+        pool = export.ExportPool(workers=0)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.render(('1-1', 1), 'txt', load))) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(loads) == 1 and len(results) == 4 and len(set(results)) == 1
+        pool = export.ExportPool(workers=1)
+        assert b'Busy Board' in pool.render(('1-1', 1), 'txt', load)
+        executor = pool._executor
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+        assert b'Busy Board' in pool.render(('1-2', 2), 'txt', load)
+        assert pool._executor is not executor
+        assert b'Busy Board' in pool.render(('1-3', 3), 'txt', load)
+        assert pool._executor is not None and pool._executor is not executor
+        pool.shutdown()
+        print('[BOARD EXPORT]: OK')
+
+    def test_board_dump(self):
+        """
+        NDJSON dumps:
+            a. A board dumps as its board record and then all its components in the order they changed, deleted ones included unless asked not to
+            b. A user's dump has all the boards they created or were invited to, and nobody else's
+            c. Only people with access can dump a board
+        """
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('First Board')
+        self.post_component('1', 'one')
+        rv = self.post_component('1', 'gone', 'text', json.dumps({'top': 0, 'left': 0}))
+        self.app.post('/api/delete/board/1/component/' + str(json.loads(rv.data)['componentID']), data=dict(invite='-1'))
+        self.post_component('1', 'two')
+        self.logout()
+        self.register('Tammy', 'tammy', 'catfish122', 'tammy@catfish.org')
+        self.create('Tammy Board')
+        self.app.post('/api/invite/user/scott@tiger.org/board/2', data = dict(type = 'view'))
+        self.create('Private Board')
+        self.logout()
+        self.login('scott', 'tiger123')
+        rv = self.app.get('/api/board/1/export.ndjson')
+        assert rv.mimetype == 'application/x-ndjson'
+        records = [json.loads(line) for line in rv.data.decode('utf-8').splitlines()]
+        assert records[0]['record'] == 'board' and records[0]['title'] == 'First Board'
+        assert [r['content'] for r in records[1:]] == ['one', 'gone', 'two'] and records[2]['deleted'] == 'Y'
+        records = [json.loads(line) for line in self.app.get('/api/board/1/export.ndjson?deleted=0').data.decode('utf-8').splitlines()]
+        assert [r['content'] for r in records[1:]] == ['one', 'two']
+        records = [json.loads(line) for line in self.app.get('/api/boards/export.ndjson').data.decode('utf-8').splitlines()]
+        assert [r['title'] for r in records if r['record'] == 'board'] == ['First Board', 'Tammy Board']
+        assert self.app.get('/api/board/3/export.ndjson').status_code == 401
+        self.logout()
+        assert self.app.get('/api/boards/export.ndjson').status_code == 401
+        print('[BOARD DUMP]: OK')
+
+    def test_chat_pages(self):
+        """
+        Chat pages:
+            a. The first load has all the canvas components but only the latest CHAT_PAGE_SIZE chat messages, and a cursor for the rest
+            b. Going back with the cursor gets the earlier chat a page at a time, until there's none left
+            c. Later polls get every change as before, and it's all the same with the component cache off
+            d. An edited chat message stays where it was said, on the same page with the cache on or off
+        """
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('Chatty Board')
+        self.post_component('1', 'on the canvas', 'text', json.dumps({'top': 0, 'left': 0}))
+        for i in range(5):
+            self.post_component('1', 'chat %d' % i)
+        size = pegasus.app.config['CHAT_PAGE_SIZE']
+        cache = pegasus.app.config['COMPONENT_CACHE_ENABLED']
+        pegasus.app.config['CHAT_PAGE_SIZE'] = 2
+        try:
+            for enabled in (True, False):
+                pegasus.app.config['COMPONENT_CACHE_ENABLED'] = enabled
+                data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=0').data)
+                assert [m['content'] for m in data['messages']] == ['on the canvas', 'chat 3', 'chat 4']
+                assert data['revision'] == 6
+                pages = []
+                before = data['chatBefore']
+                while before is not None:
+                    page = json.loads(self.app.get('/api/board/1/components/get?invite=-1&before=%d' % before).data)
+                    pages.append([m['content'] for m in page['messages']])
+                    before = page['chatBefore']
+                assert pages == [['chat 1', 'chat 2'], ['chat 0']]
+            self.post_component('1', 'chat 5')
+            data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=3').data)
+            assert [m['content'] for m in data['messages']] == ['chat 2', 'chat 3', 'chat 4', 'chat 5']
+            assert data['chatBefore'] is None
+            data = {'invite': '-1', 'content-type': 'chat', 'hasMessages': 'true', 'message': 'chat 0 (edited)'}
+            assert b'None' in self.app.post('/api/edit/board/1/component/2', data = data).data
+            for enabled in (True, False):
+                pegasus.app.config['COMPONENT_CACHE_ENABLED'] = enabled
+                data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=0').data)
+                assert [m['content'] for m in data['messages']] == ['on the canvas', 'chat 4', 'chat 5'] and data['chatBefore'] == 6
+        finally:
+            pegasus.app.config['CHAT_PAGE_SIZE'] = size
+            pegasus.app.config['COMPONENT_CACHE_ENABLED'] = cache
+        assert len(json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=0').data)['messages']) == 7
+        print('[CHAT PAGES]: OK')
+
+    def test_benchmark(self):
+        """
+        Benchmark (bench_pegasus.py), in process with a tiny load:
+            a. Every request is timed and its queries counted, and the results have percentiles for every operation
+            b. The app is left pointing at its own database
+        """
+        import io
+        import bench_pegasus
+        database = pegasus.app.config['DATABASE']
+        results = bench_pegasus.main(['--users', '3', '--boards', '2', '--invites', '1', '--rows', '20', '--requests', '40', '--concurrency', '2'])
+        assert pegasus.app.config['DATABASE'] == database
+        assert results['total']['requests'] == 40 and results['total']['http_errors'] == 0
+        assert results['total']['queries_per_request'] > 0
+        assert set(results['operations']) <= set(bench_pegasus.OPERATIONS) and 'poll' in results['operations']
+        assert results['operations']['poll']['p50'] <= results['operations']['poll']['p99']
+        out = io.StringIO()
+        bench_pegasus.compare(results, results, out)
+        assert '+0.0%' in out.getvalue()
+        print('[BENCHMARK]: OK')
+
+    def test_sql_instrumentation(self):
+        """
+        SQL instrumentation:
+            a. With SQL_DEBUG_HEADERS, responses say how many queries, rows and commits their request made
+            b. /_sqlStats has the totals per endpoint and statement, for internal addresses only
+            c. Slow queries are logged without their parameters
+        """
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('Counted Board')
+        pegasus.app.config['SQL_DEBUG_HEADERS'] = True
+        try:
+            rv = self.post_component('1', 'hello')
+            assert int(rv.headers['X-SQL-Queries']) > 0 and rv.headers['X-SQL-Commits'] == '1'
+            rv = self.app.get('/api/board/1/components/get?invite=-1&since_rev=0')
+            assert int(rv.headers['X-SQL-Rows']) >= 1
+        finally:
+            pegasus.app.config['SQL_DEBUG_HEADERS'] = False
+        assert 'X-SQL-Queries' not in self.app.get('/api/board/1/components/get?invite=-1&since_rev=0').headers
+        stats = json.loads(self.app.get('/_sqlStats?top=100').data)
+        assert stats['endpoints']['get_components']['requests'] >= 2
+        assert stats['endpoints']['post_components']['commits'] >= 1
+        assert any('update boards set revision' in st['sql'] and 'post_components' in st['endpoints'] for st in stats['statements'])
+        assert self.app.get('/_sqlStats', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 404
+        self.app.get('/_sqlStats?reset=1')
+        assert 'post_components' not in json.loads(self.app.get('/_sqlStats').data)['endpoints']
+        self.logout()
+        slow = pegasus.app.config['SLOW_QUERY_MS']
+        pegasus.app.config['SLOW_QUERY_MS'] = 0
+        try:
+            with self.assertLogs('pegasus.sql', 'WARNING') as logs:
+                self.login('scott', 'tiger123')
+        finally:
+            pegasus.app.config['SLOW_QUERY_MS'] = slow
+        assert any('where username=?' in line and '<str>' in line for line in logs.output)
+        assert not any('scott' in line or 'tiger123' in line for line in logs.output)
+        print('[SQL INSTRUMENTATION]: OK')
+
+    def test_metrics(self):
+        """
+        Metrics:
+            a. /metrics has request latency histograms and counts, lock acquired/denied counts and empty/non-empty poll counts
+            b. Counting is safe from many threads at once
+            c. With METRICS_DIR, the metrics of all processes are added up (gauges only for processes still running)
+            d. The files of processes that are gone are removed, their counters are still counted
+        """
+        import subprocess
+        import sys
+        from pegasus import metrics
+        pegasus.metrics_registry.reset()
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('Measured Board')
+        self.app.post('/api/invite/user/tammy@catfish.org/board/1', data = dict(type = 'edit'))
+        self.post_component('1', 'mine now', 'text', json.dumps({'top': 0, 'left': 0}))
+        other = pegasus.app.test_client()
+        other.post('/register', data = dict(name='Tammy', username='tammy', password='catfish122', email='tammy@catfish.org'))
+        rv = other.post('/api/board/1/components/post', data = {'message': 'me too', 'content-type': 'text', 'position': '{}', 'invite': '-1'})
+        assert b'locked' in rv.data
+        data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=0').data)
+        self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d' % data['revision'])
+        text = self.app.get('/metrics').data.decode('utf-8')
+        assert 'pegasus_lock_attempts_total{result="acquired"} 1' in text and 'pegasus_lock_attempts_total{result="denied"} 1' in text
+        assert 'pegasus_polls_total{result="changes",mode="poll"} 1' in text and 'pegasus_polls_total{result="empty",mode="poll"} 1' in text
+        assert 'pegasus_requests_total{endpoint="get_components",status="200"} 2' in text
+        assert 'pegasus_request_duration_seconds_bucket{endpoint="get_components",method="GET",le="+Inf"} 2' in text
+        assert 'pegasus_requests_in_flight 1' in text # the /metrics request itself
+        assert 'pegasus_db_checkout_seconds_count' in text
+        assert self.app.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 404
+        registry = metrics.Registry()
+        counter = registry.counter('test_total', 'Test.', ['n'])
+        threads = [threading.Thread(target=lambda: [counter.inc(n='x') for i in range(1000)]) for t in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert 'test_total{n="x"} 8000' in registry.render()
+        directory = tempfile.mkdtemp()
+        gone = subprocess.Popen([sys.executable, '-c', 'pass'])
+        gone.wait()
+        with open(os.path.join(directory, '%d.json' % gone.pid), 'w') as f:
+            json.dump(dict(pid=gone.pid, time=0, metrics={
+                'pegasus_lock_attempts_total': dict(type='counter', help='x', labels=['result'], values=[[['denied'], 5]]),
+                'pegasus_requests_in_flight': dict(type='gauge', help='x', labels=[], values=[[[], 7]]),
+            }), f)
+        pegasus.app.config['METRICS_DIR'] = directory
+        try:
+            text = self.app.get('/metrics').data.decode('utf-8')
+        finally:
+            pegasus.app.config['METRICS_DIR'] = None
+        assert 'pegasus_lock_attempts_total{result="denied"} 6' in text
+        assert 'pegasus_requests_in_flight 1' in text
+        assert sorted(os.listdir(directory)) == sorted(['%d.json' % os.getpid(), 'dead.json', 'dead.lock'])
+        assert not metrics.mark_process_dead(directory, gone.pid) # already done
+        with open(os.path.join(directory, '%d.json' % gone.pid), 'w') as f: # say it came back and died again
+            json.dump(dict(pid=gone.pid, time=0, metrics={
+                'pegasus_lock_attempts_total': dict(type='counter', help='x', labels=['result'], values=[[['denied'], 3]]),
+            }), f)
+        assert metrics.mark_process_dead(directory, gone.pid)
+        with open(os.path.join(directory, 'dead.json')) as f:
+            assert json.load(f)['metrics'] == {'pegasus_lock_attempts_total': dict(type='counter', help='x', labels=['result'], values=[[['denied'], 8]])}
+        for filename in os.listdir(directory):
+            os.unlink(os.path.join(directory, filename))
+        os.rmdir(directory)
+        print('[METRICS]: OK')
+
+    def test_profiling(self):
+        """
+        Profiling:
+            a. Only requests with the right X-Profile header are profiled, and the response says where the profile went
+            b. Only the last PROFILE_KEEP profiles of an endpoint are kept
+            c. With PROFILER = 'cprofile', a pstats file is saved
+            d. merge_collapsed adds up the collapsed stacks of several profiles
+        """
+        import pstats
+        import shutil
+        from pegasus import profiling
+        directory = tempfile.mkdtemp()
+        pegasus.app.config.update(PROFILE_TOKEN='s3cret', PROFILE_DIR=directory, PROFILE_KEEP=2, PROFILE_INTERVAL=0.001)
+        try:
+            self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+            self.create('Profiled Board')
+            rv = self.app.get('/api/board/1/components/get?invite=-1', headers={'X-Profile': 'wrong'})
+            assert 'X-Profile' not in rv.headers and not os.listdir(directory)
+            rv = self.app.get('/api/board/1/components/get?invite=-1', headers={'X-Profile': 's3cret'})
+            assert rv.status_code == 200 and rv.headers['X-Profile'].startswith('get_components' + os.sep)
+            assert rv.headers['X-Profile'].endswith('.collapsed') and os.path.exists(os.path.join(directory, rv.headers['X-Profile']))
+            for i in range(3):
+                self.app.get('/api/board/1/components/get?invite=-1', headers={'X-Profile': 's3cret'})
+            store = profiling.ProfileStore(directory)
+            assert store.endpoints() == ['get_components'] and len(store.files()) == 2
+            pegasus.app.config['PROFILER'] = 'cprofile'
+            rv = self.app.get('/api/board/1/components/get?invite=-1', headers={'X-Profile': 's3cret'})
+            path = os.path.join(directory, rv.headers['X-Profile'])
+            assert path.endswith('.pstats')
+            assert any(name == 'get_components' for (filename, line, name) in pstats.Stats(path).stats)
+        finally:
+            pegasus.app.config.update(PROFILE_TOKEN=None, PROFILE_DIR='/tmp/pegasus-profiles', PROFILE_KEEP=20, PROFILE_INTERVAL=0.005, PROFILER='sampling')
+        paths = []
+        for lines in (['a;b 2', 'a;c 1'], ['a;b 3']):
+            paths.append(os.path.join(directory, 'merge-%d.collapsed' % len(paths)))
+            with open(paths[-1], 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+        assert profiling.merge_collapsed(paths) == {'a;b': 5, 'a;c': 1}
+        assert profiling.merge_collapsed(paths, 'view') == {'view;a;b': 5, 'view;a;c': 1}
+        shutil.rmtree(directory)
+        print('[PROFILING]: OK')
+
+    def test_maintenance(self):
+        """
+        Maintenance:
+            a. Components deleted more than TOMBSTONE_GRACE ago are purged, the others are kept
+            b. Clients polling from before a purged deletion get the whole board again, flagged reset
+            c. Boards done more than ARCHIVE_AFTER ago are archived: their deleted components dropped, the rest still readable
+            d. Only one process runs each pass, and what they did shows up in /_maintenance and /metrics
+        """
+        from pegasus import maintenance
+        self.register('Scott', 'scott', 'tiger123', 'scott@tiger.org')
+        self.create('Open Board')
+        self.create('Finished Board')
+        ids = []
+        for board in ('1', '1', '1', '2', '2'):
+            rv = self.post_component(board, 'text %d' % len(ids), 'text', json.dumps({'top': 0, 'left': 0}))
+            ids.append(json.loads(rv.data.decode())['componentID'])
+        for cid, board in [(ids[0], '1'), (ids[1], '1'), (ids[3], '2')]:
+            self.app.post('/api/delete/board/%s/component/%d' % (board, cid), data = dict(invite = '-1'))
+        db = pegasus.connect_db()
+        oldRev = db.execute('select revision from board_content where id=?', [ids[0]]).fetchone()[0]
+        db.execute("update board_content set last_modified_at='2016-01-01 00:00:00' where id=?", [ids[0]]) # deleted long ago, unlike ids[1]
+        db.execute("update boards set done_at='2016-01-01 00:00:00' where id=2")
+        db.commit()
+        data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d' % (oldRev - 1)).data.decode())
+        assert data['reset'] is False and [c['id'] for c in data['messages']] == [ids[0], ids[1]]
+        result = pegasus.maintenance_pass(force=True)
+        assert result['archived'] == [2] and result['purged'] == {1: 1, 2: 1}
+        assert result['pages_freed'] is not None # new databases have incremental auto_vacuum
+        assert [row[0] for row in db.execute('select id from board_content order by id')] == [ids[1], ids[2], ids[4]]
+        assert db.execute('select purged_rev from boards where id=1').fetchone()[0] == oldRev
+        assert db.execute('select archived_at is not null from boards order by id').fetchall() == [(0,), (1,)]
+        data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d' % (oldRev - 1)).data.decode())
+        assert data['reset'] is True and sorted((c['id'], c['deleted']) for c in data['messages']) == [(ids[1], 'Y'), (ids[2], 'N')]
+        data = json.loads(self.app.get('/api/board/1/components/get?invite=-1&since_rev=%d' % data['revision']).data.decode())
+        assert data['reset'] is False and data['error'] == 'Nothing new.'
+        data = json.loads(self.app.get('/api/board/2/components/get?invite=-1&since_rev=0').data.decode())
+        assert [c['content'] for c in data['messages']] == ['text 4']
+        assert pegasus.maintenance_pass() is None # the last pass was just now
+        assert maintenance.claim(db, 0)
+        db.close()
+        pegasus.metrics_registry.reset()
+        worker = maintenance.MaintenanceWorker(lambda: pegasus.maintenance_pass(force=True), 600)
+        result = worker.run_once()
+        assert result['archived'] == [] and worker.last_pass['purged'] == {} and worker.passes == 1
+        failing = maintenance.MaintenanceWorker(lambda: 1 / 0, 600)
+        assert failing.run_once() is None and failing.errors == 1 and 'ZeroDivisionError' in failing.last_error['error']
+        status = json.loads(self.app.get('/_maintenance').data.decode())
+        assert status['running'] is True and status['interval'] == pegasus.app.config['MAINTENANCE_INTERVAL']
+        assert self.app.get('/_maintenance', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 404
+        text = self.app.get('/metrics').data.decode('utf-8')
+        assert 'pegasus_maintenance_passes_total{result="ok"} 1' in text and 'pegasus_maintenance_pass_seconds_count{step="purge"} 1' in text
+        print('[MAINTENANCE]: OK')
+
+    def test_query_plans(self):
+        """
+        Every hot query in views.py finds its rows through an index instead of scanning the whole table.
+        """
+        queries = [
+            ('select revision from boards where id=?', [1]),
+            ('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and revision > ? order by revision', [1, 0]),
+            ('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and last_modified_at > ? order by created_at', [1, '0']),
+            ('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? order by revision', [1]),
+            ('select revision, purged_rev from boards where id=?', [1]),
+            ('select done_at, revision, purged_rev, title from boards where id=?', [1]),
+            ('select b.done_at, b.revision, b.creatorID, u.email, i.type, b.purged_rev, b.title from boards b left join users u on u.id=? left join invites i on i.boardID=b.id and i.userEmail=u.email where b.id=?', [1, 1]),
+            ('select b.done_at, b.revision, b.creatorID, i.userEmail, i.type, b.purged_rev, b.title from boards b left join invites i on i.id=? and i.boardID=b.id where b.id=?', ['x', 1]),
+            ('select userEmail from invites where id=?', ['x']),
+            ('select id, title from boards where id in (select boardID from invites where userEmail=?)', ['scott@tiger.org']),
+            ('select id, title from boards where creatorID=?', [1]),
+            ('select userEmail, type from invites where boardID=? order by invite_date', [1]),
+            ('delete from invites where boardID=? and userEmail=?', [1, 'scott@tiger.org']),
+            ('delete from board_content where boardID=?', [1]), # what deleting a board cascades to
+            ('delete from invites where boardID=?', [1]),
+            ('select id from users where username=?', ['scott']),
+            ('select id from users where email=?', ['scott@tiger.org']),
+            ('select username, email from users where username=? or email=?', ['scott', 'scott@tiger.org']),
+            ('select id from boards where creatorID=? union select i.boardID from invites i join users u on u.email=i.userEmail where u.id=? order by 1', [1, 1]),
+            ('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and deleted=? order by revision', [1, 'N']),
+            ('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and type!=? order by revision', [1, 'chat']),
+            ('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and type=? order by id desc limit ?', [1, 'chat', 51]),
+            ('select id, content, userID, userEmail, created_at, last_modified_at, last_modified_by, type, position, deleted, revision from board_content where boardID=? and type=? and id<? order by id desc limit ?', [1, 'chat', 100, 51]),
+            ('select c.id, c.type, c.content, c.position, c.created_at, coalesce(u.username, c.userEmail) from board_content c left join users u on u.id=c.userID where c.boardID=? and c.deleted=? order by c.id', [1, 'N']),
+            # maintenance.py
+            ("select id, boardID, revision from board_content where deleted='Y' and last_modified_at < ? limit ?", ['2016-01-01 00:00:00', 500]),
+            ("select id, boardID, revision from board_content where boardID=? and deleted='Y' limit ?", [1, 500]),
+            ('select id from boards where archived_at is null and done_at < ? order by done_at', ['2016-01-01 00:00:00']),
+            ('select id from board_content where id=? and boardID=? and type=? and deleted=?', [1, 1, 'text', 'N']),
+            # bus.py
+            ('select seq, boardID, revision from board_changes where seq > ? order by seq', [1]),
+            ('select seq, boardID, userID, email from access_changes where seq > ? order by seq', [1]),
+            ('delete from access_changes where changed_at < ?', [0]),
+        ]
+        db = pegasus.connect_db()
+        for query, params in queries:
+            plan = db.execute('explain query plan ' + query, params).fetchall()
+            for row in plan:
+                assert not row[-1].startswith('SCAN'), query + ': ' + row[-1]
+        db.close()
+        print('[QUERY PLANS]: OK')
+
+    def test_migrations(self):
+        """
+        Schema migrations:
+            a. A new database is at the latest version
+            b. Upgrading an older database applies what's missing and keeps the data
+            c. A failing migration is rolled back and doesn't bump the version
+            d. Running schema.sql again starts over from version 0, without leftovers of the migrations
+        """
+        from pegasus import migrations
+        db = pegasus.connect_db()
+        assert migrations.current_version(db) == migrations.latest_version()
+        db.close()
+        fd, path = tempfile.mkstemp()
+        db = sqlite3.connect(path)
+        with pegasus.app.open_resource('schema.sql', mode='r') as f:
+            db.executescript(f.read()) # version 0, like a database created before migrations existed
+        db.execute("insert into users (username, password, email) values ('scott', 'x', 'scott@tiger.org')")
+        db.execute("insert into boards (title, creatorID, done_at) values ('Old Board', 1, '2100-01-01 00:00:00')")
+        db.execute("insert into board_content (boardID, content, type, userID, last_modified_at) values (1, 'hi', 'chat', 1, '2016-01-01 00:00:00')")
+        db.commit()
+        assert len(migrations.pending(db)) == len(migrations.MIGRATIONS)
+        assert migrations.upgrade(db) == [v for v, d, steps in migrations.MIGRATIONS]
+        assert db.execute("select name from sqlite_master where name='board_content_board_modified'").fetchone() is not None
+        assert db.execute("select username from users").fetchone()[0] == 'scott'
+        assert db.execute("select revision from boards").fetchone()[0] == db.execute("select revision from board_content").fetchone()[0]
+        db.execute("update boards set revision = revision + 1")
+        db.commit()
+        with pegasus.app.open_resource('schema.sql', mode='r') as f:
+            db.executescript(f.read()) # starting over drops what the migrations added too
+        assert db.execute("select name from sqlite_master where name in ('board_changes', 'access_changes', 'maintenance')").fetchall() == []
+        assert migrations.upgrade(db) == [v for v, d, steps in migrations.MIGRATIONS]
+        assert db.execute("select count(*) from board_changes").fetchone()[0] == 0
+        version = migrations.current_version(db)
+        migrations.MIGRATIONS.append((version + 1, 'broken', ['create table broken (id integer)', 'insert into nowhere values (1)']))
+        try:
+            migrations.upgrade(db)
+            assert False, 'should have failed'
+        except migrations.MigrationError:
+            pass
+        finally:
+            migrations.MIGRATIONS.pop()
+        assert migrations.current_version(db) == version
+        assert db.execute("select name from sqlite_master where name='broken'").fetchone() is None
+        db.close()
+        os.close(fd)
+        os.unlink(path)
+        print('[MIGRATIONS]: OK')
+
+    def test_entry_points(self):
+        """
+        Entry points:
+            a. The scripts can be imported without starting anything (worker processes of the pools import the main script again)
+            b. The gunicorn settings come from the command line, with the metrics clean up hook
+        """
+        import importlib
+        import sys
+        argv = sys.argv
+        sys.argv = ['nothing-to-parse', '--no-such-option']
+        try:
+            for name in ('run_pegasus', 'profile_pegasus', 'dump_boards', 'bench_pegasus'):
+                assert callable(importlib.import_module(name).main)
+        finally:
+            sys.argv = argv
+        import run_pegasus
+        options = run_pegasus.production_options(run_pegasus.parser.parse_args(['--production', '--workers', '3', '--max-requests', '100']))
+        assert options['bind'] == '127.0.0.1:5000' and options['workers'] == 3 and options['max_requests_jitter'] == 10
+        assert options['child_exit'] is run_pegasus.child_exit
+        print('[ENTRY POINTS]: OK')
+
 
 
 